@@ -1,15 +1,19 @@
+import datetime
 from typing import Optional, List, Dict, Any
-from . import crud, schemas, models
+from . import crud, intents, schemas, models, thumbnails
 from sqlalchemy.orm import Session
+from .cart import NotInCartError, carts
 
 def process_message(message: str, order_id: Optional[int], db: Session):
     message = message.lower().strip()
     
     # No current order context
     if not order_id:
-        if "order food" in message or "place order" in message or "new order" in message:
+        # The welcome options' values are matched exactly, free text goes through the classifier
+        intent = intents.classify(message)
+        if message == "order_food" or intent == "new_order":
             # Get restaurants to suggest
-            restaurants = crud.get_restaurants(db, limit=10)
+            restaurants = crud.list_restaurants(db, limit=10)
             return {
                 "type": "restaurant_selection",
                 "content": "Great! Let's start a new order. Please select a restaurant:",
@@ -18,11 +22,12 @@ def process_message(message: str, order_id: Optional[int], db: Session):
                         "id": r.id,
                         "name": r.name,
                         "address": r.address,
-                        "image_url": r.image_url
+                        "image_url": r.image_url,
+                        "thumbnails": thumbnails.urls(r.image_hash)
                     } for r in restaurants
                 ]
             }
-        elif "manage order" in message or "check order" in message or "track order" in message:
+        elif message == "manage_order" or intent == "track_order":
             return {
                 "type": "order_lookup",
                 "content": "Please provide your order ID to check your order status."
@@ -64,7 +69,7 @@ def handle_restaurant_selection(restaurant_id: int, db: Session):
         return {"type": "error", "content": "Restaurant not found. Please select another restaurant."}
     
     # Get menu items for the selected restaurant
-    menu_items = crud.get_menu_items_by_restaurant(db, restaurant_id)
+    menu_items = crud.list_menu_items(db, restaurant_id)
     
     # Group menu items by category
     categorized_menu = {}
@@ -76,7 +81,8 @@ def handle_restaurant_selection(restaurant_id: int, db: Session):
             "name": item.name,
             "description": item.description,
             "price": float(item.price),
-            "image_url": item.image_url
+            "image_url": item.image_url,
+            "thumbnails": thumbnails.urls(item.image_hash)
         })
     
     return {
@@ -93,40 +99,61 @@ def handle_restaurant_selection(restaurant_id: int, db: Session):
         ]
     }
 
-def handle_menu_item_selection(item_id: int, quantity: int, cart_items: List[Dict], db: Session):
-    """Handle when a user adds an item to their cart"""
+def handle_menu_item_selection(user_id: int, item_id: int, quantity: int, db: Session):
+    """Handle when a user adds an item to (or, with a negative quantity, removes it from) their cart.
+
+    The cart lives on the server, so only the changed item and the new totals
+    are returned; clients patch their copy with the delta. When the item comes
+    from another restaurant the cart is replaced instead: ``cart_reset`` is set
+    and ``cart_items`` carries the new cart, which clients use as their copy.
+    """
     menu_item = crud.get_menu_item(db, item_id)
     if not menu_item:
         return {"type": "error", "content": "Menu item not found."}
-    
-    # Check if item already in cart
-    for item in cart_items:
-        if item["menu_item_id"] == item_id:
-            item["quantity"] += quantity
-            break
+
+    try:
+        update = carts.add(
+            user_id, menu_item.restaurant_id, item_id, menu_item.name, float(menu_item.price), quantity
+        )
+    except NotInCartError:
+        return {"type": "error", "content": f"{menu_item.name} is not in your cart."}
+    if update["cart_reset"]:
+        content = f"Your cart had items from another restaurant, so it was emptied. Added {quantity} {menu_item.name}(s)."
+    elif quantity >= 0:
+        content = f"Added {quantity} {menu_item.name}(s) to your cart."
     else:
-        # Add new item to cart
-        cart_items.append({
-            "menu_item_id": item_id,
-            "name": menu_item.name,
-            "price": float(menu_item.price),
-            "quantity": quantity
-        })
-    
-    # Calculate cart total
-    cart_total = sum(item["price"] * item["quantity"] for item in cart_items)
-    
+        content = f"Removed {-quantity} {menu_item.name}(s) from your cart."
+
     return {
         "type": "cart_update",
-        "content": f"Added {quantity} {menu_item.name}(s) to your cart.",
-        "cart_items": cart_items,
-        "cart_total": cart_total
+        "content": content,
+        **update
+    }
+
+def get_cart(user_id: int):
+    """Full contents of a user's server-side cart"""
+    cart = carts.get(user_id)
+    return {
+        "type": "cart",
+        "content": "Your cart is empty." if cart is None or not cart.items else "Here is your cart:",
+        "restaurant_id": cart.restaurant_id if cart else None,
+        "cart_items": cart.to_items() if cart else [],
+        "cart_total": round(cart.total, 2) if cart else 0.0,
+        "item_count": cart.count if cart else 0,
     }
 
-def handle_checkout(user_id: int, restaurant_id: int, cart_items: List[Dict], 
+def handle_checkout(user_id: int, restaurant_id: int, cart_items: Optional[List[Dict]],
                    delivery_address: str, payment_method: str, db: Session):
     """Process the checkout and create an order"""
-    
+    # Without explicit items, check out the user's server-side cart
+    from_cart = cart_items is None
+    if from_cart:
+        cart = carts.get(user_id)
+        if cart is None or not cart.items:
+            return {"type": "error", "content": "Your cart is empty."}
+        restaurant_id = cart.restaurant_id
+        cart_items = cart.to_items()
+
     # Convert cart items to order items format
     order_items = []
     for item in cart_items:
@@ -153,10 +180,12 @@ def handle_checkout(user_id: int, restaurant_id: int, cart_items: List[Dict],
         # Create payment record
         payment = crud.create_payment(db, schemas.PaymentCreate(
             order_id=order.id,
-            amount=float(order.total_amount),
+            amount=float(order.total),
             method=payment_method,
             transaction_id=f"TR-{order.id}-{int(datetime.datetime.now().timestamp())}"
         ))
+        if from_cart:
+            carts.pop(user_id)
         
         return {
             "type": "order_confirmation",
@@ -225,10 +254,18 @@ def handle_order_update(order_id: int, update_type: str, update_value: str, db:
     
     if order.status not in ["pending", "confirmed"]:
         return {"type": "error", "content": "Sorry, this order cannot be modified anymore."}
+    # The status checked above must still hold when the update is written
+    version = order.version
     
+    try:
+        return _apply_order_update(db, order_id, update_type, update_value, version)
+    except crud.ConcurrentUpdateError:
+        return {"type": "error", "content": "This order was just updated. Please check its status and try again."}
+
+def _apply_order_update(db: Session, order_id: int, update_type: str, update_value: str, version: int):
     if update_type == "address":
         # Update delivery address
-        order_update = schemas.OrderUpdate(delivery_address=update_value)
+        order_update = schemas.OrderUpdate(delivery_address=update_value, version=version)
         crud.update_order(db, order_id, order_update)
         return {
             "type": "update_confirmation",
@@ -237,7 +274,7 @@ def handle_order_update(order_id: int, update_type: str, update_value: str, db:
     
     elif update_type == "instructions":
         # Update special instructions
-        order_update = schemas.OrderUpdate(special_instructions=update_value)
+        order_update = schemas.OrderUpdate(special_instructions=update_value, version=version)
         crud.update_order(db, order_id, order_update)
         return {
             "type": "update_confirmation",
@@ -246,7 +283,7 @@ def handle_order_update(order_id: int, update_type: str, update_value: str, db:
     
     elif update_type == "cancel":
         # Cancel order
-        order_update = schemas.OrderUpdate(status="cancelled")
+        order_update = schemas.OrderUpdate(status="cancelled", version=version)
         crud.update_order(db, order_id, order_update)
         return {
             "type": "update_confirmation",
@@ -0,0 +1,32 @@
+"""add partial index for the per-restaurant active order queue
+
+Revision ID: add_active_order_queue_index
+Revises: partition_orders_by_created_at
+Create Date: 2024-06-10 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_active_order_queue_index'
+down_revision = 'partition_orders_by_created_at'
+branch_labels = None
+depends_on = None
+
+ACTIVE_ORDERS_PREDICATE = "status IN ('pending', 'confirmed', 'preparing')"
+
+
+def upgrade():
+    # Only in-progress orders are indexed, so the index stays small however many
+    # orders have been delivered or cancelled
+    op.create_index(
+        'ix_orders_active_queue', 'orders', ['restaurant_id', 'status'],
+        postgresql_where=sa.text(ACTIVE_ORDERS_PREDICATE),
+        sqlite_where=sa.text(ACTIVE_ORDERS_PREDICATE),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_orders_active_queue', table_name='orders')
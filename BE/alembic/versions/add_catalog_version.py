@@ -0,0 +1,31 @@
+"""add the shared catalog version behind the catalog ETags
+
+Revision ID: add_catalog_version
+Revises: add_image_url_to_menu_items
+Create Date: 2024-07-15 10:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_catalog_version'
+down_revision = 'add_image_url_to_menu_items'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table = op.create_table(
+        'catalog_version',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.bulk_insert(table, [{'id': 1, 'version': 1, 'updated_at': datetime.utcnow()}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
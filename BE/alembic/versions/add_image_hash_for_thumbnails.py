@@ -0,0 +1,27 @@
+"""add image_hash to restaurants and menu_items for generated thumbnails
+
+Revision ID: add_image_hash_for_thumbnails
+Revises: add_active_order_queue_index
+Create Date: 2024-06-24 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_hash_for_thumbnails'
+down_revision = 'add_active_order_queue_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Content hash naming the thumbnail files; NULL until thumbnails.build runs
+    op.add_column('restaurants', sa.Column('image_hash', sa.String(), nullable=True))
+    op.add_column('menu_items', sa.Column('image_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('menu_items', 'image_hash')
+    op.drop_column('restaurants', 'image_hash')
@@ -0,0 +1,27 @@
+"""add delivery address and special instructions to orders
+
+Revision ID: add_order_delivery_details
+Revises: add_order_payment_versions
+Create Date: 2024-07-29 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_delivery_details'
+down_revision = 'add_order_payment_versions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Written by crud.update_order in the same versioned UPDATE as the status
+    op.add_column('orders', sa.Column('delivery_address', sa.String(), nullable=True))
+    op.add_column('orders', sa.Column('special_instructions', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('orders', 'special_instructions')
+    op.drop_column('orders', 'delivery_address')
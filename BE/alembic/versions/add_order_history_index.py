@@ -0,0 +1,40 @@
+"""add item_count and order history index to orders
+
+Revision ID: add_order_history_index
+Revises: add_catalog_version
+Create Date: 2024-04-02 10:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_history_index'
+down_revision = 'add_catalog_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Pre-aggregated item count, so history pages never read order_items
+    op.add_column('orders', sa.Column('item_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE orders SET item_count = COALESCE("
+        "(SELECT SUM(quantity) FROM order_items WHERE order_items.order_id = orders.id), 0)"
+    )
+    # The history is keyed on created_at: legacy rows without one sort as the oldest
+    op.get_bind().execute(sa.text("UPDATE orders SET created_at = :epoch WHERE created_at IS NULL"),
+                          {"epoch": datetime(1970, 1, 1)})
+    with op.batch_alter_table('orders') as batch:
+        batch.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+    # Keyset pagination of a user's order history
+    op.create_index('ix_orders_user_id_created_at_id', 'orders', ['user_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_orders_user_id_created_at_id', table_name='orders')
+    with op.batch_alter_table('orders') as batch:
+        batch.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+    op.drop_column('orders', 'item_count')
@@ -0,0 +1,27 @@
+"""add version columns for optimistic concurrency on orders and payments
+
+Revision ID: add_order_payment_versions
+Revises: add_pending_expiry_indexes
+Create Date: 2024-07-08 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_payment_versions'
+down_revision = 'add_pending_expiry_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant server default, so existing rows start at version 1 without a rewrite
+    op.add_column('orders', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('payments', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('payments', 'version')
+    op.drop_column('orders', 'version')
@@ -0,0 +1,36 @@
+"""add partial indexes for the expiry of abandoned orders and payments
+
+Revision ID: add_pending_expiry_indexes
+Revises: add_restaurant_order_shard
+Create Date: 2024-07-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_pending_expiry_indexes'
+down_revision = 'add_restaurant_order_shard'
+branch_labels = None
+depends_on = None
+
+PENDING = "status = 'pending'"
+
+
+def upgrade():
+    # Only pending rows are indexed, so the sweep finds the oldest ones without
+    # scanning the order history
+    op.create_index(
+        'ix_orders_pending_created_at', 'orders', ['created_at'],
+        postgresql_where=sa.text(PENDING), sqlite_where=sa.text(PENDING),
+    )
+    op.create_index(
+        'ix_payments_pending_payment_date', 'payments', ['payment_date'],
+        postgresql_where=sa.text(PENDING), sqlite_where=sa.text(PENDING),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_payments_pending_payment_date', table_name='payments')
+    op.drop_index('ix_orders_pending_created_at', table_name='orders')
@@ -0,0 +1,25 @@
+"""add order_shard to restaurants
+
+Revision ID: add_restaurant_order_shard
+Revises: add_image_hash_for_thumbnails
+Create Date: 2024-08-02 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_restaurant_order_shard'
+down_revision = 'add_image_hash_for_thumbnails'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Order shard a restaurant was assigned on first use; NULL until then, or without shards
+    op.add_column('restaurants', sa.Column('order_shard', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('restaurants', 'order_shard')
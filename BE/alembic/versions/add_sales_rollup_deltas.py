@@ -0,0 +1,52 @@
+"""add sales delta tables, folded into the rollups in the background
+
+Revision ID: add_sales_rollup_deltas
+Revises: add_sales_rollups
+Create Date: 2024-07-22 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_sales_rollup_deltas'
+down_revision = 'add_sales_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Appended by checkouts, folded into the *_sales_rollups tables by rollups.fold
+    op.create_table(
+        'restaurant_sales_deltas',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False),
+        sa.Column('granularity', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('order_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('paid_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cancelled_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Float(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_restaurant_sales_deltas_bucket', 'restaurant_sales_deltas',
+                    ['restaurant_id', 'granularity', 'bucket_start'])
+    op.create_table(
+        'item_sales_deltas',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('restaurant_id', sa.Integer(), nullable=False),
+        sa.Column('granularity', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('menu_item_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Float(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_item_sales_deltas_bucket', 'item_sales_deltas',
+                    ['restaurant_id', 'granularity', 'bucket_start'])
+
+
+def downgrade():
+    op.drop_index('ix_item_sales_deltas_bucket', table_name='item_sales_deltas')
+    op.drop_table('item_sales_deltas')
+    op.drop_index('ix_restaurant_sales_deltas_bucket', table_name='restaurant_sales_deltas')
+    op.drop_table('restaurant_sales_deltas')
@@ -0,0 +1,44 @@
+"""add sales rollup tables
+
+Revision ID: add_sales_rollups
+Revises: add_order_history_index
+Create Date: 2024-04-09 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_sales_rollups'
+down_revision = 'add_order_history_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Per restaurant and hour/day bucket; fill with `python -m BE.scripts.backfill_rollups`
+    op.create_table(
+        'restaurant_sales_rollups',
+        sa.Column('restaurant_id', sa.Integer(), primary_key=True),
+        sa.Column('granularity', sa.String(), primary_key=True),
+        sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+        sa.Column('order_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('paid_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cancelled_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Float(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'item_sales_rollups',
+        sa.Column('restaurant_id', sa.Integer(), primary_key=True),
+        sa.Column('granularity', sa.String(), primary_key=True),
+        sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+        sa.Column('menu_item_id', sa.Integer(), primary_key=True),
+        sa.Column('quantity', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Float(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_table('item_sales_rollups')
+    op.drop_table('restaurant_sales_rollups')
@@ -0,0 +1,125 @@
+"""partition orders, order_items, payments and deliveries by order creation time
+
+Revision ID: partition_orders_by_created_at
+Revises: add_sales_rollup_deltas
+Create Date: 2024-04-23 10:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'partition_orders_by_created_at'
+down_revision = 'add_sales_rollup_deltas'
+branch_labels = None
+depends_on = None
+
+# table -> partition key. Child tables are partitioned on a copy of their
+# order's created_at so all four tables share the same monthly boundaries.
+PARTITION_KEYS = {
+    'orders': 'created_at',
+    'order_items': 'order_created_at',
+    'payments': 'order_created_at',
+    'deliveries': 'order_created_at',
+}
+CHILD_TABLES = ('order_items', 'payments', 'deliveries')
+
+# Months created ahead of now, keep in sync with PARTITION_MONTHS_AHEAD in config.py
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    month_index = month.year * 12 + month.month - 1 + count
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # All databases: child rows get a copy of the order's created_at
+    bind.execute(sa.text("UPDATE orders SET created_at = :epoch WHERE created_at IS NULL"),
+                 {"epoch": datetime(1970, 1, 1)})
+    for table in CHILD_TABLES:
+        op.add_column(table, sa.Column('order_created_at', sa.DateTime(), nullable=True))
+        op.execute(
+            f"UPDATE {table} SET order_created_at = "
+            f"(SELECT created_at FROM orders WHERE orders.id = {table}.order_id)"
+        )
+
+    # Declarative partitioning is Postgres only, other databases stop here
+    if bind.dialect.name != 'postgresql':
+        return
+
+    first = bind.execute(sa.text(
+        "SELECT min(created_at) FROM orders WHERE created_at > :epoch"
+    ), {"epoch": datetime(1970, 1, 1)}).scalar() or datetime.utcnow()
+    first_month = datetime(first.year, first.month, 1)
+    now = datetime.utcnow()
+    last_month = _add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+
+    for table, key in PARTITION_KEYS.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        # Keep the id sequence when the old table is dropped
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({key})"
+        )
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL")
+        month = first_month
+        while month <= last_month:
+            following = _add_months(month, 1)
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+            )
+            month = following
+        # Catches rows outside the monthly partitions, e.g. backfilled epoch dates
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned")
+
+    for table in (*CHILD_TABLES, 'orders'):
+        op.execute(f"DROP TABLE {table}_unpartitioned")
+
+    for table, key in PARTITION_KEYS.items():
+        op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {key})")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    op.create_index('ix_orders_user_id_created_at_id', 'orders', ['user_id', 'created_at', 'id'])
+    op.create_foreign_key(None, 'orders', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key(None, 'orders', 'restaurants', ['restaurant_id'], ['id'], ondelete='SET NULL')
+    op.create_foreign_key(None, 'order_items', 'menu_items', ['menu_item_id'], ['id'], ondelete='SET NULL')
+    for table in CHILD_TABLES:
+        op.create_index(f'ix_{table}_order_id_order_created_at', table, ['order_id', 'order_created_at'])
+        op.create_foreign_key(
+            None, table, 'orders', ['order_id', 'order_created_at'], ['id', 'created_at'], ondelete='CASCADE'
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for table, key in PARTITION_KEYS.items():
+            op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+            op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+            op.execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)")
+            op.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+        # Partitions of the dropped tables go with them
+        for table in (*CHILD_TABLES, 'orders'):
+            op.execute(f"DROP TABLE {table}_partitioned")
+
+        for table in PARTITION_KEYS:
+            op.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+            op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.create_index('ix_orders_user_id_created_at_id', 'orders', ['user_id', 'created_at', 'id'])
+        op.create_foreign_key(None, 'orders', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+        op.create_foreign_key(None, 'orders', 'restaurants', ['restaurant_id'], ['id'], ondelete='SET NULL')
+        op.create_foreign_key(None, 'order_items', 'menu_items', ['menu_item_id'], ['id'], ondelete='SET NULL')
+        for table in CHILD_TABLES:
+            op.create_index(f'ix_{table}_id', table, ['id'])
+            op.create_foreign_key(None, table, 'orders', ['order_id'], ['id'], ondelete='CASCADE')
+
+    for table in CHILD_TABLES:
+        op.drop_column(table, 'order_created_at')
@@ -0,0 +1,52 @@
+# BE/analytics.py
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from .database import get_db
+from . import rollups
+
+router = APIRouter(prefix="/restaurants/{restaurant_id}/analytics", tags=["analytics"])
+
+# Default windows when no start is given
+DEFAULT_WINDOWS = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+
+
+def _window(granularity: str, start: Optional[datetime], end: Optional[datetime]):
+    end = end or datetime.utcnow()
+    start = start or end - DEFAULT_WINDOWS[granularity]
+    return start, end
+
+
+@router.get("/sales")
+def read_sales(
+    restaurant_id: int,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    """Orders, payments, cancellations and revenue per hour or day"""
+    start, end = _window(granularity, start, end)
+    return {
+        "restaurant_id": restaurant_id,
+        "granularity": granularity,
+        "buckets": rollups.sales(db, restaurant_id, granularity, start, end),
+    }
+
+
+@router.get("/top-items")
+def read_top_items(
+    restaurant_id: int,
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """Best selling menu items over the period"""
+    start, end = _window(granularity, start, end)
+    return {
+        "restaurant_id": restaurant_id,
+        "items": rollups.top_items(db, restaurant_id, granularity, start, end, limit),
+    }
@@ -0,0 +1,37 @@
+# BE/benchmarks/bench_intents.py
+"""Time the chat intent classifier and check it against the held-out examples.
+
+Run from the repo root:  python -m BE.benchmarks.bench_intents
+Reports microseconds per message for repeated turns (features cached), new
+turns, and batches of new turns, plus the held-out accuracy.
+"""
+import os
+import timeit
+
+from BE import intents
+from BE.config import INTENT_MODEL_DIR
+from BE.scripts.train_intents import evaluate, load_examples
+
+
+def per_message(label: str, fn, messages: int, number: int = 5):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<28} {seconds / messages * 1e6:8.2f} us/message")
+
+
+def main():
+    model = intents.model()
+    _, holdout = load_examples(os.path.join(INTENT_MODEL_DIR, "labeled.tsv"))
+    accuracy, _, _ = evaluate(model, holdout)
+    print(f"Held-out accuracy: {accuracy:.1%} on {len(holdout)} examples")
+
+    texts = [text for text, _ in holdout]
+    fresh = iter(range(10 ** 9))
+    print("Classifying:")
+    per_message("repeated turn", lambda: [model.predict(t) for t in texts], len(texts))
+    # A new number makes every message unseen, so its features are computed again
+    per_message("new turn", lambda: [model.predict(f"{t} {next(fresh)}") for t in texts], len(texts))
+    per_message("new turns, batch", lambda: model.predict_batch([f"{t} {next(fresh)}" for t in texts]), len(texts))
+
+
+if __name__ == "__main__":
+    main()
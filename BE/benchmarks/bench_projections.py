@@ -0,0 +1,110 @@
+# BE/benchmarks/bench_projections.py
+"""Compare loading a menu as ORM entities with the column projection in crud.
+
+Run from the repo root:  python -m BE.benchmarks.bench_projections [rows]
+Uses a throwaway in-memory SQLite database seeded with one restaurant and
+``rows`` menu items (10,000 by default). Reports time per load, and time plus
+peak Python memory for the full listing path (load + serialize), i.e. what
+read_menu_items does for an uncached menu.
+"""
+import json
+import sys
+import timeit
+import tracemalloc
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from BE import models
+from BE.crud import MENU_ITEM_LIST_COLUMNS
+from BE.serialization import MenuItemListAdapter, menu_items_payload, render
+
+
+def seed(rows: int):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        restaurant = models.Restaurant(id=1, name="Spice Route", address="1 Main St", cuisine="Indian")
+        db.add(restaurant)
+        db.flush()
+        db.execute(
+            models.MenuItem.__table__.insert(),
+            [
+                {
+                    "id": i, "restaurant_id": 1, "name": f"Dish {i}", "price": 9.5 + i % 20,
+                    "description": "Slow-cooked with house spices and served with rice",
+                    "category": ("Starters", "Mains", "Desserts")[i % 3],
+                    "image_url": f"https://cdn.example.com/menu/{i}.jpg",
+                }
+                for i in range(1, rows + 1)
+            ],
+        )
+        db.commit()
+    return Session
+
+
+def orm_entities_in(db):
+    # What get_menu_items_by_restaurant does: full entities in the identity map
+    return db.query(models.MenuItem).filter(models.MenuItem.restaurant_id == 1).all()
+
+
+def projection_in(db):
+    # What crud.list_menu_items does: the listed columns as plain rows
+    return db.execute(
+        select(*MENU_ITEM_LIST_COLUMNS).where(models.MenuItem.restaurant_id == 1).order_by(models.MenuItem.id)
+    ).all()
+
+
+def orm_entities(Session):
+    with Session() as db:
+        return orm_entities_in(db)
+
+
+def projection(Session):
+    with Session() as db:
+        return projection_in(db)
+
+
+def orm_listing(Session) -> bytes:
+    # read_menu_items before: entities validated and dumped by the adapter
+    with Session() as db:
+        return render(MenuItemListAdapter, orm_entities_in(db))
+
+
+def projection_listing(Session) -> bytes:
+    # read_menu_items now: rows shaped into dicts, dumped without validation
+    with Session() as db:
+        return render(MenuItemListAdapter, menu_items_payload(projection_in(db)), trusted=True)
+
+
+def measure(label: str, fn, number: int):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<24} {seconds * 1000:8.2f} ms  {peak / 1024 / 1024:8.2f} MiB peak")
+    return seconds, peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    Session = seed(rows)
+    assert len(orm_entities(Session)) == len(projection(Session)) == rows
+
+    print(f"Loading a {rows}-item menu:")
+    orm_t, orm_m = measure("ORM entities", lambda: orm_entities(Session), 3)
+    proj_t, proj_m = measure("column projection", lambda: projection(Session), 3)
+    print(f"  speedup: {orm_t / proj_t:.1f}x, memory: {orm_m / proj_m:.1f}x less")
+
+    print("\nLoad + serialize (read_menu_items, uncached):")
+    # Same response body either way
+    assert json.loads(orm_listing(Session)) == json.loads(projection_listing(Session))
+    orm_t, orm_m = measure("ORM entities + adapter", lambda: orm_listing(Session), 3)
+    proj_t, proj_m = measure("projection + payload", lambda: projection_listing(Session), 3)
+    print(f"  speedup: {orm_t / proj_t:.1f}x, memory: {orm_m / proj_m:.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# BE/benchmarks/bench_serialization.py
+"""Compare the default FastAPI encode path with the adapter/orjson fast path.
+
+Run from the repo root:  python -m BE.benchmarks.bench_serialization [rows]
+No database is needed; rows are synthetic attribute objects shaped like the ORM.
+"""
+import json
+import sys
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+
+from BE import schemas
+from BE.serialization import MenuItemListAdapter, OrderListAdapter, dumps
+
+
+def make_menu(n: int):
+    return [
+        SimpleNamespace(
+            id=i, restaurant_id=1, name=f"Dish {i}", price=9.5 + i % 20,
+            description="Slow-cooked with house spices and served with rice " * 2,
+            category=("Starters", "Mains", "Desserts")[i % 3],
+            image_url=f"https://cdn.example.com/menu/{i}.jpg",
+        )
+        for i in range(n)
+    ]
+
+
+def make_orders(n: int):
+    return [
+        {
+            "id": i, "user_id": i % 50, "restaurant_id": 1, "total_amount": 24.0,
+            "status": "pending", "order_date": datetime(2024, 3, 19, 12, 0),
+            "items": [
+                {"item_id": j, "name": f"Dish {j}", "quantity": 1, "price": 8.0,
+                 "total": 8.0, "restaurant": "Spice Route"}
+                for j in range(3)
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def fastapi_default(model, rows) -> bytes:
+    # What a response_model endpoint does today: validate, dump, jsonable_encoder, json.dumps
+    validated = [model.model_validate(r, from_attributes=True) for r in rows]
+    content = jsonable_encoder([v.model_dump() for v in validated])
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def adapter_path(adapter, rows) -> bytes:
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def report(label: str, fn, number: int):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<28} {seconds * 1000:8.2f} ms")
+    return seconds
+
+
+def main(rows: int = 5000):
+    number = 10
+    menu = make_menu(rows)
+    menu_dicts = [vars(m) for m in menu]
+    orders = make_orders(rows)
+
+    print(f"Menu list, {rows} items")
+    base = report("response_model + json", lambda: fastapi_default(schemas.MenuItem, menu), number)
+    fast = report("TypeAdapter.dump_json", lambda: adapter_path(MenuItemListAdapter, menu), number)
+    trusted = report("trusted dicts + orjson", lambda: dumps(menu_dicts), number)
+    print(f"  speedup: {base / fast:.1f}x validated, {base / trusted:.1f}x trusted")
+
+    print(f"Order list, {rows} orders x 3 items")
+    base = report("response_model + json", lambda: fastapi_default(schemas.Order, orders), number)
+    fast = report("TypeAdapter.dump_json", lambda: adapter_path(OrderListAdapter, orders), number)
+    trusted = report("trusted dicts + orjson", lambda: dumps(orders), number)
+    print(f"  speedup: {base / fast:.1f}x validated, {base / trusted:.1f}x trusted")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
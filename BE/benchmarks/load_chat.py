@@ -0,0 +1,199 @@
+# BE/benchmarks/load_chat.py
+"""Replay full chat ordering conversations against a running server.
+
+Each virtual user loops through the /chat flow
+new order -> restaurant -> menu item -> pay now -> track,
+sending the conversation so far with every message like the frontend does.
+Users are started gradually over --ramp seconds and keep going until
+--duration is up; latency is reported per state transition.
+
+Start a server against a disposable database (the rate limiter would throttle
+a single user sending several messages a second), seed it, then run:
+
+    RATE_LIMIT_ENABLED=false uvicorn BE.main:app --workers 4
+    python -m BE.benchmarks.load_chat --seed --users 50 --ramp 10 --duration 60
+
+The client side only needs the standard library: one thread and one
+keep-alive connection per virtual user.
+"""
+import argparse
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+# (transition name, message to send, state the reply should be in)
+FLOW = (
+    ("new_order", "new order", "selecting_restaurant"),
+    ("restaurant", None, "selecting_menu_item"),
+    ("menu_item", None, "awaiting_payment"),
+    ("payment", "1", "payment_initiated"),
+    ("track", "2", "tracking"),
+)
+
+_NUMBERED = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+def seed(restaurants: int, items: int):
+    """Insert a user and ``restaurants`` x ``items`` menu items unless they exist."""
+    from BE import models
+    from BE.database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        # chat_with_bot places every order for user 1
+        if db.get(models.User, 1) is None:
+            db.add(models.User(id=1, username="loadtest", email="loadtest@example.com", hashed_password="x"))
+        existing = db.query(models.Restaurant).count()
+        for r in range(existing, restaurants):
+            restaurant = models.Restaurant(name=f"Load Test Kitchen {r + 1}", address=f"{r + 1} Bench St", cuisine="Mixed")
+            restaurant.menu_items = [
+                models.MenuItem(
+                    name=f"Dish {i + 1}", description="Seeded for load testing",
+                    price=5 + (i % 10), category=("Starters", "Mains", "Desserts")[i % 3],
+                )
+                for i in range(items)
+            ]
+            db.add(restaurant)
+        db.commit()
+        print(f"Seeded {max(restaurants - existing, 0)} restaurants with {items} items each")
+    finally:
+        db.close()
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.conversations = 0
+
+    def record(self, name: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def finish_conversation(self):
+        with self._lock:
+            self.conversations += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, number: int, base_url: str, stats: Stats, deadline: float, think_time: float):
+        super().__init__(daemon=True)
+        self.user_id = f"load-{number}"
+        self.stats = stats
+        self.deadline = deadline
+        self.think_time = think_time
+        url = urlsplit(base_url)
+        conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        # One keep-alive connection per user, like a browser tab
+        self.conn = conn_class(url.hostname, url.port, timeout=60)
+        self.rng = random.Random(number)
+
+    def send(self, messages: List[dict], order_id: Optional[int]) -> dict:
+        body = json.dumps({"messages": messages, "order_id": order_id, "user_id": self.user_id})
+        try:
+            self.conn.request("POST", "/chat", body, {"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()  # reconnects on the next request
+            return {}
+        if response.status != 200:
+            return {}
+        return json.loads(data)
+
+    def conversation(self):
+        messages: List[dict] = []
+        order_id = None
+        reply: dict = {}
+        for name, text, expected_state in FLOW:
+            if text is None:
+                # Pick one of the numbered options (restaurants, then dishes) from the last reply
+                options = _NUMBERED.findall(reply.get("response", ""))
+                if not options:
+                    self.stats.record(name, 0.0, False)
+                    return
+                text = self.rng.choice(options)
+            messages.append({"role": "user", "content": text})
+            started = time.perf_counter()
+            reply = self.send(messages, order_id)
+            elapsed = time.perf_counter() - started
+            ok = reply.get("state") == expected_state
+            self.stats.record(name, elapsed, ok)
+            if not ok:
+                return
+            messages.append({"role": "assistant", "content": reply["response"]})
+            order_id = reply.get("order_id", order_id)
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        self.stats.finish_conversation()
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            self.conversation()
+        self.conn.close()
+
+
+def report(stats: Stats, elapsed: float):
+    elapsed = max(elapsed, 1e-9)
+    requests = sum(len(v) for v in stats.latencies.values())
+    print(f"\n{requests} requests, {stats.conversations} completed conversations in {elapsed:.1f} s")
+    print(f"throughput: {requests / elapsed:.1f} req/s, {stats.conversations / elapsed:.2f} conversations/s\n")
+    print(f"  {'transition':<12} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, _, _ in FLOW:
+        values = sorted(stats.latencies.get(name, []))
+        print(
+            f"  {name:<12} {len(values):>7} {stats.errors.get(name, 0):>7} "
+            f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f} "
+            f"{percentile(values, 99) * 1000:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users at full load")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds over which users are started")
+    parser.add_argument("--duration", type=float, default=60.0, help="total run time in seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between messages in seconds")
+    parser.add_argument("--seed", action="store_true", help="seed the database at DATABASE_URL first")
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--items", type=int, default=30, help="menu items per seeded restaurant")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.restaurants, args.items)
+
+    stats = Stats()
+    started = time.monotonic()
+    deadline = started + args.duration
+    users = []
+    for number in range(args.users):
+        user = VirtualUser(number, args.url, stats, deadline, args.think_time)
+        user.start()
+        users.append(user)
+        if number < args.users - 1:
+            time.sleep(args.ramp / (args.users - 1))
+    for user in users:
+        user.join()
+    report(stats, time.monotonic() - started)
+
+
+if __name__ == "__main__":
+    main()
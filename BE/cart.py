@@ -0,0 +1,129 @@
+# BE/cart.py
+import threading
+import time
+from typing import Dict, List, Optional
+from BE import metrics
+from BE.config import CART_TTL_SECONDS
+
+metrics.describe("cart_updates_total", "Cart item additions and removals")
+metrics.describe("cart_expired_total", "Carts dropped after sitting idle past CART_TTL_SECONDS")
+
+
+class NotInCartError(ValueError):
+    pass
+
+
+class Cart:
+    """One user's cart: ``menu_item_id -> [quantity, price, name]`` plus a running total.
+
+    Adding or removing an item touches one entry and adjusts the total, so the
+    cost of an update doesn't grow with the size of the cart.
+    """
+    __slots__ = ("restaurant_id", "items", "total", "count", "expires_at")
+
+    def __init__(self, expires_at: float):
+        self.restaurant_id: Optional[int] = None
+        self.items: Dict[int, list] = {}
+        self.total = 0.0
+        self.count = 0
+        self.expires_at = expires_at
+
+    def add(self, menu_item_id: int, name: str, price: float, quantity: int) -> dict:
+        """Change an item's quantity by ``quantity`` (negative removes) and return the delta."""
+        entry = self.items.get(menu_item_id)
+        if entry is None:
+            entry = self.items[menu_item_id] = [0, price, name]
+        # Never take out more than is in the cart
+        quantity = max(quantity, -entry[0])
+        entry[0] += quantity
+        self.total += entry[1] * quantity
+        self.count += quantity
+        if entry[0] == 0:
+            del self.items[menu_item_id]
+        if not self.items:
+            # Reset the float total so rounding errors don't accumulate across carts
+            self.total = 0.0
+            self.restaurant_id = None
+        return {
+            "menu_item_id": menu_item_id,
+            "name": entry[2],
+            "price": entry[1],
+            "quantity": entry[0],
+        }
+
+    def to_items(self) -> List[dict]:
+        return [
+            {"menu_item_id": item_id, "name": name, "price": price, "quantity": quantity}
+            for item_id, (quantity, price, name) in self.items.items()
+        ]
+
+
+class CartStore:
+    """Carts held in this process, keyed by user and dropped after CART_TTL_SECONDS idle."""
+
+    def __init__(self, ttl: float = CART_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._carts: Dict[int, Cart] = {}
+        self._next_sweep = 0.0
+
+    def _sweep(self, now: float):
+        expired = [user_id for user_id, cart in self._carts.items() if cart.expires_at <= now]
+        for user_id in expired:
+            del self._carts[user_id]
+        if expired:
+            metrics.inc("cart_expired_total", len(expired))
+        self._next_sweep = now + self.ttl
+
+    def get(self, user_id: int) -> Optional[Cart]:
+        now = time.monotonic()
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is not None and cart.expires_at <= now:
+                del self._carts[user_id]
+                metrics.inc("cart_expired_total")
+                return None
+            return cart
+
+    def add(self, user_id: int, restaurant_id: int, menu_item_id: int, name: str,
+            price: float, quantity: int) -> dict:
+        """Apply one item change to the user's cart; returns the item delta and cart totals.
+
+        ``cart_reset`` is true when the item came from another restaurant and
+        replaced the cart; ``cart_items`` then holds the whole new cart.
+        Raises NotInCartError for a removal of an item that isn't in the cart.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            cart = self._carts.get(user_id)
+            if cart is None or cart.expires_at <= now:
+                cart = self._carts[user_id] = Cart(now + self.ttl)
+            if quantity < 0 and menu_item_id not in cart.items:
+                # Includes items of another restaurant: removing one mustn't empty the cart
+                raise NotInCartError(f"Menu item {menu_item_id} is not in the cart")
+            # A cart holds items from a single restaurant; adding from another starts over
+            reset = quantity > 0 and cart.restaurant_id != restaurant_id and bool(cart.items)
+            if quantity > 0 and cart.restaurant_id != restaurant_id:
+                cart.items.clear()
+                cart.total = 0.0
+                cart.count = 0
+                cart.restaurant_id = restaurant_id
+            item = cart.add(menu_item_id, name, price, quantity)
+            cart.expires_at = now + self.ttl
+            metrics.inc("cart_updates_total")
+            update = {"item": item, "cart_total": round(cart.total, 2), "item_count": cart.count, "cart_reset": reset}
+            if reset:
+                update["cart_items"] = cart.to_items()
+            return update
+
+    def pop(self, user_id: int) -> Optional[Cart]:
+        with self._lock:
+            cart = self._carts.pop(user_id, None)
+        if cart is not None and cart.expires_at <= time.monotonic():
+            return None
+        return cart
+
+
+carts = CartStore()
@@ -0,0 +1,224 @@
+# BE/catalog.py
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from BE import database, models
+from BE.compression import choose_encoding, compress, should_compress
+from BE.config import CATALOG_CACHE_CONTROL, CATALOG_VERSION_CHECK_SECONDS
+
+# Tables whose changes invalidate the catalog
+CATALOG_MODELS = (models.Restaurant, models.MenuItem)
+
+# The catalog version lives in the catalog_version row, bumped in the same
+# transaction as every write to a catalog table (see _bump_in_transaction), so
+# all workers and restarts agree on what an ETag names. Each worker re-reads
+# it at most every CATALOG_VERSION_CHECK_SECONDS and sees its own writes at
+# once, so most conditional GETs are answered without a database round trip.
+_lock = threading.Lock()
+_version: Optional[int] = None
+_tag = ""
+_last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+_checked_at = float("-inf")
+
+# Rendered response bodies for the current version, keyed by request path.
+# Each entry holds the identity body plus any compressed variants served so far.
+_bodies: Dict[str, Tuple[int, Dict[str, bytes]]] = {}
+
+# Pre-rendered chat texts (restaurant list, menus) for the current version
+_texts: Dict[str, Tuple[int, Any]] = {}
+
+
+def _apply(current: int, updated_at: datetime):
+    global _version, _tag, _last_modified, _checked_at
+    # The row's timestamp tells apart databases that were recreated and counted up again
+    tag = f"{current}.{int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000)}"
+    with _lock:
+        _checked_at = time.monotonic()
+        if tag == _tag:
+            return
+        _version = current
+        _tag = tag
+        _last_modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+        _bodies.clear()
+        _texts.clear()
+
+
+def _read_version():
+    table = models.CatalogVersion.__table__
+    with database.engine.connect() as conn:
+        row = conn.execute(select(table.c.version, table.c.updated_at).where(table.c.id == 1)).first()
+        if row is None:
+            # A database made by create_all rather than the migrations
+            try:
+                conn.execute(insert(table).values(id=1, version=1, updated_at=datetime.utcnow()))
+                conn.commit()
+            except IntegrityError:
+                conn.rollback()
+            row = conn.execute(select(table.c.version, table.c.updated_at).where(table.c.id == 1)).first()
+    return row
+
+
+def refresh(force: bool = False):
+    """Pick up catalog writes made by other workers (at most every CATALOG_VERSION_CHECK_SECONDS)."""
+    if force or time.monotonic() - _checked_at >= CATALOG_VERSION_CHECK_SECONDS:
+        _apply(*_read_version())
+
+
+def version() -> int:
+    refresh()
+    return _version
+
+
+def last_modified() -> datetime:
+    refresh()
+    return _last_modified
+
+
+def etag(encoding: Optional[str] = None) -> str:
+    refresh()
+    if encoding:
+        return f'"catalog-{_tag}-{encoding}"'
+    return f'"catalog-{_tag}"'
+
+
+def cached_body(key: str, build: Callable[[], bytes], encoding: Optional[str] = None) -> bytes:
+    """Return the body for ``key`` at the current version, building it once.
+
+    With ``encoding`` the compressed variant is returned, compressed once and
+    stored next to the identity body.
+    """
+    current = version()
+    entry = _bodies.get(key)
+    variants = entry[1] if entry and entry[0] == current else None
+    if variants is None:
+        variants = {"identity": build()}
+    if encoding and encoding not in variants:
+        variants[encoding] = compress(variants["identity"], encoding, cached=True)
+    with _lock:
+        # Don't store a body rendered against a version that was bumped meanwhile
+        if _version == current:
+            _bodies[key] = (current, variants)
+    return variants[encoding or "identity"]
+
+
+def cached_text(key: str, build: Callable[[], Any]) -> Any:
+    """Return the chat text rendered for ``key`` at the current version, building it once.
+
+    A ``None`` result is returned but not stored.
+    """
+    current = version()
+    entry = _texts.get(key)
+    if entry and entry[0] == current:
+        return entry[1]
+    text = build()
+    with _lock:
+        if text is not None and _version == current:
+            _texts[key] = (current, text)
+    return text
+
+
+def restaurant_ids(db: Session) -> frozenset:
+    """IDs of all restaurants at the current version, so a 304 is never sent for a missing one."""
+    return cached_text("restaurant-ids", lambda: frozenset(db.scalars(select(models.Restaurant.id))))
+
+
+def _not_modified(request: Request, modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Any encoding of the current version is still a valid copy
+        current = {etag(), *(etag(e) for e in ("br", "gzip"))}
+        candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in candidates or any(t in current for t in candidates)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional_response(request: Request, key: str, build: Callable[[], bytes]) -> Response:
+    """Serve a catalog resource with ETag/Last-Modified, answering 304 when unchanged.
+
+    Bodies over the compression threshold go out pre-compressed with the
+    encoding negotiated from Accept-Encoding.
+    """
+    modified = last_modified()
+    headers = {
+        "Last-Modified": format_datetime(modified, usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if _not_modified(request, modified):
+        headers["ETag"] = etag()
+        return Response(status_code=304, headers=headers)
+
+    body = cached_body(key, build)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding and should_compress("application/json", len(body)):
+        body = cached_body(key, build, encoding)
+        headers["Content-Encoding"] = encoding
+    else:
+        encoding = None
+    headers["ETag"] = etag(encoding)
+    return Response(body, headers=headers, media_type="application/json")
+
+
+# Track catalog writes per session and bump the version in the same transaction
+@event.listens_for(Session, "after_flush")
+def _flag_catalog_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            session.info["catalog_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_catalog_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+            orm_execute_state.session.info["catalog_dirty"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_in_transaction(session):
+    # Flush first: the pending catalog changes may not have been flushed yet
+    session.flush()
+    if not session.info.get("catalog_dirty"):
+        return
+    table = models.CatalogVersion.__table__
+    row = session.execute(
+        update(table).where(table.c.id == 1)
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+        .returning(table.c.version, table.c.updated_at)
+    ).first()
+    if row is None:
+        row = session.execute(
+            insert(table).values(id=1, version=1, updated_at=datetime.utcnow())
+            .returning(table.c.version, table.c.updated_at)
+        ).first()
+    session.info["catalog_version"] = tuple(row)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    session.info.pop("catalog_dirty", None)
+    committed = session.info.pop("catalog_version", None)
+    if committed is not None:
+        _apply(*committed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session):
+    session.info.pop("catalog_dirty", None)
+    session.info.pop("catalog_version", None)
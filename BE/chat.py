@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from .database import get_db
-from . import models, schemas
+from .ratelimit import rate_limit
+from . import crud, models, schemas
 from typing import Optional, Dict, List, Any
 from pydantic import BaseModel
 from .ai_service import (
     process_message, 
     handle_restaurant_selection, 
     handle_menu_item_selection,
+    get_cart,
     handle_checkout,
     get_order_status_response,
     handle_order_update
@@ -27,14 +29,14 @@ class RestaurantSelectionRequest(BaseModel):
     restaurant_id: int
 
 class MenuItemSelectionRequest(BaseModel):
+    user_id: int
     item_id: int
-    quantity: int
-    cart_items: List[Dict] = []
+    quantity: int  # negative to remove
 
 class CheckoutRequest(BaseModel):
     user_id: int
     restaurant_id: int
-    cart_items: List[Dict]
+    cart_items: Optional[List[Dict]] = None  # defaults to the server-side cart
     delivery_address: str
     payment_method: str  # "cash" or "card"
 
@@ -42,7 +44,7 @@ class OrderUpdateRequest(BaseModel):
     update_type: str  # "address", "instructions", "cancel"
     update_value: str
 
-@router.post("/message")
+@router.post("/message", dependencies=[Depends(rate_limit("chat"))])
 async def chat_message(request: ChatRequest, db: Session = Depends(get_db)):
     """Process a chat message from the user"""
     if not request.messages:
@@ -55,17 +57,22 @@ async def chat_message(request: ChatRequest, db: Session = Depends(get_db)):
     response = process_message(user_message.content, request.order_id, db)
     return response
 
-@router.post("/select-restaurant")
+@router.post("/select-restaurant", dependencies=[Depends(rate_limit("chat_cart"))])
 async def select_restaurant(request: RestaurantSelectionRequest, db: Session = Depends(get_db)):
     """Handle restaurant selection"""
     return handle_restaurant_selection(request.restaurant_id, db)
 
-@router.post("/select-menu-item")
+@router.post("/select-menu-item", dependencies=[Depends(rate_limit("chat_cart"))])
 async def select_menu_item(request: MenuItemSelectionRequest, db: Session = Depends(get_db)):
     """Handle menu item selection"""
-    return handle_menu_item_selection(request.item_id, request.quantity, request.cart_items, db)
+    return handle_menu_item_selection(request.user_id, request.item_id, request.quantity, db)
+
+@router.get("/cart/{user_id}")
+async def read_cart(user_id: int):
+    """Get the full server-side cart, e.g. to resync a client"""
+    return get_cart(user_id)
 
-@router.post("/checkout")
+@router.post("/checkout", dependencies=[Depends(rate_limit("checkout"))])
 async def checkout(request: CheckoutRequest, db: Session = Depends(get_db)):
     """Process checkout and create order"""
     return handle_checkout(
@@ -78,15 +85,16 @@ async def checkout(request: CheckoutRequest, db: Session = Depends(get_db)):
     )
 
 @router.get("/order/{order_id}")
-async def get_order_status(order_id: int, db: Session = Depends(get_db)):
+def get_order_status(order_id: int, db: Session = Depends(get_db)):
     """Get order status and details"""
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    # A sync handler, so concurrent polls for one order share a query (crud.get_order)
+    order = crud.get_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
     return get_order_status_response(order, db)
 
-@router.post("/order/{order_id}/update")
+@router.post("/order/{order_id}/update", dependencies=[Depends(rate_limit("order_update"))])
 async def update_order(order_id: int, request: OrderUpdateRequest, db: Session = Depends(get_db)):
     """Update an existing order"""
     return handle_order_update(order_id, request.update_type, request.update_value, db)
\ No newline at end of file
@@ -0,0 +1,107 @@
+# BE/compression.py
+import gzip
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from BE.config import COMPRESSION_MIN_SIZE, COMPRESSION_CONTENT_TYPES
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Encodings we can produce, in order of preference
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Per-request compression has to be cheap; cached bodies are compressed once
+# per catalog version, so they can afford the slower, denser settings.
+FAST_LEVELS = {"br": 4, "gzip": 6}
+CACHED_LEVELS = {"br": 11, "gzip": 9}
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best encoding the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in SUPPORTED_ENCODINGS:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def should_compress(content_type: Optional[str], size: int) -> bool:
+    if size < COMPRESSION_MIN_SIZE or not content_type:
+        return False
+    return content_type.split(";")[0].strip().lower() in COMPRESSION_CONTENT_TYPES
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    level = (CACHED_LEVELS if cached else FAST_LEVELS)[encoding]
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level)
+
+
+class CompressionMiddleware:
+    """Compress complete (non-streaming) responses using the negotiated encoding.
+
+    Responses that already carry a Content-Encoding, such as the pre-compressed
+    catalog bodies, are passed through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers back until we know whether we compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or start["status"] in (204, 304)
+                or not should_compress(headers.get("content-type"), len(body))
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
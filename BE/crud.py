@@ -1,7 +1,21 @@
-from sqlalchemy.orm import Session
-from BE import models, schemas
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.util import identity_key
+from BE import metrics, models, order_queue, rollups, schemas, sharding
+from BE.config import CONFLICT_RETRY_ATTEMPTS
+from BE.database import is_lock_timeout, replica_read
+from BE.singleflight import coalesced_query
 from datetime import datetime
+from typing import Callable, Optional, TypeVar
+import base64
+import functools
 import random
+import time
+
+T = TypeVar("T")
+
+metrics.describe("update_conflicts_total", "Optimistic order/payment updates that lost a race")
 
 # Custom exceptions
 class OrderNotFoundError(Exception):
@@ -13,6 +27,40 @@ class PaymentNotFoundError(Exception):
 class MenuItemNotFoundError(Exception):
     pass
 
+class OrderNotCancellableError(Exception):
+    def __init__(self, status: str):
+        super().__init__(f"Order cannot be cancelled in its current status: {status}")
+        self.status = status
+
+class OrderNotPayableError(Exception):
+    def __init__(self, status: str):
+        super().__init__(f"Order cannot be paid in its current status: {status}")
+        self.status = status
+
+class ConcurrentUpdateError(Exception):
+    """The row changed since its version was read (see retry_on_conflict); HTTP 409."""
+    def __init__(self, table: str, row_id: int):
+        super().__init__(f"{table} {row_id} was changed by another request, reload it and try again")
+        self.table = table
+        self.row_id = row_id
+
+# Order states from which a customer may still cancel
+CANCELLABLE_STATUSES = ("pending", "confirmed")
+
+# Columns a status UPDATE returns so the change can be published to the kitchen queue
+ORDER_QUEUE_COLUMNS = (
+    models.Order.id,
+    models.Order.restaurant_id,
+    models.Order.status,
+    models.Order.total,
+    models.Order.item_count,
+    models.Order.created_at,
+)
+
+def _in_session(db: Session, model, pk):
+    # An instance this session already holds (e.g. from prefetch), found without SQL
+    return db.identity_map.get(identity_key(model, pk))
+
 # User operations
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
@@ -34,8 +82,10 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 # crud.py
+@replica_read
 def get_order_details(db: Session, order_id: int):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    sharding.use_id(db, order_id)
+    order = _in_session(db, models.Order, order_id) or db.query(models.Order).filter(models.Order.id == order_id).first()
     if not order:
         return None
 
@@ -45,7 +95,7 @@ def get_order_details(db: Session, order_id: int):
     # Get order items
     items = []
     for item in order.order_items:
-        menu_item = db.query(models.MenuItem).filter(models.MenuItem.id == item.menu_item_id).first()
+        menu_item = db.get(models.MenuItem, item.menu_item_id) if item.menu_item_id is not None else None
         items.append({
             "item_id": item.id,
             "name": menu_item.name if menu_item else "Unknown Item",
@@ -83,12 +133,21 @@ def get_order_details(db: Session, order_id: int):
     }
 
 # Restaurant operations
+@replica_read
 def get_restaurant(db: Session, restaurant_id: int):
+    restaurant = _in_session(db, models.Restaurant, restaurant_id)
+    if restaurant is not None:
+        return restaurant
     return db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
 
 
+@replica_read
 def get_menu_items_by_restaurant(db: Session, restaurant_id: int):
-    return db.query(models.MenuItem).filter(models.MenuItem.restaurant_id == restaurant_id).all()
+    # Popular menus are opened by many users at once, share one query between them
+    return coalesced_query(
+        db, ("menu", restaurant_id),
+        lambda s: s.query(models.MenuItem).filter(models.MenuItem.restaurant_id == restaurant_id).all(),
+    )
 
 # Order operations
 def create_order(db: Session, order: schemas.OrderCreate):
@@ -109,102 +168,446 @@ def create_order(db: Session, order: schemas.OrderCreate):
             price=price
         ))
 
-    # Create the order
+    # Create the order on its restaurant's shard
+    sharding.use_restaurant(db, order.restaurant_id)
     db_order = models.Order(
+        id=sharding.next_id(db, "orders"),
         user_id=order.user_id,
         restaurant_id=order.restaurant_id,
         total=total_amount,
-        status="pending"
+        item_count=sum(item.quantity for item in order_items),
+        status="pending",
+        delivery_address=order.delivery_address,
+        special_instructions=order.special_instructions,
     )
 
+    # Order, items and sales rollups are written in one transaction
+    db_order.order_items = order_items
     db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-
-    # Add order items with the correct order_id
-    for item in order_items:
-        item.order_id = db_order.id
-        db.add(item)
+    db.flush()
+    rollups.record_order_created(db, db_order, order_items)
+    _record_status(db, db_order)
     db.commit()
 
     return db_order
 
+@replica_read
 def get_order(db: Session, order_id: int):
-    return db.query(models.Order).filter(models.Order.id == order_id).first()
+    # Status polls for the same order are coalesced into one query
+    sharding.use_id(db, order_id)
+    order = _in_session(db, models.Order, order_id)
+    if order is not None:
+        return order
+    return coalesced_query(
+        db, ("order", order_id),
+        lambda s: s.query(models.Order).filter(models.Order.id == order_id).first(),
+    )
+
+def _lock_timeout_is_conflict(table: str):
+    """Report a write that timed out waiting for SQLite's lock as a lost race (retried, or HTTP 409).
+
+    Used on functions taking ``(db, row_id, ...)``.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(db: Session, row_id: int, *args, **kwargs):
+            try:
+                return fn(db, row_id, *args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_timeout(e):
+                    raise
+                _conflict(db, table, row_id)
+        return wrapper
+    return decorate
 
 def update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not db_order:
+    """Apply ``order_update`` with a compare-and-swap on the order's version.
+
+    With ``order_update.version`` (the version the caller read) a change made
+    since then raises ConcurrentUpdateError; without it the update is retried
+    on the current row.
+    """
+    if order_update.version is not None:
+        return _update_order(db, order_id, order_update, order_update.version)
+    return retry_on_conflict(lambda: _update_order(db, order_id, order_update, None))
+
+@_lock_timeout_is_conflict("Order")
+def _update_order(db: Session, order_id: int, order_update: schemas.OrderUpdate, expected_version: Optional[int]):
+    sharding.use_id(db, order_id)
+    current = db.execute(
+        select(models.Order.status, models.Order.version).where(models.Order.id == order_id)
+    ).first()
+    if current is None:
         raise OrderNotFoundError(f"Order with id {order_id} not found")
-
-    # Update order fields
-    if order_update.status is not None:
-        db_order.status = order_update.status
+    if expected_version is not None and expected_version != current.version:
+        _conflict(db, "Order", order_id)
+    # Fields left out (None) keep their value
+    values = order_update.model_dump(include={"status", "delivery_address", "special_instructions"}, exclude_none=True)
+    if not values:
+        return db.get(models.Order, order_id)
+
+    # No lock is held between the read and this UPDATE: it only applies if
+    # nobody wrote the order in between
+    db_order = db.scalars(
+        update(models.Order)
+        .where(models.Order.id == order_id, models.Order.version == current.version)
+        .values(**values, version=current.version + 1)
+        .returning(models.Order)
+    ).first()
+    if db_order is None:
+        _conflict(db, "Order", order_id)
+    if order_update.status == "cancelled" and current.status != "cancelled":
+        rollups.record_order_cancelled(db, db_order.id, db_order.restaurant_id, db_order.created_at, db_order.total)
+    _record_status(db, db_order)
     db.commit()
-    db.refresh(db_order)
     return db_order
 
+def _conflict(db: Session, table: str, row_id: int):
+    db.rollback()
+    metrics.inc("update_conflicts_total", table=table.lower())
+    raise ConcurrentUpdateError(table, row_id)
+
+def retry_on_conflict(operation: Callable[[], T], attempts: int = CONFLICT_RETRY_ATTEMPTS) -> T:
+    """Run ``operation`` (a read-modify-write) again when it loses a race, with a short jittered backoff.
+
+    The backoff sleeps, so call this from sync handlers (FastAPI's threadpool), never on the event loop.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return operation()
+        except ConcurrentUpdateError:
+            if attempt == attempts:
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+def _record_status(db: Session, order):
+    # Wake the kitchen queue's pollers for the restaurant on commit
+    order_queue.record(db, order.restaurant_id)
+
+def _encode_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+@replica_read
+def get_user_orders(db: Session, user_id: int, limit: int = 20, cursor: str = None):
+    """One page of a user's orders, newest first, plus the cursor of the next page.
+
+    Keyset pagination on (user_id, created_at, id) walks the composite index,
+    so every page costs the same however long the history is. Only the
+    columns the history view needs are selected; item counts and totals are
+    stored on the order, so order_items is never read.
+
+    With order shards a user's orders are spread over all of them: each shard
+    returns its newest page and the pages are merged. Restaurant names come
+    from the primary in one lookup.
+    """
+    query = (
+        select(
+            models.Order.id,
+            models.Order.restaurant_id,
+            models.Order.status,
+            models.Order.total,
+            models.Order.item_count,
+            models.Order.created_at,
+        )
+        .where(models.Order.user_id == user_id)
+        .order_by(models.Order.created_at.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, order_id = _decode_cursor(cursor)
+        query = query.where(tuple_(models.Order.created_at, models.Order.id) < (created_at, order_id))
+
+    rows = []
+    for _ in sharding.each_shard(db):
+        rows.extend(db.execute(query).all())
+    rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    restaurant_ids = {row.restaurant_id for row in rows if row.restaurant_id is not None}
+    restaurant_names = dict(db.execute(
+        select(models.Restaurant.id, models.Restaurant.name).where(models.Restaurant.id.in_(restaurant_ids))
+    ).all()) if restaurant_ids else {}
+
+    orders = [
+        {
+            "order_id": row.id,
+            "restaurant_id": row.restaurant_id,
+            "restaurant": restaurant_names.get(row.restaurant_id) or "Unknown Restaurant",
+            "status": row.status,
+            "total": float(row.total) if row.total else 0.0,
+            "item_count": row.item_count,
+            "created_at": row.created_at.isoformat(),
+        }
+        for row in rows
+    ]
+    return orders, next_cursor
+
 # Payment operations
 def create_payment(db: Session, payment: schemas.PaymentCreate):
-    db_payment = models.Payment(
-        order_id=payment.order_id,
-        amount=payment.amount,
-        method=payment.method,
-        transaction_id=payment.transaction_id,
-        status='pending'
-    )
+    """Confirm the order and insert its payment in one transaction.
 
-    db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
-    
+    Only an order that is still pending or confirmed takes a payment; a
+    cancelled (e.g. expired) or already prepared order raises OrderNotPayableError.
+    """
+    sharding.use_id(db, payment.order_id)
     # After payment is created, update order status to 'confirmed'
-    db_order = db.query(models.Order).filter(models.Order.id == payment.order_id).first()
-    if db_order:
-        db_order.status = 'confirmed'
-        db.commit()
-    
+    confirmed = db.execute(
+        update(models.Order)
+        .where(models.Order.id == payment.order_id, models.Order.status.in_(CANCELLABLE_STATUSES))
+        .values(status="confirmed", version=models.Order.version + 1)
+        .returning(*ORDER_QUEUE_COLUMNS)
+    ).first()
+    if confirmed is None:
+        db.rollback()
+        status = db.scalar(select(models.Order.status).where(models.Order.id == payment.order_id))
+        if status is None:
+            raise OrderNotFoundError(f"Order with id {payment.order_id} not found")
+        raise OrderNotPayableError(status)
+    _record_status(db, confirmed)
+
+    values = {
+        "order_id": payment.order_id,
+        "order_created_at": confirmed.created_at,
+        "amount": payment.amount,
+        "method": payment.method,
+        "transaction_id": payment.transaction_id,
+        "status": "pending",
+    }
+    payment_id = sharding.next_id(db, "payments")
+    if payment_id is not None:
+        values["id"] = payment_id
+    db_payment = db.scalars(insert(models.Payment).returning(models.Payment), [values]).one()
+    db.commit()
     return db_payment
 
-def update_payment_status(db: Session, payment_id: int, status: str):
-    db_payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+@_lock_timeout_is_conflict("Payment")
+def update_payment_status(db: Session, payment_id: int, status: str, expected_version: Optional[int] = None):
+    """Set the payment status (and advance the order when paid) in one transaction.
+
+    Setting the status a payment already has is a no-op, so repeated payment
+    callbacks don't advance the order or count the sale twice. With
+    ``expected_version`` the payment must not have changed since it was read,
+    or ConcurrentUpdateError is raised.
+    """
+    sharding.use_id(db, payment_id)
+    conditions = [models.Payment.id == payment_id, models.Payment.status != status]
+    if expected_version is not None:
+        conditions.append(models.Payment.version == expected_version)
+    db_payment = db.scalars(
+        update(models.Payment)
+        .where(*conditions)
+        .values(status=status, version=models.Payment.version + 1)
+        .returning(models.Payment)
+    ).first()
     if not db_payment:
-        raise PaymentNotFoundError(f"Payment with id {payment_id} not found")
-
-    db_payment.status = status
-    
-    # If payment is completed, update order status
+        db.rollback()
+        db_payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+        if not db_payment:
+            raise PaymentNotFoundError(f"Payment with id {payment_id} not found")
+        if expected_version is not None and db_payment.version != expected_version:
+            _conflict(db, "Payment", payment_id)
+        return db_payment
+
+    # If payment is completed, update order status; an order cancelled (or
+    # already moved on) in the meantime keeps its status
     if status == 'completed':
-        db_order = db.query(models.Order).filter(models.Order.id == db_payment.order_id).first()
-        if db_order:
-            db_order.status = 'preparing'
-            db.commit()
-    
+        paid_order = db.execute(
+            update(models.Order)
+            .where(
+                models.Order.id == db_payment.order_id,
+                models.Order.created_at == db_payment.order_created_at,
+                models.Order.status.in_(CANCELLABLE_STATUSES),
+            )
+            .values(status="preparing", version=models.Order.version + 1)
+            .returning(*ORDER_QUEUE_COLUMNS)
+        ).first()
+        if paid_order:
+            _record_status(db, paid_order)
+        # Paid once per order, however its status moved (the definition rollups.backfill uses)
+        paid_before = db.scalar(
+            select(models.Payment.id).where(
+                models.Payment.order_id == db_payment.order_id,
+                models.Payment.order_created_at == db_payment.order_created_at,
+                models.Payment.id != db_payment.id,
+                models.Payment.status.in_(rollups.PAID_PAYMENT_STATUSES),
+            ).limit(1)
+        )
+        if paid_before is None:
+            restaurant_id = paid_order.restaurant_id if paid_order else db.scalar(
+                select(models.Order.restaurant_id).where(
+                    models.Order.id == db_payment.order_id, models.Order.created_at == db_payment.order_created_at,
+                )
+            )
+            rollups.record_order_paid(db, restaurant_id, db_payment.order_created_at)
+
     db.commit()
-    db.refresh(db_payment)
     return db_payment
 
+@_lock_timeout_is_conflict("Order")
+def cancel_order(db: Session, order_id: int, expected_version: Optional[int] = None):
+    """Cancel an order and refund a completed payment in one transaction.
+
+    The status check is part of the UPDATE itself, so a concurrent status
+    change can't slip in between reading the order and cancelling it. With
+    ``expected_version`` the order must also be unchanged since the caller
+    read it, or ConcurrentUpdateError is raised.
+    Returns a ``(total, refunded)`` tuple.
+    """
+    sharding.use_id(db, order_id)
+    conditions = [models.Order.id == order_id, models.Order.status.in_(CANCELLABLE_STATUSES)]
+    if expected_version is not None:
+        conditions.append(models.Order.version == expected_version)
+    cancelled = db.execute(
+        update(models.Order)
+        .where(*conditions)
+        .values(status="cancelled", version=models.Order.version + 1)
+        .returning(*ORDER_QUEUE_COLUMNS)
+    ).first()
+    if cancelled is None:
+        db.rollback()
+        current = db.execute(
+            select(models.Order.status, models.Order.version).where(models.Order.id == order_id)
+        ).first()
+        if current is None:
+            raise OrderNotFoundError(f"Order with id {order_id} not found")
+        if expected_version is not None and current.version != expected_version:
+            _conflict(db, "Order", order_id)
+        raise OrderNotCancellableError(current.status)
+
+    rollups.record_order_cancelled(db, order_id, cancelled.restaurant_id, cancelled.created_at, cancelled.total)
+    _record_status(db, cancelled)
+
+    # Process refund if payment was made
+    refunded = db.execute(
+        update(models.Payment)
+        .where(
+            models.Payment.order_id == order_id,
+            models.Payment.order_created_at == cancelled.created_at,
+            models.Payment.status == "completed",
+        )
+        .values(status="refunded", version=models.Payment.version + 1)
+        .returning(models.Payment.id)
+    ).first()
+    db.commit()
+    return float(cancelled.total or 0.0), refunded is not None
+
 # Utility functions
 def get_order_items(db: Session, order_id: int):
+    sharding.use_id(db, order_id)
     return db.query(models.OrderItem).filter(models.OrderItem.order_id == order_id).all()
 
 def get_order_payment(db: Session, order_id: int):
+    sharding.use_id(db, order_id)
     return db.query(models.Payment).filter(models.Payment.order_id == order_id).first()
 
 def get_order_delivery(db: Session, order_id: int):
+    sharding.use_id(db, order_id)
     return db.query(models.Delivery).filter(models.Delivery.order_id == order_id).first()
 
 
 
 
+# Column projections for the listing paths. Rows are plain named tuples: no
+# identity map, no change tracking, and safe to share between requests.
+RESTAURANT_LIST_COLUMNS = (
+    models.Restaurant.id,
+    models.Restaurant.name,
+    models.Restaurant.address,
+    models.Restaurant.cuisine,
+    models.Restaurant.image_url,
+    models.Restaurant.image_hash,
+    models.Restaurant.is_active,
+)
+MENU_ITEM_LIST_COLUMNS = (
+    models.MenuItem.id,
+    models.MenuItem.restaurant_id,
+    models.MenuItem.name,
+    models.MenuItem.description,
+    models.MenuItem.price,
+    models.MenuItem.category,
+    models.MenuItem.image_url,
+    models.MenuItem.image_hash,
+)
+
+@replica_read
+def list_restaurants(db: Session, limit: int = None):
+    """Restaurants as read-only rows, for listings."""
+    query = select(*RESTAURANT_LIST_COLUMNS).order_by(models.Restaurant.id)
+    if limit:
+        query = query.limit(limit)
+    return db.execute(query).all()
+
+@replica_read
+def list_menu_items(db: Session, restaurant_id: int = None):
+    """Menu items (of one restaurant, or all) as read-only rows, for listings."""
+    query = select(*MENU_ITEM_LIST_COLUMNS).order_by(models.MenuItem.id)
+    if restaurant_id is None:
+        return db.execute(query).all()
+    query = query.where(models.MenuItem.restaurant_id == restaurant_id)
+    return coalesced_query(db, ("menu_rows", restaurant_id), lambda s: s.execute(query).all(), merge=False)
+
+@replica_read
 def get_restaurants(db: Session):
     return db.query(models.Restaurant).all()
 
+@replica_read
 def get_menu_items(db: Session, restaurant_id: int = None):
     query = db.query(models.MenuItem)
     if restaurant_id:
         query = query.filter(models.MenuItem.restaurant_id == restaurant_id)
     return query.all()
 
+@replica_read
 def get_menu_item(db: Session, item_id: int):
-    return db.query(models.MenuItem).filter(models.MenuItem.id == item_id).first()
\ No newline at end of file
+    menu_item = _in_session(db, models.MenuItem, item_id)
+    if menu_item is not None:
+        return menu_item
+    return db.query(models.MenuItem).filter(models.MenuItem.id == item_id).first()
+
+
+def prefetch(db: Session, order_ids=(), restaurant_ids=(), menu_item_ids=()):
+    """Load these rows into the session with one query per table (and shard).
+
+    Later get_order/get_restaurant/get_menu_item calls for them, and the
+    order's items, payment, restaurant and menu items, are then served from
+    the session without SQL. IDs that don't exist are simply not loaded.
+    """
+    restaurant_ids, menu_item_ids = set(restaurant_ids), set(menu_item_ids)
+    # The identity map only holds weak references: keep the rows alive with the session
+    loaded = db.info.setdefault("prefetched", [])
+    by_shard = {}
+    for order_id in set(order_ids):
+        by_shard.setdefault(sharding.shard_for_id(order_id) if sharding.enabled() else 0, []).append(order_id)
+    for ids in by_shard.values():
+        sharding.use_id(db, ids[0])
+        orders = db.scalars(
+            select(models.Order)
+            .where(models.Order.id.in_(ids))
+            .options(
+                selectinload(models.Order.order_items),
+                selectinload(models.Order.payment),
+                selectinload(models.Order.delivery),
+            )
+        ).all()
+        loaded.extend(orders)
+        for order in orders:
+            restaurant_ids.add(order.restaurant_id)
+            menu_item_ids.update(item.menu_item_id for item in order.order_items)
+    restaurant_ids.discard(None)
+    menu_item_ids.discard(None)
+    if restaurant_ids:
+        loaded.extend(db.scalars(select(models.Restaurant).where(models.Restaurant.id.in_(restaurant_ids))).all())
+    if menu_item_ids:
+        loaded.extend(db.scalars(select(models.MenuItem).where(models.MenuItem.id.in_(menu_item_ids))).all())
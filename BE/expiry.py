@@ -0,0 +1,161 @@
+# BE/expiry.py
+"""Background expiry of abandoned orders and payments.
+
+Orders still ``pending`` after PENDING_ORDER_TTL_MINUTES (the user never
+picked a payment method) are cancelled. Online payments still ``pending``
+after PENDING_PAYMENT_TTL_MINUTES (the QR code was never paid) are marked
+``expired`` and their unpaid orders cancelled. Cash-on-delivery payments stay
+pending until delivery.
+
+Each batch is a single UPDATE of at most EXPIRY_BATCH_SIZE rows chosen with
+``FOR UPDATE SKIP LOCKED`` (Postgres) and committed on its own, so rows a live
+checkout is working on are skipped until the next run and no lock is held
+longer than one short statement. Several API workers can run the scheduler
+at once without waiting on each other.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.orm import Session
+from BE import metrics, models, order_queue, rollups, sharding
+from BE.config import (
+    EXPIRY_BATCH_SIZE, EXPIRY_INTERVAL_SECONDS, EXPIRY_MAX_BATCHES,
+    PENDING_ORDER_TTL_MINUTES, PENDING_PAYMENT_TTL_MINUTES,
+)
+from BE.crud import CANCELLABLE_STATUSES, ORDER_QUEUE_COLUMNS
+from BE.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("expired_orders_total", "Abandoned orders cancelled by the expiry scheduler")
+metrics.describe("expired_payments_total", "Abandoned online payments expired by the expiry scheduler")
+metrics.describe("expiry_batches_total", "Expiry batches run")
+metrics.describe("expiry_errors_total", "Expiry runs that failed")
+metrics.describe("expiry_run_seconds", "Duration of the last expiry run", kind="gauge")
+
+
+def _cancel(db: Session, orders) -> int:
+    """Cancel the orders matched by ``orders`` (a subquery of id, created_at) that may still be cancelled."""
+    cancelled = db.execute(
+        update(models.Order)
+        .where(tuple_(models.Order.id, models.Order.created_at).in_(orders))
+        .values(status="cancelled", version=models.Order.version + 1)
+        .returning(*ORDER_QUEUE_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).all()
+    rollups.record_orders_cancelled(db, cancelled)
+    for order in cancelled:
+        order_queue.record(db, order.restaurant_id)
+    return len(cancelled)
+
+
+def expire_orders(db: Session, cutoff: datetime, batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    """Cancel one batch of orders left pending since before ``cutoff``; returns how many."""
+    stale = (
+        select(models.Order.id, models.Order.created_at)
+        .where(models.Order.status == "pending", models.Order.created_at < cutoff)
+        .order_by(models.Order.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    count = _cancel(db, stale)
+    db.commit()
+    metrics.inc("expiry_batches_total", kind="orders")
+    metrics.inc("expired_orders_total", count)
+    return count
+
+
+def expire_payments(db: Session, cutoff: datetime, batch_size: int = EXPIRY_BATCH_SIZE) -> int:
+    """Expire one batch of online payments left pending since before ``cutoff``; returns how many.
+
+    Their orders are cancelled in the same transaction unless someone else
+    holds them (a customer cancelling, say); those stay for the next run.
+    """
+    stale = (
+        select(models.Payment.id)
+        .where(
+            models.Payment.status == "pending",
+            models.Payment.method != "cod",
+            models.Payment.payment_date < cutoff,
+        )
+        .order_by(models.Payment.payment_date)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    expired = db.execute(
+        update(models.Payment)
+        .where(models.Payment.id.in_(stale))
+        .values(status="expired", version=models.Payment.version + 1)
+        .returning(models.Payment.order_id, models.Payment.order_created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if expired:
+        _cancel(
+            db,
+            select(models.Order.id, models.Order.created_at)
+            .where(
+                tuple_(models.Order.id, models.Order.created_at).in_([tuple(row) for row in expired]),
+                models.Order.status.in_(CANCELLABLE_STATUSES),
+            )
+            .with_for_update(skip_locked=True),
+        )
+    db.commit()
+    metrics.inc("expiry_batches_total", kind="payments")
+    metrics.inc("expired_payments_total", len(expired))
+    return len(expired)
+
+
+def _drain(db: Session, sweep: Callable[[Session, datetime, int], int], cutoff: datetime) -> int:
+    # Bounded, so one run never turns into an unbounded scan
+    total = 0
+    for _ in range(EXPIRY_MAX_BATCHES):
+        count = sweep(db, cutoff, EXPIRY_BATCH_SIZE)
+        total += count
+        if count < EXPIRY_BATCH_SIZE:
+            break
+    return total
+
+
+def run_once(now: Optional[datetime] = None) -> Dict[str, int]:
+    """One expiry pass over every order shard; returns the orders and payments expired."""
+    now = now or datetime.utcnow()
+    totals = {"orders": 0, "payments": 0}
+    with SessionLocal() as db:
+        for _ in sharding.each_shard(db):
+            totals["payments"] += _drain(db, expire_payments, now - timedelta(minutes=PENDING_PAYMENT_TTL_MINUTES))
+            totals["orders"] += _drain(db, expire_orders, now - timedelta(minutes=PENDING_ORDER_TTL_MINUTES))
+    return totals
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop():
+    while not _stop.wait(EXPIRY_INTERVAL_SECONDS):
+        started = time.perf_counter()
+        try:
+            totals = run_once()
+            if totals["orders"] or totals["payments"]:
+                logger.info("Expired %d orders and %d payments", totals["orders"], totals["payments"])
+        except Exception:
+            metrics.inc("expiry_errors_total")
+            logger.exception("Expiry run failed")
+        metrics.set_gauge("expiry_run_seconds", time.perf_counter() - started)
+
+
+def start():
+    """Start the scheduler thread (unless EXPIRY_INTERVAL_SECONDS is 0)."""
+    global _thread
+    if EXPIRY_INTERVAL_SECONDS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="expiry", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
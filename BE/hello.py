@@ -6,8 +6,9 @@ from datetime import datetime
 import re
 import json
 from sqlalchemy.orm import Session
-from BE import models, schemas, crud
-from BE.database import SessionLocal, engine
+from BE import models, schemas, crud, prompts
+from BE.database import engine, get_db
+from BE.ratelimit import rate_limit
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
@@ -23,14 +24,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Models
 class Message(BaseModel):
     role: str  # "user" or "assistant"
@@ -51,8 +44,7 @@ def process_message(user_message: str, order_id: int = None, db: Session = None)
     
     # Handle different message patterns
     if any(keyword in message_lower for keyword in ["order food", "i want to order", "place an order"]):
-        menu_items = crud.get_menu_items(db) if db else []
-        menu_text = "\n".join([f"{item.id}. {item.name} - ${item.price:.2f}" for item in menu_items])
+        menu_text = prompts.full_menu(db) if db else ""
         return f"Great! Here's our menu:\n\n{menu_text}\n\nWhat would you like to order?"
     
     elif any(keyword in message_lower for keyword in ["manage order", "check status", "track order"]):
@@ -95,7 +87,7 @@ def read_menu_items(restaurant_id: int, db: Session = Depends(get_db)):
 async def root() -> Dict[str, str]:
     return {"message": "Food Delivery API Service"}
 
-@app.post("/chat", response_model=ChatResponse)
+@app.post("/chat", response_model=ChatResponse, dependencies=[Depends(rate_limit("chat"))])
 async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """Handle chat messages with the food ordering bot."""
     if not request.messages:
@@ -130,7 +122,7 @@ async def get_order(order_id: int, db: Session = Depends(get_db)) -> Any:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
-@app.post("/orders/create", response_model=schemas.Order)
+@app.post("/orders/create", response_model=schemas.Order, dependencies=[Depends(rate_limit("checkout"))])
 async def create_order(
     order_data: schemas.OrderCreate, 
     db: Session = Depends(get_db)
@@ -161,8 +153,8 @@ async def get_order_status(order_id: int, db: Session = Depends(get_db)) -> Dict
     payment_status = order.payment.status if order.payment else "not paid"
     return {"status": order.status, "payment_status": payment_status}
 
-@app.put("/orders/{order_id}/update", response_model=schemas.Order)
-async def update_order(
+@app.put("/orders/{order_id}/update", response_model=schemas.Order, dependencies=[Depends(rate_limit("order_update"))])
+def update_order(
     order_id: int, 
     update_data: schemas.OrderUpdate, 
     db: Session = Depends(get_db)
@@ -172,10 +164,12 @@ async def update_order(
         return crud.update_order(db, order_id, update_data)
     except crud.OrderNotFoundError:
         raise HTTPException(status_code=404, detail="Order not found")
+    except crud.ConcurrentUpdateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to update order")
 
-@app.post("/payments/create", response_model=schemas.Payment)
+@app.post("/payments/create", response_model=schemas.Payment, dependencies=[Depends(rate_limit("payment"))])
 async def create_payment(
     payment_data: schemas.PaymentCreate, 
     db: Session = Depends(get_db)
@@ -183,20 +177,27 @@ async def create_payment(
     """Create a payment record."""
     try:
         return crud.create_payment(db, payment_data)
+    except crud.OrderNotFoundError:
+        raise HTTPException(status_code=404, detail="Order not found")
+    except crud.OrderNotPayableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to create payment")
 
-@app.put("/payments/{payment_id}/status", response_model=schemas.Payment)
-async def update_payment_status(
+@app.put("/payments/{payment_id}/status", response_model=schemas.Payment, dependencies=[Depends(rate_limit("payment_status"))])
+def update_payment_status(
     payment_id: int, 
     status: str, 
+    version: Optional[int] = None,
     db: Session = Depends(get_db)
 ) -> Any:
-    """Update payment status."""
+    """Update payment status (409 if ``version`` is given and the payment has changed since)."""
     try:
-        return crud.update_payment_status(db, payment_id, status)
+        return crud.update_payment_status(db, payment_id, status, version)
     except crud.PaymentNotFoundError:
         raise HTTPException(status_code=404, detail="Payment not found")
+    except crud.ConcurrentUpdateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to update payment")
     
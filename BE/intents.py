@@ -0,0 +1,129 @@
+# BE/intents.py
+"""Intent classifier for chat messages: hashed n-grams scored with NumPy.
+
+A message is lowercased and split into words; each word contributes itself
+and its character 2- to 4-grams (with ``<``/``>`` word boundaries), and
+adjacent words contribute a bigram. Every feature is hashed (crc32) into one
+of ``n_features`` rows of a linear model with one column per intent, trained
+by scripts/train_intents.py on intent_model/labeled.tsv. The weights are a
+float32 .npy file memory-mapped when the API starts, so worker processes
+share its pages.
+"""
+import functools
+import json
+import math
+import os
+import re
+import zlib
+from typing import Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from BE.config import INTENT_MIN_CONFIDENCE, INTENT_MODEL_DIR
+
+OTHER = "other"
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _hash(feature: str, n_features: int) -> int:
+    return zlib.crc32(feature.encode()) % n_features
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_features(word: str, n_features: int, ngrams: Tuple[int, int]) -> frozenset:
+    # The vocabulary of chat messages is small, so words are hashed once
+    padded = f"<{word}>"
+    grams = {"w:" + word}
+    for n in range(ngrams[0], ngrams[1] + 1):
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return frozenset(_hash(gram, n_features) for gram in grams)
+
+
+def features(text: str, n_features: int, ngrams: Sequence[int] = (2, 4)) -> Tuple[int, ...]:
+    """Sorted feature rows of ``text``; the last one is the bias row (``n_features``)."""
+    words = _WORD.findall(text.lower())
+    ngrams = tuple(ngrams)
+    rows = set()
+    for word in words:
+        rows |= _word_features(word, n_features, ngrams)
+    rows.update(_hash(f"b:{a} {b}", n_features) for a, b in zip(words, words[1:]))
+    return tuple(sorted(rows)) + (n_features,)
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=-1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentModel:
+    """Linear model over hashed features; ``weights`` has one row per feature plus a bias row."""
+
+    def __init__(self, weights: np.ndarray, labels: List[str], n_features: int, ngrams: Sequence[int] = (2, 4)):
+        # A plain array over the same (possibly memory-mapped) buffer indexes faster than np.memmap
+        self.weights = np.asarray(weights)
+        self.labels = labels
+        self.n_features = n_features
+        self.ngrams = tuple(ngrams)
+        # Chat turns repeat a lot ("1", "new order"), so their features are cached
+        self._features = functools.lru_cache(maxsize=4096)(
+            lambda text: np.array(features(text, n_features, self.ngrams), dtype=np.intp)
+        )
+
+    @classmethod
+    def load(cls, directory: str = INTENT_MODEL_DIR) -> "IntentModel":
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        weights = np.load(os.path.join(directory, "weights.npy"), mmap_mode="r")
+        return cls(weights, meta["labels"], meta["n_features"], meta["ngrams"])
+
+    def save(self, directory: str, **extra):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "weights.npy"), np.ascontiguousarray(self.weights, dtype=np.float32))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"labels": self.labels, "n_features": self.n_features, "ngrams": list(self.ngrams), **extra}, f, indent=2)
+
+    def scores(self, text: str) -> np.ndarray:
+        rows = self._features(text)
+        # Binary features, L2-normalised: sum the rows, divide by sqrt(count)
+        return np.add.reduce(self.weights.take(rows, axis=0)) / math.sqrt(len(rows))
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        # A handful of classes: the softmax of the winner is cheaper in plain Python
+        scores = self.scores(text).tolist()
+        best = max(range(len(scores)), key=scores.__getitem__)
+        top = scores[best]
+        return self.labels[best], 1.0 / sum(math.exp(score - top) for score in scores)
+
+    def predict_batch(self, texts: Iterable[str]) -> List[Tuple[str, float]]:
+        """``predict`` for many messages with one gather and one segmented sum."""
+        rows = [self._features(text) for text in texts]
+        if not rows:
+            return []
+        lengths = np.fromiter(map(len, rows), dtype=np.intp, count=len(rows))
+        offsets = np.zeros(len(rows), dtype=np.intp)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        # Every message has at least the bias row, so no segment is empty
+        sums = np.add.reduceat(self.weights.take(np.concatenate(rows), axis=0), offsets, axis=0)
+        probs = _softmax(sums / np.sqrt(lengths)[:, None])
+        best = probs.argmax(axis=1)
+        return [(self.labels[i], float(p)) for i, p in zip(best, probs[np.arange(len(best)), best])]
+
+
+@functools.lru_cache(maxsize=1)
+def model() -> IntentModel:
+    return IntentModel.load()
+
+
+def _accept(text: str, label: str, confidence: float) -> Optional[str]:
+    # Bare numbers are menu choices and IDs, whose meaning depends on the chat state
+    if label == OTHER or confidence < INTENT_MIN_CONFIDENCE or text.strip().isdigit():
+        return None
+    return label
+
+
+def classify(text: str) -> Optional[str]:
+    """The intent of a chat message, or None when it has none (or the model isn't sure)."""
+    return _accept(text, *model().predict(text))
+
+
+def classify_batch(texts: Sequence[str]) -> List[Optional[str]]:
+    return [_accept(text, label, confidence) for text, (label, confidence) in zip(texts, model().predict_batch(texts))]
@@ -1,23 +1,57 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Depends, Header, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import hmac
+import os
 import re
 import logging
 import qrcode
 from io import BytesIO
-from textblob import TextBlob
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
-from . import models, schemas, crud
-from .database import SessionLocal, engine
+from . import models, schemas, crud, catalog, metrics, prompts, analytics, partitions, order_queue, slowlog, qrtoken, logconfig, thumbnails, expiry, intents, rollups, chat
+from .compression import CompressionMiddleware
+from .config import ADMIN_TOKEN, CHAT_BATCH_MAX_MESSAGES
+from .ratelimit import rate_limit
+from .database import StickyPrimaryMiddleware, engine, bind_user, get_db
+from .serialization import DefaultResponse, RestaurantAdapter, RestaurantListAdapter, MenuItemListAdapter, OrderHistoryPageAdapter, render, json_response, restaurants_payload, menu_items_payload
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
 # Initialize FastAPI app
-app = FastAPI(title="Food Delivery API", version="1.0.0")
+app = FastAPI(title="Food Delivery API", version="1.0.0", default_response_class=DefaultResponse)
+
+@app.on_event("startup")
+def create_upcoming_partitions():
+    # No-op unless the order tables are partitioned (Postgres only)
+    partitions.ensure_partitions(engine)
+
+@app.on_event("startup")
+def start_expiry():
+    # Cancels abandoned pending orders and payments in the background
+    expiry.start()
+
+@app.on_event("shutdown")
+def stop_expiry():
+    expiry.stop()
+
+@app.on_event("startup")
+def start_rollup_fold():
+    # Folds the sales deltas appended by checkouts into the analytics rollups
+    rollups.start()
+
+@app.on_event("shutdown")
+def stop_rollup_fold():
+    rollups.stop()
+
+@app.on_event("startup")
+def load_intent_model():
+    # Map the classifier's weights now rather than on the first chat message
+    intents.model()
 
 # Track user sessions and states
 user_sessions = {}
@@ -31,15 +65,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+app.include_router(analytics.router)
+# Cart and order steps of the chat under /chat/...; the free-text /chat and /chat/batch are below
+app.include_router(chat.router)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# gzip/brotli for large JSON bodies (menus, order details); see config.py
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(StickyPrimaryMiddleware)
+app.add_middleware(slowlog.SlowQueryContextMiddleware)
+app.add_middleware(logconfig.RequestIdMiddleware)
+
+logconfig.configure()
+logger = logging.getLogger(__name__)
 
 class Message(BaseModel):
     role: str
@@ -50,6 +87,14 @@ class ChatRequest(BaseModel):
     order_id: Optional[int] = None
     user_id: Optional[str] = "default"  # Default user ID if not provided
 
+class BatchChatMessage(BaseModel):
+    user_id: str
+    message: str
+    order_id: Optional[int] = None
+
+class BatchChatRequest(BaseModel):
+    messages: List[BatchChatMessage] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_MESSAGES)
+
 class ChatResponse(BaseModel):
     response: str
     detected_order_id: Optional[int] = None
@@ -93,21 +138,139 @@ def generate_qr_code(data: str) -> BytesIO:
     img_byte_array.seek(0)
     return img_byte_array
 
+def payment_qr_url(order: models.Order) -> str:
+    """QR code link for the chat "pay now" reply, with a token so fetching it skips the database."""
+    token = qrtoken.issue(order.id, order.total, order.restaurant.name)
+    return f"http://localhost:8000/get_qr_code/{order.id}?token={token}"
+
 @app.get("/get_qr_code/{order_id}")
-async def get_qr_code(order_id: int, db: Session = Depends(get_db)):
+async def get_qr_code(order_id: int, token: Optional[str] = None, db: Session = Depends(get_db)):
     """Get QR code for order payment."""
-    order = crud.get_order(db, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    payment = db.query(models.Payment).filter(models.Payment.order_id == order_id).first()
-    if not payment or payment.status != "pending":
-        raise HTTPException(status_code=400, detail="No pending payment for this order")
-    
-    qr_data = f"Payment for Order #{order_id}\nAmount: ${order.total:.2f}\nRestaurant: {order.restaurant.name}"
+    claims = qrtoken.verify(token, order_id)
+    if claims:
+        amount, restaurant_name = claims["amount"], claims["restaurant"]
+    else:
+        # No token, or an expired one: check the order still awaits payment
+        order = crud.get_order(db, order_id)
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
+
+        payment = crud.get_order_payment(db, order_id)
+        if not payment or payment.status != "pending":
+            raise HTTPException(status_code=400, detail="No pending payment for this order")
+        amount, restaurant_name = order.total, order.restaurant.name
+
+    qr_data = f"Payment for Order #{order_id}\nAmount: ${amount:.2f}\nRestaurant: {restaurant_name}"
     qr_code = generate_qr_code(qr_data)
     return StreamingResponse(qr_code, media_type="image/png")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Counters in the Prometheus text format."""
+    return metrics.render()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Closed unless ADMIN_TOKEN is configured; constant-time so timing doesn't leak it
+    if not ADMIN_TOKEN or x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def read_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Recent statements slower than SLOW_QUERY_MS, newest first, with sampled EXPLAIN plans."""
+    return {"threshold_ms": slowlog.SLOW_QUERY_MS, "queries": slowlog.recent(limit)}
+
+# Catalog endpoints used by the order form (FE/src/components/CreateOrder.jsx).
+# Bodies are cached per catalog version and revalidated with ETag/Last-Modified,
+# so a 304 rarely needs a query. response_model is only used for the docs.
+@app.get("/restaurants/", response_model=List[schemas.Restaurant])
+def read_restaurants(request: Request, db: Session = Depends(get_db)):
+    return catalog.conditional_response(
+        request, request.url.path,
+        lambda: render(RestaurantListAdapter, restaurants_payload(crud.list_restaurants(db)), trusted=True),
+    )
+
+@app.get("/restaurants/{restaurant_id}", response_model=schemas.Restaurant)
+def read_restaurant(restaurant_id: int, request: Request, db: Session = Depends(get_db)):
+    # An ETag covers the whole catalog, so check the restaurant exists before answering 304
+    if restaurant_id not in catalog.restaurant_ids(db):
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+
+    def build():
+        restaurant = crud.get_restaurant(db, restaurant_id)
+        if not restaurant:
+            raise HTTPException(status_code=404, detail="Restaurant not found")
+        return render(RestaurantAdapter, restaurant)
+    return catalog.conditional_response(request, request.url.path, build)
+
+@app.get("/restaurants/{restaurant_id}/menu", response_model=List[schemas.MenuItem])
+def read_menu_items(restaurant_id: int, request: Request, db: Session = Depends(get_db)):
+    return catalog.conditional_response(
+        request, request.url.path,
+        lambda: render(MenuItemListAdapter, menu_items_payload(crud.list_menu_items(db, restaurant_id)), trusted=True),
+    )
+
+@app.post("/admin/thumbnails", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_admin)])
+def build_thumbnails(background_tasks: BackgroundTasks, force: bool = False):
+    """Generate missing thumbnails after responding; catalog responses pick them up once it commits.
+
+    Large catalogs are better served by ``python -m BE.scripts.build_thumbnails``.
+    """
+    if thumbnails.building():
+        raise HTTPException(status_code=409, detail="A thumbnail build is already running")
+    background_tasks.add_task(thumbnails.build_in_background, force)
+    return {"status": "started"}
+
+@app.get("/thumbnails/{name}")
+def read_thumbnail(name: str):
+    """A generated image variant. Names are content hashes, so they can be cached forever."""
+    path = thumbnails.path_for(name)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    media_type = thumbnails.FORMATS[name.rsplit(".", 1)[1]][1]
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": thumbnails.CACHE_CONTROL})
+
+@app.get("/users/{user_id}/orders", response_model=schemas.OrderHistoryPage)
+def read_user_orders(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """A page of the user's order history; pass ``next_cursor`` back to get the next one."""
+    try:
+        orders, next_cursor = crud.get_user_orders(db, user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response(OrderHistoryPageAdapter, {"orders": orders, "next_cursor": next_cursor}, trusted=True)
+
+@app.get("/restaurants/{restaurant_id}/queue", response_model=schemas.OrderQueuePage)
+async def read_order_queue(
+    restaurant_id: int,
+    cursor: Optional[str] = None,
+    wait: float = Query(25, ge=0, le=60),
+    db: Session = Depends(get_db),
+):
+    """The restaurant's active orders for kitchen tablets (long-poll).
+
+    Without a usable cursor the full queue is returned with ``reset`` set.
+    Otherwise the call waits up to ``wait`` seconds for news: new orders come
+    back as ``changes``, any other change as the full queue with ``reset``.
+    Pass ``cursor`` back on the next call.
+    """
+    return await order_queue.poll(db, restaurant_id, cursor, wait)
+
+def _not_payable(user_id: str, order_id: int, error: crud.OrderNotPayableError) -> Dict[str, Any]:
+    # The order was cancelled (e.g. expired) or moved on since the menu was shown
+    update_user_session(user_id, state="default")
+    return {"response": f"Order #{order_id} can no longer be paid, it is {error.status}.", "state": "default"}
+
+def _confirm_cancellation(user_id: str) -> Dict[str, Any]:
+    # Cancelling waits for the order ID, so a misclassified message cancels nothing
+    update_user_session(user_id, state="cancellation_flow")
+    return {"response": "Please confirm your order ID to proceed with cancellation.", "state": "cancellation_flow"}
+
 def generate_order_summary(order: models.Order, db: Session) -> str:
     try:
         restaurant = db.query(models.Restaurant).get(order.restaurant_id)
@@ -138,16 +301,25 @@ def generate_order_summary(order: models.Order, db: Session) -> str:
         return summary
 
     except Exception as e:
-        logger.error(f"Error in order summary: {e}")
+        logger.error("Error in order summary: %s", e)
         return "Your order has been placed successfully!"
     
 
 
 
-@app.post("/chat")
-async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
+# States whose menu offers "cancel this order" and cancel the current order
+# themselves: on the exact option, or after a confirmation for a classified intent
+OWN_CANCEL_OPTION_STATES = ("post_order", "managing_order", "payment_initiated")
+
+
+@app.post("/chat", dependencies=[Depends(rate_limit("chat"))])
+def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
     try:
-        logger.info(f"Received chat request: {request}")
+        # Only a summary: the full history grows with every turn
+        logger.info(
+            "Received chat request from %s with %d messages", request.user_id, len(request.messages),
+            extra={"user_id": request.user_id, "order_id": request.order_id},
+        )
 
         messages = request.messages
         if not messages:
@@ -156,13 +328,17 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
         user_message = messages[-1].content.strip()
         order_id = request.order_id
         user_id = request.user_id
+        bind_user(db, user_id)
         session = get_user_session(user_id)
         current_state = session["state"]
+        slowlog.annotate(chat_state=current_state)
+        # Menu options are matched exactly; free text goes through the classifier
+        intent = intents.classify(user_message)
 
-        logger.info(f"Processing message: {user_message}, order_id: {order_id}, state: {current_state}")
+        logger.info("Processing message: %s, order_id: %s, state: %s", user_message, order_id, current_state)
 
         # Handle cancel order flow
-        if "cancel order" in user_message.lower() or current_state == "cancellation_flow":
+        if current_state == "cancellation_flow" or (intent == "cancel_order" and current_state not in OWN_CANCEL_OPTION_STATES):
             if current_state != "cancellation_flow":
                 update_user_session(user_id, state="cancellation_flow")
                 return {
@@ -175,7 +351,7 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                 order_id = int(user_message)
                 try:
                     # Use the cancel_order endpoint
-                    response = await cancel_order(order_id, db)
+                    response = cancel_order(order_id, db)
                     
                     # Add refund timeline and agent support options
                     if "refund" in response["message"].lower():
@@ -197,15 +373,15 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
 
         # Handle post-cancellation options
         if current_state == "post_cancellation":
-            if user_message.lower() in ["1", "talk to agent", "agent"]:
+            if user_message.lower() in ["1", "talk to agent", "agent"] or intent == "talk_to_agent":
                 return {
                     "response": "Connecting you to a real agent. Please wait a moment...\n\nIn the meantime, you can:\n1. Place a new order\n2. Track another order",
                     "state": "default"
                 }
-            elif user_message.lower() in ["2", "new order", "place order"]:
+            elif user_message.lower() in ["2", "new order", "place order"] or intent == "new_order":
                 update_user_session(user_id, state="default")
                 return {"response": "Let's place a new order! Type 'new order' to begin.", "state": "default"}
-            elif user_message.lower() in ["3", "track", "track order"]:
+            elif user_message.lower() in ["3", "track", "track order"] or intent == "track_order":
                 update_user_session(user_id, state="default")
                 return {"response": "Please enter the order ID you'd like to track.", "state": "default"}
 
@@ -225,44 +401,38 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
 
         # Handle post-order options
         if current_state == "post_order":
-            if user_message.lower() in ["1", "track", "track order"]:
+            if user_message.lower() in ["1", "track", "track order"] or intent == "track_order":
                 return {"response": f"Tracking order #{session['current_order_id']}...", "state": "tracking"}
-            elif user_message.lower() in ["2", "cancel", "cancel order"]:
-                update_user_session(user_id, state="cancellation_flow")
-                return {
-                    "response": "Please confirm your order ID to proceed with cancellation.",
-                    "state": "cancellation_flow"
-                }
-            elif user_message.lower() in ["3", "agent", "talk to agent"]:
+            elif user_message.lower() in ["2", "cancel", "cancel order"] or intent == "cancel_order":
+                return _confirm_cancellation(user_id)
+            elif user_message.lower() in ["3", "agent", "talk to agent"] or intent == "talk_to_agent":
                 return {
                     "response": "Connecting you to a real agent. Please wait a moment...",
                     "state": "default"
                 }
 
         # Reset state for new actions
-        if any(kw in user_message.lower() for kw in ["new order", "track", "status", "where", "check", "manage"]):
+        if intent in ("new_order", "track_order"):
             update_user_session(user_id, state="default")
 
         # Handle track order
-        if any(kw in user_message.lower() for kw in ["track", "status", "where", "check"]):
+        if intent == "track_order":
             if order_id:
                 order = crud.get_order(db, order_id)
                 if order:
                     details = crud.get_order_details(db, order_id)
                     response = f"Order #{order_id} Status: {order.status}\nTotal: ${order.total:.2f}"
                     
-                    if details and hasattr(details, 'order_items'):
+                    if details and details["items"]:
                         response += "\nItems:\n"
-                        for item in details.order_items:
-                            menu_item = db.query(models.MenuItem).get(item.menu_item_id)
-                            if menu_item:
-                                response += f"- {menu_item.name}: ${item.price:.2f}\n"
+                        for item in details["items"]:
+                            response += f"- {item['name']}: ${item['price']:.2f}\n"
                     
-                    if details and hasattr(details, 'payment'):
-                        response += f"\nPayment: {details.payment.status}"
+                    if details and details["payment"]:
+                        response += f"\nPayment: {details['payment']['status']}"
                     
                     # Add next steps based on order status
-                    if order.status == "pending" and (not details.payment or details.payment.status != "completed"):
+                    if order.status == "pending" and (not details["payment"] or details["payment"]["status"] != "completed"):
                         response += "\n\nWould you like to:\n1. Pay Now\n2. Cancel Order"
                         update_user_session(user_id, state="managing_order", current_order_id=order_id)
                     else:
@@ -275,17 +445,16 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                 return {"response": "Please enter your order ID to track your order."}
 
         # Handle new order
-        if "new order" in user_message.lower():
-            restaurants = db.query(models.Restaurant).all()
-            if restaurants:
-                response = "Choose a restaurant:\n" + "\n".join(f"{r.id}. {r.name} ({r.cuisine})" for r in restaurants)
+        if intent == "new_order":
+            response = prompts.restaurant_list(db)
+            if response:
                 update_user_session(user_id, state="selecting_restaurant")
                 return {"response": response, "state": "selecting_restaurant"}
             return {"response": "No restaurants available at the moment."}
 
         # Handle payment selection state
         if current_state == "awaiting_payment":
-            if user_message.lower() in ["1", "pay now", "pay", "payment"]:
+            if user_message.lower() in ["1", "pay now", "pay", "payment"] or intent == "pay_now":
                 if session["current_order_id"]:
                     order = crud.get_order(db, session["current_order_id"])
                     if order:
@@ -296,13 +465,17 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                             method="online",
                             status="pending"
                         )
-                        payment = crud.create_payment(db, payment_data)
-                        
+                        try:
+                            payment = crud.create_payment(db, payment_data)
+                        except crud.OrderNotPayableError as e:
+                            return _not_payable(user_id, session["current_order_id"], e)
+                        qr_code_url = payment_qr_url(order)
+
                         response = (
                             f"Please scan the QR code to complete your payment of ${order.total:.2f}.\n"
                             f"Order #{session['current_order_id']}\n"
                             f"Restaurant: {order.restaurant.name}\n\n"
-                            f"QR Code URL: http://localhost:8000/get_qr_code/{session['current_order_id']}\n\n"
+                            f"QR Code URL: {qr_code_url}\n\n"
                             f"Would you like to:\n"
                             f"1. Cancel this order\n"
                             f"2. Track this order\n"
@@ -312,12 +485,12 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                         return {
                             "response": response,
                             "order_id": session["current_order_id"],
-                            "qr_code_url": f"http://localhost:8000/get_qr_code/{session['current_order_id']}",
+                            "qr_code_url": qr_code_url,
                             "state": "payment_initiated"
                         }
                 return {"response": "Order not found. Please try placing a new order."}
             
-            elif user_message.lower() in ["2", "cod", "cash on delivery"]:
+            elif user_message.lower() in ["2", "cod", "cash on delivery"] or intent == "cash_on_delivery":
                 if session["current_order_id"]:
                     order = crud.get_order(db, session["current_order_id"])
                     if order:
@@ -328,7 +501,10 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                             method="cod",
                             status="pending"
                         )
-                        payment = crud.create_payment(db, payment_data)
+                        try:
+                            payment = crud.create_payment(db, payment_data)
+                        except crud.OrderNotPayableError as e:
+                            return _not_payable(user_id, session["current_order_id"], e)
                         
                         response = (
                             f"Cash on Delivery selected for Order #{session['current_order_id']}.\n"
@@ -351,7 +527,7 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
 
         # Handle managing order state
         if current_state == "managing_order":
-            if user_message.lower() in ["1", "pay now", "pay", "payment"]:
+            if user_message.lower() in ["1", "pay now", "pay", "payment"] or intent == "pay_now":
                 if session["current_order_id"]:
                     order = crud.get_order(db, session["current_order_id"])
                     if order:
@@ -362,13 +538,17 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                             method="online",
                             status="pending"
                         )
-                        payment = crud.create_payment(db, payment_data)
-                        
+                        try:
+                            payment = crud.create_payment(db, payment_data)
+                        except crud.OrderNotPayableError as e:
+                            return _not_payable(user_id, session["current_order_id"], e)
+                        qr_code_url = payment_qr_url(order)
+
                         response = (
                             f"Please scan the QR code to complete your payment of ${order.total:.2f}.\n"
                             f"Order #{session['current_order_id']}\n"
                             f"Restaurant: {order.restaurant.name}\n\n"
-                            f"QR Code URL: http://localhost:8000/get_qr_code/{session['current_order_id']}\n\n"
+                            f"QR Code URL: {qr_code_url}\n\n"
                             f"Would you like to:\n"
                             f"1. Cancel this order\n"
                             f"2. Track this order\n"
@@ -378,7 +558,7 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                         return {
                             "response": response,
                             "order_id": session["current_order_id"],
-                            "qr_code_url": f"http://localhost:8000/get_qr_code/{session['current_order_id']}",
+                            "qr_code_url": qr_code_url,
                             "state": "payment_initiated"
                         }
                 return {"response": "Order not found. Please try placing a new order."}
@@ -387,12 +567,15 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                 if session["current_order_id"]:
                     try:
                         # Use the new cancel_order endpoint
-                        response = await cancel_order(session["current_order_id"], db)
+                        response = cancel_order(session["current_order_id"], db)
                         update_user_session(user_id, state="default")
                         return {"response": response["message"], "state": "default"}
                     except HTTPException as e:
                         return {"response": e.detail, "state": "managing_order"}
                 return {"response": "Order not found. Please try placing a new order."}
+
+            elif intent == "cancel_order":
+                return _confirm_cancellation(user_id)
             
             else:
                 return {
@@ -404,14 +587,16 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
         if current_state == "payment_initiated":
             if user_message.lower() in ["1", "cancel", "cancel order"]:
                 try:
-                    response = await cancel_order(session["current_order_id"], db)
+                    response = cancel_order(session["current_order_id"], db)
                     update_user_session(user_id, state="default")
                     return {"response": response["message"], "state": "default"}
                 except HTTPException as e:
                     return {"response": e.detail, "state": "payment_initiated"}
-            elif user_message.lower() in ["2", "track", "track order"]:
+            elif intent == "cancel_order":
+                return _confirm_cancellation(user_id)
+            elif user_message.lower() in ["2", "track", "track order"] or intent == "track_order":
                 return {"response": f"Tracking order #{session['current_order_id']}...", "state": "tracking"}
-            elif user_message.lower() in ["3", "agent", "talk to agent"]:
+            elif user_message.lower() in ["3", "agent", "talk to agent"] or intent == "talk_to_agent":
                 return {
                     "response": "Connecting you to a real agent. Please wait a moment...",
                     "state": "default"
@@ -429,20 +614,11 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
             # If last message was a restaurant menu prompt
             prev_msg = messages[-2].content.lower() if len(messages) > 1 else ""
             if "choose a restaurant" in prev_msg:
-                restaurant = db.query(models.Restaurant).get(user_number)
-                if restaurant:
-                    menu = db.query(models.MenuItem).filter(models.MenuItem.restaurant_id == user_number).all()
-                    if menu:
-                        menu_text = f"Menu for {restaurant.name}:\n"
-                        for item in menu:
-                            menu_text += f"{item.id}. {item.name} - ${item.price:.2f}\n"
-                            if item.description:
-                                menu_text += f"   {item.description}\n"
-                        menu_text += "\nEnter the number of the item you want to order."
-                        update_user_session(user_id, state="selecting_menu_item", last_restaurant_id=user_number)
-                        return {"response": menu_text, "state": "selecting_menu_item"}
-                    return {"response": "No menu items available for this restaurant."}
-                return {"response": "Invalid restaurant selection."}
+                has_menu, menu_text = prompts.restaurant_menu(db, user_number)
+                if has_menu:
+                    update_user_session(user_id, state="selecting_menu_item", last_restaurant_id=user_number)
+                    return {"response": menu_text, "state": "selecting_menu_item"}
+                return {"response": menu_text}
 
             # If last message was a menu display
             elif "menu for" in prev_msg.lower():
@@ -494,8 +670,7 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                             "state": "awaiting_payment"
                         }
                     except Exception as e:
-                        logger.error(f"Error creating order: {str(e)}")
-                        logger.exception("Full traceback:")
+                        logger.exception("Error creating order: %s", e)
                         return {"response": "Sorry, there was an error creating your order. Please try again."}
                 return {"response": "Invalid menu item selection."}
 
@@ -505,18 +680,16 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
                 details = crud.get_order_details(db, user_number)
                 response = f"Order #{user_number} Status: {order.status}\nTotal: ${order.total:.2f}"
                 
-                if details and hasattr(details, 'order_items'):
+                if details and details["items"]:
                     response += "\nItems:\n"
-                    for item in details.order_items:
-                        menu_item = db.query(models.MenuItem).get(item.menu_item_id)
-                        if menu_item:
-                            response += f"- {menu_item.name}: ${item.price:.2f}\n"
+                    for item in details["items"]:
+                        response += f"- {item['name']}: ${item['price']:.2f}\n"
                 
-                if details and hasattr(details, 'payment'):
-                    response += f"\nPayment: {details.payment.status}"
+                if details and details["payment"]:
+                    response += f"\nPayment: {details['payment']['status']}"
                 
                 # Add next steps based on order status
-                if order.status == "pending" and (not details.payment or details.payment.status != "completed"):
+                if order.status == "pending" and (not details["payment"] or details["payment"]["status"] != "completed"):
                     response += "\n\nWould you like to:\n1. Pay Now\n2. Cancel Order"
                     update_user_session(user_id, state="managing_order", current_order_id=user_number)
                 else:
@@ -534,39 +707,108 @@ async def chat_with_bot(request: ChatRequest, db: Session = Depends(get_db)):
 
     except Exception as e:
         logger.exception("Error in /chat endpoint")
+        # Leave the session usable (/chat/batch carries on with it)
+        db.rollback()
         return {"response": "Something went wrong. Please try again later."}
 
-@app.post("/cancel_order/{order_id}")
-async def cancel_order(order_id: int, db: Session = Depends(get_db)):
-    """Cancel an order and process refund if applicable."""
-    order = crud.get_order(db, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Check if order can be cancelled
-    if order.status not in ["pending", "confirmed"]:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Order cannot be cancelled in its current status: {order.status}"
+def _batch_costs(body) -> Dict[str, float]:
+    # One token per message, from the bucket of the user who sent it
+    costs: Dict[str, float] = {}
+    messages = body.get("messages") if isinstance(body, dict) else None
+    for item in messages if isinstance(messages, list) else ():
+        if isinstance(item, dict) and item.get("user_id") is not None:
+            costs[str(item["user_id"])] = costs.get(str(item["user_id"]), 0) + 1
+    return costs
+
+# States whose replies are numbered menu options, so a number there is no ID
+NUMBERED_OPTION_STATES = ("post_cancellation", "post_order", "awaiting_payment", "managing_order", "payment_initiated")
+
+def _number_kind(state: str, last_response: str) -> Optional[str]:
+    """What chat_with_bot will read a numeric reply as: "order", "restaurant", "menu_item" or None."""
+    if state == "cancellation_flow":
+        return "order"
+    if state in NUMBERED_OPTION_STATES:
+        return None
+    last_response = last_response.lower()
+    if "choose a restaurant" in last_response:
+        return "restaurant"
+    if "menu for" in last_response:
+        return "menu_item"
+    return "order"
+
+def _prefetch_batch(db: Session, messages: List[BatchChatMessage]):
+    """Load what the messages can refer to, given their users' chat states, with crud.prefetch."""
+    ids = {"order": set(), "restaurant": set(), "menu_item": set()}
+    for item in messages:
+        session = get_user_session(item.user_id)
+        if item.order_id:
+            ids["order"].add(item.order_id)
+        if session["current_order_id"]:
+            ids["order"].add(session["current_order_id"])
+        if session["last_restaurant_id"]:
+            ids["restaurant"].add(session["last_restaurant_id"])
+        # A number is an order ID, a restaurant or a menu item depending on the conversation
+        kind = _number_kind(session["state"], session.get("last_response", ""))
+        if kind is not None and item.message.strip().isdigit():
+            ids[kind].add(int(item.message.strip()))
+    if any(ids.values()):
+        crud.prefetch(db, order_ids=ids["order"], restaurant_ids=ids["restaurant"], menu_item_ids=ids["menu_item"])
+
+@app.post("/chat/batch", dependencies=[Depends(rate_limit("chat_batch", costs=_batch_costs))])
+def chat_batch(request: BatchChatRequest, db: Session = Depends(get_db)):
+    """Answer a burst of messaging-gateway messages in one request and one session.
+
+    Messages are answered one after another in the order given, so each
+    user's messages keep their order. The orders, restaurants and menu items
+    they can refer to (explicit order IDs, numeric replies, the users'
+    current orders) are loaded up front with one query per table, and again
+    for the remaining messages after one that commits. Gateways send single
+    messages, so the bot's previous reply to the user stands in for the chat
+    history.
+    """
+    _prefetch_batch(db, request.messages)
+
+    responses = []
+    for i, item in enumerate(request.messages):
+        last_response = get_user_session(item.user_id).get("last_response")
+        history = [Message(role="assistant", content=last_response)] if last_response else []
+        result = chat_with_bot(
+            ChatRequest(
+                messages=history + [Message(role="user", content=item.message)],
+                order_id=item.order_id,
+                user_id=item.user_id,
+            ),
+            db,
         )
-    
-    # Get payment information
-    payment = crud.get_order_payment(db, order_id)
-    
-    # Update order status
-    order.status = "cancelled"
-    db.commit()
-    
-    # Process refund if payment was made
+        update_user_session(item.user_id, last_response=result.get("response", ""))
+        responses.append({"user_id": item.user_id, **result})
+        # A commit expired everything loaded, which would then be read back row by row
+        if any(inspect(row).expired for row in db.info.get("prefetched", ())):
+            db.info["prefetched"] = []
+            _prefetch_batch(db, request.messages[i + 1:])
+    return {"responses": responses}
+
+@app.post("/cancel_order/{order_id}", dependencies=[Depends(rate_limit("cancel_order"))])
+def cancel_order(order_id: int, db: Session = Depends(get_db), version: Optional[int] = None):
+    """Cancel an order and process refund if applicable.
+
+    ``version`` (optional) is the order version the client last saw; 409 if it has changed since.
+    """
+    try:
+        total, refunded = crud.cancel_order(db, order_id, version)
+    except crud.OrderNotFoundError:
+        raise HTTPException(status_code=404, detail="Order not found")
+    except crud.OrderNotCancellableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except crud.ConcurrentUpdateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
     refund_message = ""
-    if payment and payment.status == "completed":
+    if refunded:
         # Here you would integrate with your payment gateway
-        # For now, we'll just update the payment status
-        payment.status = "refunded"
-        db.commit()
-        refund_message = f" A refund of ${order.total:.2f} has been processed."
-    
+        refund_message = f" A refund of ${total:.2f} has been processed."
+
     return {
         "message": f"Order #{order_id} has been cancelled successfully.{refund_message}",
-        "refund_processed": bool(payment and payment.status == "refunded")
+        "refund_processed": refunded
     }
@@ -0,0 +1,45 @@
+# BE/metrics.py
+import threading
+from typing import Dict, Tuple
+
+# Minimal in-process metrics in the Prometheus text format, served at /metrics.
+_lock = threading.Lock()
+_help: Dict[str, Tuple[str, str]] = {}
+_values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+
+def describe(name: str, help_text: str, kind: str = "counter"):
+    _help[name] = (kind, help_text)
+
+
+def inc(name: str, amount: float = 1.0, **labels):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + amount
+
+
+def set_gauge(name: str, value: float, **labels):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _values[key] = value
+
+
+def value(name: str, **labels) -> float:
+    return _values.get((name, tuple(sorted((k, str(v)) for k, v in labels.items()))), 0.0)
+
+
+def render() -> str:
+    with _lock:
+        items = sorted(_values.items())
+    lines = []
+    seen = set()
+    for (name, labels), val in items:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                kind, help_text = _help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{name}{{{label_text}}} {val:g}" if label_text else f"{name} {val:g}")
+    return "\n".join(lines) + "\n"
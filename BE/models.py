@@ -1,9 +1,29 @@
 # BE/models.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, ForeignKeyConstraint, DateTime, Boolean, Text, JSON, Index, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import relationship, foreign
 from BE.base import Base
+from BE.config import DATABASE_URL
 from datetime import datetime
 
+# Orders still in progress, i.e. order_queue.ACTIVE_STATUSES
+ACTIVE_ORDERS_PREDICATE = "status IN ('pending', 'confirmed', 'preparing')"
+
+# On Postgres the order tables are partitioned by their order's created_at
+# (migration partition_orders_by_created_at), so it is part of their primary
+# and foreign keys. SQLite keeps single-column keys, which it can autoincrement.
+PARTITION_KEYED = make_url(DATABASE_URL).get_backend_name() == "postgresql"
+
+
+def _order_key(table: str):
+    """Foreign key from an order child table to its order (indexed on Postgres)."""
+    if not PARTITION_KEYED:
+        return (ForeignKeyConstraint(["order_id"], ["orders.id"], ondelete="CASCADE"),)
+    return (
+        ForeignKeyConstraint(["order_id", "order_created_at"], ["orders.id", "orders.created_at"], ondelete="CASCADE"),
+        Index(f"ix_{table}_order_id_order_created_at", "order_id", "order_created_at"),
+    )
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -18,55 +38,119 @@ class User(Base):
 class Order(Base):
     __tablename__ = "orders"
     
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     restaurant_id = Column(Integer, ForeignKey('restaurants.id', ondelete='SET NULL'), nullable=True)
     items = Column(JSON)  # Store as JSON array
     total = Column(Float)
     status = Column(String, default='pending')
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=PARTITION_KEYED)
+    item_count = Column(Integer, default=0, nullable=False)  # Sum of item quantities, kept by crud.create_order
+    version = Column(Integer, default=1, server_default="1", nullable=False)  # Bumped by every write, see crud.ConcurrentUpdateError
+    delivery_address = Column(String)
+    special_instructions = Column(Text)
     
     user = relationship("User", back_populates="orders")
     restaurant = relationship("Restaurant", back_populates="orders")
-    order_items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
-    payment = relationship("Payment", back_populates="order", uselist=False, cascade="all, delete-orphan")
-    delivery = relationship("Delivery", back_populates="order", uselist=False, cascade="all, delete-orphan")
+    # Child rows carry their order's created_at (the partition key on Postgres,
+    # see partitions.py), so these joins only touch the order's own partition.
+    order_items = relationship(
+        "OrderItem", back_populates="order", cascade="all, delete-orphan",
+        primaryjoin="and_(Order.id == foreign(OrderItem.order_id), Order.created_at == foreign(OrderItem.order_created_at))",
+    )
+    payment = relationship(
+        "Payment", back_populates="order", uselist=False, cascade="all, delete-orphan",
+        primaryjoin="and_(Order.id == foreign(Payment.order_id), Order.created_at == foreign(Payment.order_created_at))",
+    )
+    delivery = relationship(
+        "Delivery", back_populates="order", uselist=False, cascade="all, delete-orphan",
+        primaryjoin="and_(Order.id == foreign(Delivery.order_id), Order.created_at == foreign(Delivery.order_created_at))",
+    )
+
+    __table_args__ = (
+        # Keyset pagination of a user's order history, newest first
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Kitchen queue (order_queue.py): only orders still in progress are indexed
+        Index(
+            "ix_orders_active_queue", "restaurant_id", "status",
+            postgresql_where=text(ACTIVE_ORDERS_PREDICATE),
+            sqlite_where=text(ACTIVE_ORDERS_PREDICATE),
+        ),
+        # Abandoned-order sweep (expiry.py), oldest pending orders first
+        Index(
+            "ix_orders_pending_created_at", "created_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+    # IDs are unique on their own, so they alone identify loaded orders
+    __mapper_args__ = {"primary_key": [id]}
 
 class OrderItem(Base):
     __tablename__ = 'order_items'
     
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=not PARTITION_KEYED)
+    order_id = Column(Integer, nullable=False)
+    order_created_at = Column(DateTime, primary_key=PARTITION_KEYED)  # Copy of orders.created_at, the partition key
     menu_item_id = Column(Integer, ForeignKey('menu_items.id', ondelete='SET NULL'), nullable=True)
     quantity = Column(Integer)
     price = Column(Float(precision=10))
     
-    order = relationship("Order", back_populates="order_items")
+    order = relationship(
+        "Order", back_populates="order_items",
+        primaryjoin="and_(Order.id == foreign(OrderItem.order_id), Order.created_at == foreign(OrderItem.order_created_at))",
+    )
     menu_item = relationship("MenuItem", back_populates="order_items")
 
+    __table_args__ = _order_key("order_items")
+    __mapper_args__ = {"primary_key": [id]}
+
 class Payment(Base):
     __tablename__ = 'payments'
     
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=not PARTITION_KEYED)
+    order_id = Column(Integer, nullable=False)
+    order_created_at = Column(DateTime, primary_key=PARTITION_KEYED)  # Copy of orders.created_at, the partition key
     amount = Column(Float(precision=10))
     payment_date = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default='pending')
     method = Column(String, default='online')
     transaction_id = Column(String, nullable=True)
+    version = Column(Integer, default=1, server_default="1", nullable=False)  # Bumped by every write, see crud.ConcurrentUpdateError
     
-    order = relationship("Order", back_populates="payment")
+    order = relationship(
+        "Order", back_populates="payment",
+        primaryjoin="and_(Order.id == foreign(Payment.order_id), Order.created_at == foreign(Payment.order_created_at))",
+    )
+
+    __table_args__ = (
+        *_order_key("payments"),
+        # Abandoned-payment sweep (expiry.py), oldest pending payments first
+        Index(
+            "ix_payments_pending_payment_date", "payment_date",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
+    __mapper_args__ = {"primary_key": [id]}
 
 class Delivery(Base):
     __tablename__ = 'deliveries'
     
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=not PARTITION_KEYED)
+    order_id = Column(Integer, nullable=False)
+    order_created_at = Column(DateTime, primary_key=PARTITION_KEYED)  # Copy of orders.created_at, the partition key
     delivery_address = Column(String)
     delivery_date = Column(DateTime)
     status = Column(String, default='pending')
     
-    order = relationship("Order", back_populates="delivery")
+    order = relationship(
+        "Order", back_populates="delivery",
+        primaryjoin="and_(Order.id == foreign(Delivery.order_id), Order.created_at == foreign(Delivery.order_created_at))",
+    )
+
+    __table_args__ = _order_key("deliveries")
+    __mapper_args__ = {"primary_key": [id]}
 
 class Restaurant(Base):
     __tablename__ = 'restaurants'
@@ -76,7 +160,9 @@ class Restaurant(Base):
     cuisine = Column(String)
     rating = Column(Float, default=0.0)
     image_url = Column(String)  # Add this for restaurant images
+    image_hash = Column(String)  # Content hash of image_url's thumbnails, set by thumbnails.build
     is_active = Column(Boolean, default=True)
+    order_shard = Column(Integer)  # Shard holding its orders, set on first use (see sharding.py)
     orders = relationship("Order", back_populates="restaurant")
     menu_items = relationship("MenuItem", back_populates="restaurant", cascade="all, delete-orphan")
 
@@ -87,8 +173,70 @@ class MenuItem(Base):
     description = Column(String)
     price = Column(Float(precision=10))
     image_url = Column(String)  # Add this for menu item images
+    image_hash = Column(String)  # Content hash of image_url's thumbnails, set by thumbnails.build
     category = Column(String)   # Add category (e.g., "Appetizers", "Main Course")
     restaurant_id = Column(Integer, ForeignKey('restaurants.id', ondelete='CASCADE'), nullable=False)
     restaurant = relationship("Restaurant", back_populates="menu_items")
     order_items = relationship("OrderItem", back_populates="menu_item")
 
+
+# One row (id 1) whose version is bumped in every transaction that writes
+# restaurants or menu items (see catalog.py); the catalog ETags derive from it.
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Sales rollups, folded in from the deltas crud appends (see rollups.py). No foreign
+# keys, so history survives restaurants or menu items being deleted.
+class RestaurantSalesRollup(Base):
+    __tablename__ = 'restaurant_sales_rollups'
+    restaurant_id = Column(Integer, primary_key=True)
+    granularity = Column(String, primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)  # Placed minus cancelled
+    paid_count = Column(Integer, default=0, nullable=False)
+    cancelled_count = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)  # Totals of orders that weren't cancelled
+
+class ItemSalesRollup(Base):
+    __tablename__ = 'item_sales_rollups'
+    restaurant_id = Column(Integer, primary_key=True)
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    menu_item_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+# Increments not yet folded into the rollups above (rollups.fold): checkouts
+# append here instead of all updating the same hot rollup row.
+class RestaurantSalesDelta(Base):
+    __tablename__ = 'restaurant_sales_deltas'
+    id = Column(Integer, primary_key=True)
+    restaurant_id = Column(Integer, nullable=False)
+    granularity = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    order_count = Column(Integer, default=0, nullable=False)
+    paid_count = Column(Integer, default=0, nullable=False)
+    cancelled_count = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_restaurant_sales_deltas_bucket", "restaurant_id", "granularity", "bucket_start"),
+    )
+
+class ItemSalesDelta(Base):
+    __tablename__ = 'item_sales_deltas'
+    id = Column(Integer, primary_key=True)
+    restaurant_id = Column(Integer, nullable=False)
+    granularity = Column(String, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    menu_item_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_item_sales_deltas_bucket", "restaurant_id", "granularity", "bucket_start"),
+    )
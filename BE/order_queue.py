@@ -0,0 +1,211 @@
+# BE/order_queue.py
+"""Live per-restaurant queue of active orders for kitchen tablets.
+
+Every poll is answered from the database, so it doesn't matter which worker
+serves it or which process (API worker, expiry, a script) changed an order.
+The active orders are read through the partial index on them.
+
+The cursor is a few numbers, however long the queue: a watermark (the
+highest order id the tablet has been sent) and the count, id sum and version
+sum of the active orders up to it. A poll checks those against one aggregate
+query. Unchanged, the only news can be orders above the watermark, which are
+returned as changes; anything else (an order moved on, left the queue, or a
+late commit below the watermark) returns the whole queue with ``reset`` set,
+as does a call without a usable cursor.
+
+While there is nothing new a poll waits without holding a pooled connection.
+It is woken as soon as this worker commits a change for the restaurant, and
+it re-checks every ORDER_QUEUE_RECHECK_SECONDS to catch changes from elsewhere.
+"""
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import case, event, func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from BE import metrics, models, sharding
+from BE.config import ORDER_QUEUE_RECHECK_SECONDS
+
+# Orders a kitchen still has to act on; must match ix_orders_active_queue
+ACTIVE_STATUSES = ("pending", "confirmed", "preparing")
+
+QUEUE_COLUMNS = (
+    models.Order.id,
+    models.Order.version,
+    models.Order.status,
+    models.Order.total,
+    models.Order.item_count,
+    models.Order.created_at,
+)
+
+metrics.describe("order_queue_waiters", "Long-poll requests waiting on a restaurant queue", kind="gauge")
+metrics.describe("order_queue_snapshots_total", "Queue requests answered with a full snapshot")
+
+
+def _event(order_id: int, status: str, total, item_count, created_at: datetime) -> dict:
+    return {
+        "order_id": order_id,
+        "status": status,
+        "active": status in ACTIVE_STATUSES,
+        "total": float(total) if total else 0.0,
+        "item_count": item_count,
+        "created_at": created_at.isoformat() if created_at else None,
+    }
+
+
+def record(db: Session, restaurant_id: Optional[int]):
+    """Wake this worker's pollers of the restaurant's queue when ``db`` commits."""
+    if restaurant_id is None:
+        return
+    db.info.setdefault("order_queue", set()).add(restaurant_id)
+
+
+class QueueHub:
+    """Wake-ups for this worker's waiting polls; the database holds the queue itself."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seqs: Dict[int, int] = {}
+        self._waiters: Dict[int, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+    def seq(self, restaurant_id: int) -> int:
+        with self._lock:
+            return self._seqs.get(restaurant_id, 0)
+
+    def publish(self, restaurant_id: int):
+        with self._lock:
+            self._seqs[restaurant_id] = self._seqs.get(restaurant_id, 0) + 1
+            waiters = self._waiters.pop(restaurant_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    async def wait(self, restaurant_id: int, seq: int, timeout: float) -> bool:
+        """Wait until a change for the restaurant is published after ``seq``; False on timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._seqs.get(restaurant_id, 0) > seq:
+                return True
+            self._waiters.setdefault(restaurant_id, []).append((loop, future))
+        metrics.inc("order_queue_waiters", restaurant_id=restaurant_id)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            metrics.inc("order_queue_waiters", -1, restaurant_id=restaurant_id)
+            with self._lock:
+                waiters = self._waiters.get(restaurant_id, [])
+                if (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                if not waiters:
+                    self._waiters.pop(restaurant_id, None)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Watermark, then the count, id sum and version sum of the active orders up to it
+Fingerprint = Tuple[int, int, int, int]
+
+
+def _fingerprint(rows, watermark: int = 0) -> Fingerprint:
+    watermark = max([watermark] + [row.id for row in rows])
+    return watermark, len(rows), sum(row.id for row in rows), sum(row.version for row in rows)
+
+
+def _encode_cursor(fingerprint: Fingerprint) -> str:
+    return "q" + ".".join(str(n) for n in fingerprint)
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Fingerprint]:
+    """The fingerprint in a cursor, or None when it can't be used."""
+    if not cursor or not cursor.startswith("q"):
+        return None
+    parts = cursor[1:].split(".")
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        return None
+    return tuple(int(part) for part in parts)
+
+
+hub = QueueHub()
+
+
+def _active_filter(restaurant_id: int):
+    return models.Order.restaurant_id == restaurant_id, models.Order.status.in_(ACTIVE_STATUSES)
+
+
+def _active(db: Session, restaurant_id: int, above: int = 0):
+    sharding.use_restaurant(db, restaurant_id)
+    try:
+        return db.execute(
+            select(*QUEUE_COLUMNS)
+            .where(*_active_filter(restaurant_id), models.Order.id > above)
+            .order_by(models.Order.created_at, models.Order.id)
+        ).all()
+    finally:
+        # Hand the connection back to the pool before waiting again
+        db.rollback()
+
+
+def _check(db: Session, restaurant_id: int, watermark: int):
+    """The cursor's fingerprint of the queue as it is now, and whether orders arrived above the watermark."""
+    sharding.use_restaurant(db, restaurant_id)
+    below = models.Order.id <= watermark
+    try:
+        row = db.execute(
+            select(
+                func.coalesce(func.sum(case((below, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((below, models.Order.id), else_=0)), 0),
+                func.coalesce(func.sum(case((below, models.Order.version), else_=0)), 0),
+                func.coalesce(func.max(models.Order.id), 0),
+            ).where(*_active_filter(restaurant_id))
+        ).one()
+    finally:
+        db.rollback()
+    return (watermark, int(row[0]), int(row[1]), int(row[2])), row[3] > watermark
+
+
+def _events(rows) -> List[dict]:
+    return [_event(row.id, row.status, row.total, row.item_count, row.created_at) for row in rows]
+
+
+async def poll(db: Session, restaurant_id: int, cursor: Optional[str], timeout: float) -> dict:
+    """Changes since ``cursor``, waiting up to ``timeout`` seconds for the first one."""
+    known = _parse_cursor(cursor)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while known is not None:
+        # Taken before reading, so a commit during the read still wakes the wait
+        seq = hub.seq(restaurant_id)
+        current, arrived = await run_in_threadpool(_check, db, restaurant_id, known[0])
+        if current != known:
+            break
+        if arrived:
+            rows = await run_in_threadpool(_active, db, restaurant_id, known[0])
+            watermark, count, id_sum, version_sum = _fingerprint(rows, known[0])
+            fingerprint = (watermark, known[1] + count, known[2] + id_sum, known[3] + version_sum)
+            return {"cursor": _encode_cursor(fingerprint), "reset": False, "orders": [], "changes": _events(rows)}
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return {"cursor": cursor, "reset": False, "orders": [], "changes": []}
+        await hub.wait(restaurant_id, seq, min(remaining, ORDER_QUEUE_RECHECK_SECONDS))
+
+    rows = await run_in_threadpool(_active, db, restaurant_id)
+    metrics.inc("order_queue_snapshots_total")
+    return {"cursor": _encode_cursor(_fingerprint(rows)), "reset": True, "orders": _events(rows), "changes": []}
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_on_commit(session):
+    for restaurant_id in session.info.pop("order_queue", ()):
+        hub.publish(restaurant_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("order_queue", None)
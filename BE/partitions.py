@@ -0,0 +1,174 @@
+# BE/partitions.py
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from BE.config import PARTITION_MONTHS_AHEAD, RETENTION_MONTHS, ARCHIVE_DIR
+
+logger = logging.getLogger(__name__)
+
+# On Postgres the order tables are range partitioned by month on the order's
+# creation time (migration partition_orders_by_created_at). Monthly partitions
+# are named <table>_pYYYYMM; the child tables share the orders boundaries.
+PARTITIONED_TABLES = ("orders", "order_items", "payments", "deliveries")
+PARTITION_KEYS = {
+    "orders": "created_at",
+    "order_items": "order_created_at",
+    "payments": "order_created_at",
+    "deliveries": "order_created_at",
+}
+# Referencing tables go first when detaching, orders last
+RETENTION_ORDER = ("order_items", "payments", "deliveries", "orders")
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def _add_months(month: datetime, count: int) -> datetime:
+    month_index = month.year * 12 + month.month - 1 + count
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('orders'))"
+    )).scalar())
+
+
+def monthly_partitions(conn: Connection, table: str) -> List[datetime]:
+    """Month starts of the monthly partitions currently attached to ``table``."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": table}).scalars()
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match and match["table"] == table:
+            months.append(datetime(int(match["year"]), int(match["month"]), 1))
+    return sorted(months)
+
+
+def _bounds(month: datetime) -> str:
+    return f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+
+
+def _stranded(conn: Connection, table: str, month: datetime) -> bool:
+    """True when ``table``'s default partition holds rows for ``month``."""
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": f"{table}_default"}).scalar() is None:
+        return False
+    return bool(conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default "
+        f"WHERE {PARTITION_KEYS[table]} >= :start AND {PARTITION_KEYS[table]} < :end)"
+    ), {"start": month, "end": _add_months(month, 1)}).scalar())
+
+
+def _split_default(conn: Connection, tables: List[str], month: datetime):
+    """Create ``month``'s partitions of ``tables``, moving their rows out of the default partitions.
+
+    Postgres won't attach a partition while the default partition holds rows
+    for its range. Deleting orders from the default partition would cascade to
+    their items, payments and deliveries, so while orders move the foreign keys
+    to orders are dropped, then added back (and checked) once all rows are in place.
+    """
+    foreign_keys = []
+    if "orders" in tables:
+        foreign_keys = conn.execute(text(
+            "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = to_regclass('orders') AND conparentid = 0"
+        )).all()
+    for table, name, _ in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for table in tables:
+        key = PARTITION_KEYS[table]
+        name = f"{table}_p{month:%Y%m}"
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {table}_default WHERE {key} >= :start AND {key} < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), {"start": month, "end": _add_months(month, 1)})
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {_bounds(month)}"))
+    for table, name, definition in foreign_keys:
+        conn.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create any missing monthly partitions from this month to ``months_ahead`` months out.
+
+    Rows that already landed in a default partition for such a month (the
+    partitions weren't created in time) are moved into the new partition.
+    """
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return created
+        this_month = _month_start(datetime.utcnow())
+        existing = {table: set(monthly_partitions(conn, table)) for table in PARTITIONED_TABLES}
+        for offset in range(months_ahead + 1):
+            month = _add_months(this_month, offset)
+            missing = [table for table in PARTITIONED_TABLES if month not in existing[table]]
+            if any(_stranded(conn, table, month) for table in missing):
+                logger.warning("Moving rows for %s out of the default order partitions", f"{month:%Y-%m}")
+                _split_default(conn, missing, month)
+            else:
+                for table in missing:
+                    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} {_bounds(month)}"))
+            created.extend(f"{table}_p{month:%Y%m}" for table in missing)
+    if created:
+        logger.info("Created order partitions: %s", ", ".join(created))
+    return created
+
+
+def _archive(conn: Connection, name: str, archive_dir: str) -> str:
+    """Write a partition's rows to <archive_dir>/<name>.csv.gz using COPY."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        with gzip.open(path + ".tmp", "wb") as archive:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+    finally:
+        cursor.close()
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def archive_old_partitions(engine: Engine, keep_months: int = RETENTION_MONTHS,
+                           archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """Detach, archive and drop monthly partitions older than ``keep_months``.
+
+    Each month is handled in its own transaction: the child partitions are
+    detached, copied to compressed CSV and dropped before the orders
+    partition, so foreign keys never point into a detached table. If
+    archiving fails the transaction rolls back and the partition stays.
+    """
+    if keep_months <= 0:
+        return []
+    archived = []
+    cutoff = _add_months(_month_start(datetime.utcnow()), -keep_months)
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return archived
+        expired = [m for m in monthly_partitions(conn, "orders") if m < cutoff]
+
+    for month in expired:
+        with engine.begin() as conn:
+            for table in RETENTION_ORDER:
+                name = f"{table}_p{month:%Y%m}"
+                if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+                    continue
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                path = _archive(conn, name, archive_dir)
+                conn.execute(text(f"DROP TABLE {name}"))
+                archived.append(path)
+        logger.info("Archived order partitions for %s", f"{month:%Y-%m}")
+    return archived
@@ -0,0 +1,54 @@
+# BE/prompts.py
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session
+from BE import catalog, crud
+
+# Chat texts that only depend on the catalog are rendered once per catalog
+# version (see catalog.cached_text) instead of on every turn.
+
+
+def restaurant_list(db: Session) -> Optional[str]:
+    """The "Choose a restaurant" prompt, or None when there are no restaurants."""
+    def build():
+        restaurants = crud.list_restaurants(db)
+        if not restaurants:
+            return None
+        lines = ["Choose a restaurant:"]
+        lines.extend(f"{r.id}. {r.name} ({r.cuisine})" for r in restaurants)
+        return "\n".join(lines)
+    return catalog.cached_text("chat:restaurants", build)
+
+
+def restaurant_menu(db: Session, restaurant_id: int) -> Tuple[bool, str]:
+    """The menu prompt for a restaurant as ``(has_menu, text)``.
+
+    ``text`` is the error message to show when the restaurant doesn't exist
+    or has no menu items.
+    """
+    def build():
+        restaurant = crud.get_restaurant(db, restaurant_id)
+        if not restaurant:
+            # Not cached, otherwise any number a user types would add an entry
+            return None
+        menu = crud.list_menu_items(db, restaurant_id)
+        if not menu:
+            return False, "No menu items available for this restaurant."
+        parts = [f"Menu for {restaurant.name}:\n"]
+        for item in menu:
+            parts.append(f"{item.id}. {item.name} - ${item.price:.2f}\n")
+            if item.description:
+                parts.append(f"   {item.description}\n")
+        parts.append("\nEnter the number of the item you want to order.")
+        return True, "".join(parts)
+
+    rendered = catalog.cached_text(f"chat:menu:{restaurant_id}", build)
+    if rendered is None:
+        return False, "Invalid restaurant selection."
+    return rendered
+
+
+def full_menu(db: Session) -> str:
+    """Every menu item, one per line, as listed by hello.process_message."""
+    def build():
+        return "\n".join(f"{item.id}. {item.name} - ${item.price:.2f}" for item in crud.list_menu_items(db))
+    return catalog.cached_text("chat:menu:all", build)
@@ -0,0 +1,63 @@
+# BE/qrtoken.py
+"""Signed, expiring tokens carrying what the payment QR code shows.
+
+The chat "pay now" reply links to /get_qr_code/{order_id}?token=..., and the
+payment page re-fetches that URL while it is open. The token embeds the order
+ID, amount and restaurant name under an HMAC, so the QR code can be rendered
+without touching the database until the token expires.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Optional
+from BE.config import QR_TOKEN_SECRET, QR_TOKEN_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+if not QR_TOKEN_SECRET:
+    logger.warning(
+        "QR_TOKEN_SECRET is not set: using a random key for this process, so QR links "
+        "issued by other workers or before a restart are checked against the database"
+    )
+_KEY = (QR_TOKEN_SECRET or secrets.token_hex(32)).encode()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_KEY, payload.encode(), hashlib.sha256).digest())
+
+
+def issue(order_id: int, amount: float, restaurant: str, ttl: float = QR_TOKEN_TTL_SECONDS) -> str:
+    payload = _b64encode(json.dumps(
+        {"o": order_id, "a": round(float(amount), 2), "r": restaurant, "e": int(time.time() + ttl)},
+        separators=(",", ":"),
+    ).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify(token: Optional[str], order_id: int) -> Optional[dict]:
+    """``{"order_id", "amount", "restaurant"}`` for a valid, unexpired token for this order, else None."""
+    if not token:
+        return None
+    payload, _, signature = token.partition(".")
+    # As bytes: compare_digest rejects str arguments with non-ASCII characters
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        data = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("o") != order_id or data.get("e", 0) < time.time():
+        return None
+    return {"order_id": data["o"], "amount": data["a"], "restaurant": data["r"]}
@@ -0,0 +1,186 @@
+# BE/ratelimit.py
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Request
+from BE import metrics
+from BE.config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_BACKEND, REDIS_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("ratelimit_allowed_total", "Requests admitted by the rate limiter")
+metrics.describe("ratelimit_throttled_total", "Requests rejected with 429 by the rate limiter")
+metrics.describe("ratelimit_backend_errors_total", "Rate limiter backend failures (requests were admitted)")
+
+
+# One bucket to charge: (key, refill rate per second, burst, tokens to take)
+Bucket = Tuple[str, float, float, float]
+
+
+class MemoryBackend:
+    """Token buckets held in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}
+
+    async def take(self, buckets: Sequence[Bucket], now: float) -> Tuple[bool, float]:
+        """Take from every bucket, or from none; returns (allowed, seconds until they'd all allow)."""
+        with self._lock:
+            if len(self._buckets) > 100000:
+                self._prune(now)
+            levels = []
+            wait = 0.0
+            for key, rate, burst, cost in buckets:
+                bucket = self._buckets.setdefault(key, [burst, now, burst / rate])
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                levels.append(tokens)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+            for (key, _, _, cost), tokens in zip(buckets, levels):
+                bucket = self._buckets[key]
+                bucket[0] = tokens if wait else tokens - cost
+                bucket[1] = now
+            return not wait, wait
+
+    def _prune(self, now: float):
+        # A bucket idle long enough to refill completely carries no state
+        for key, (_, last, refill) in list(self._buckets.items()):
+            if now - last > refill:
+                del self._buckets[key]
+
+
+class RedisBackend:
+    """Token buckets shared between workers through Redis."""
+
+    # Refill and take from all buckets atomically on the server; state expires
+    # once it would be full again. ARGV: now, then rate, burst, cost per key.
+    SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local burst = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local burst = tonumber(ARGV[i * 3])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - tonumber(ARGV[i * 3 + 1])
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return tostring(wait)
+"""
+
+    def __init__(self, url: str):
+        import redis.asyncio  # optional dependency, only needed for this backend
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    async def take(self, buckets: Sequence[Bucket], now: float) -> Tuple[bool, float]:
+        args = [now]
+        for _, rate, burst, cost in buckets:
+            args.extend((rate, burst, cost))
+        wait = float(await self._script(keys=[f"ratelimit:{b[0]}" for b in buckets], args=args))
+        return not wait, wait
+
+
+def _make_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(REDIS_URL)
+    return MemoryBackend()
+
+
+backend = _make_backend()
+
+
+async def _json_body(request: Request) -> Any:
+    if not request.headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        # FastAPI has already parsed the body, this returns the cached value
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def _user_id(request: Request) -> Optional[str]:
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    if user_id is None:
+        body = await _json_body(request)
+        if isinstance(body, dict) and body.get("user_id") is not None:
+            user_id = body["user_id"]
+    return None if user_id is None else str(user_id)
+
+
+def rate_limit(route: str, rate: float = RATE_LIMIT_RATE, burst: float = RATE_LIMIT_BURST,
+               ip_rate: float = RATE_LIMIT_IP_RATE, ip_burst: float = RATE_LIMIT_IP_BURST,
+               costs: Optional[Callable[[Any], Dict[str, float]]] = None):
+    """Build a dependency that admits requests per (route, client IP) and per (route, user).
+
+    Add it to the route's ``dependencies`` so it runs before ``get_db`` and a
+    throttled request never opens a database session. The user comes from a
+    ``user_id`` path, query or JSON body field when there is one. Clients
+    choose their user_id, so the per-IP bucket is what bounds a client that
+    changes it on every request.
+
+    A request carrying work for several users passes ``costs``, which maps its
+    JSON body to ``{user_id: tokens}``: each user's bucket is charged their
+    tokens and the IP bucket the total. A request costing more than a bucket
+    can ever hold is rejected with 413.
+    """
+
+    async def check(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        client_ip = request.client.host if request.client else "-"
+        charges = costs(await _json_body(request)) if costs is not None else None
+        if charges:
+            buckets = [(f"{route}:ip:{client_ip}", ip_rate, ip_burst, float(sum(charges.values())))]
+            buckets += [(f"{route}:user:{user_id}", rate, burst, float(cost)) for user_id, cost in charges.items()]
+        else:
+            buckets = [(f"{route}:ip:{client_ip}", ip_rate, ip_burst, 1.0)]
+            user_id = await _user_id(request)
+            if user_id is not None:
+                buckets.append((f"{route}:user:{user_id}", rate, burst, 1.0))
+        if any(cost > size for _, _, size, cost in buckets):
+            metrics.inc("ratelimit_throttled_total", route=route)
+            raise HTTPException(status_code=413, detail="Too much work in one request, please split it up.")
+
+        # Wall-clock time so buckets agree across processes sharing Redis
+        try:
+            allowed, retry_after = await backend.take(buckets, time.time())
+        except Exception:
+            logger.exception("Rate limiter backend failed, admitting request")
+            metrics.inc("ratelimit_backend_errors_total", route=route)
+            return
+
+        if allowed:
+            metrics.inc("ratelimit_allowed_total", route=route)
+            return
+        metrics.inc("ratelimit_throttled_total", route=route)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please slow down.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    return check
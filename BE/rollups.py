@@ -0,0 +1,385 @@
+# BE/rollups.py
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+from BE import metrics, models, sharding
+from BE.config import ROLLUP_FOLD_BATCH_SIZE, ROLLUP_FOLD_INTERVAL_SECONDS
+from BE.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("rollup_deltas_folded_total", "Sales deltas folded into the rollups")
+metrics.describe("rollup_fold_errors_total", "Rollup fold runs that failed")
+
+# Orders are counted in the buckets of their created_at, so a later payment
+# or cancellation adjusts the same hour/day the order was placed in.
+GRANULARITIES = ("hour", "day")
+
+# An order counts as paid once it has a payment in one of these statuses (a
+# refund doesn't undo it); crud and backfill both count it at most once
+PAID_PAYMENT_STATUSES = ("completed", "refunded")
+
+RESTAURANT_KEYS = ("restaurant_id", "granularity", "bucket_start")
+ITEM_KEYS = ("restaurant_id", "granularity", "bucket_start", "menu_item_id")
+
+# Crud appends deltas in the order's transaction; fold() adds them to the rollups
+FOLDS = (
+    (models.RestaurantSalesRollup, models.RestaurantSalesDelta, RESTAURANT_KEYS),
+    (models.ItemSalesRollup, models.ItemSalesDelta, ITEM_KEYS),
+)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _merge(rows: Iterable[Dict], keys: Tuple[str, ...]) -> Dict[tuple, Dict]:
+    """Sum the values of rows with the same keys."""
+    merged: Dict[tuple, Dict] = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        if key in merged:
+            for column, amount in row.items():
+                if column not in keys:
+                    merged[key][column] += amount
+        else:
+            merged[key] = {column: row[column] for column in row}
+    return merged
+
+
+def _upsert_for(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _add_to_rollups(db: Session, model, keys: Tuple[str, ...], rows: List[Dict]):
+    """Add each row's values onto the rollup rows with the same keys."""
+    table = model.__table__
+    value_columns = [c for c in rows[0] if c not in keys]
+    upsert = _upsert_for(db.get_bind(model.__mapper__).dialect.name)
+    if upsert is not None:
+        stmt = upsert(table).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={c: table.c[c] + stmt.excluded[c] for c in value_columns},
+        ))
+        return
+    # Without an upsert: two folds creating the same bucket at once fail one
+    # of them on the primary key, and its deltas are folded on the next run
+    for row in rows:
+        updated = db.execute(
+            table.update()
+            .where(*(table.c[k] == row[k] for k in keys))
+            .values({c: table.c[c] + row[c] for c in value_columns})
+        ).rowcount
+        if not updated:
+            db.execute(table.insert().values(row))
+
+
+def _rows(restaurant_id: Optional[int], created_at: datetime, sign: int,
+          order_delta: Dict[str, float], items: Iterable[Tuple[int, int, float]] = ()):
+    order_rows, item_rows = [], []
+    if restaurant_id is None or created_at is None:
+        return order_rows, item_rows
+    items = list(items)
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(created_at, granularity)
+        order_rows.append({
+            "restaurant_id": restaurant_id, "granularity": granularity, "bucket_start": bucket,
+            "order_count": 0, "paid_count": 0, "cancelled_count": 0, "revenue": 0.0,
+            **order_delta,
+        })
+        for menu_item_id, quantity, price in items:
+            if menu_item_id is None:
+                continue
+            item_rows.append({
+                "restaurant_id": restaurant_id, "granularity": granularity, "bucket_start": bucket,
+                "menu_item_id": menu_item_id,
+                "quantity": sign * quantity, "revenue": sign * float(price) * quantity,
+            })
+    return order_rows, item_rows
+
+
+def _append(db: Session, order_rows: List[Dict], item_rows: List[Dict]):
+    # Plain inserts: concurrent checkouts for one restaurant don't queue on
+    # the same rollup row, and any dialect can run them
+    if order_rows:
+        db.execute(insert(models.RestaurantSalesDelta), order_rows)
+    if item_rows:
+        db.execute(insert(models.ItemSalesDelta), item_rows)
+
+
+def _apply(db: Session, restaurant_id: Optional[int], created_at: datetime, sign: int,
+           order_delta: Dict[str, float], items: Iterable[Tuple[int, int, float]] = ()):
+    order_rows, item_rows = _rows(restaurant_id, created_at, sign, order_delta, items)
+    _append(db, order_rows, item_rows)
+
+
+# Called by crud inside the transaction that changes the order
+def record_order_created(db: Session, order: models.Order, items: Iterable[models.OrderItem]):
+    _apply(db, order.restaurant_id, order.created_at, 1,
+           {"order_count": 1, "revenue": float(order.total or 0.0)},
+           [(i.menu_item_id, i.quantity, i.price) for i in items])
+
+
+def record_order_paid(db: Session, restaurant_id: Optional[int], created_at: datetime):
+    """Count the order as paid; call it for the order's first payment in PAID_PAYMENT_STATUSES only."""
+    _apply(db, restaurant_id, created_at, 1, {"paid_count": 1})
+
+
+def record_order_cancelled(db: Session, order_id: int, restaurant_id: Optional[int],
+                           created_at: datetime, total: float):
+    items = db.execute(
+        select(models.OrderItem.menu_item_id, models.OrderItem.quantity, models.OrderItem.price)
+        .where(models.OrderItem.order_id == order_id, models.OrderItem.order_created_at == created_at)
+    ).all()
+    _apply(db, restaurant_id, created_at, -1,
+           {"order_count": -1, "cancelled_count": 1, "revenue": -float(total or 0.0)},
+           items)
+
+
+def record_orders_cancelled(db: Session, orders):
+    """``record_order_cancelled`` for a batch of orders (rows with id, restaurant_id, created_at, total).
+
+    Reads the items of all of them at once and appends the deltas in two inserts.
+    """
+    if not orders:
+        return
+    items_by_order: Dict[int, List] = defaultdict(list)
+    for item in db.execute(
+        select(models.OrderItem.order_id, models.OrderItem.menu_item_id, models.OrderItem.quantity, models.OrderItem.price)
+        .where(tuple_(models.OrderItem.order_id, models.OrderItem.order_created_at).in_([(o.id, o.created_at) for o in orders]))
+    ):
+        items_by_order[item.order_id].append((item.menu_item_id, item.quantity, item.price))
+
+    order_rows, item_rows = [], []
+    for order in orders:
+        rows = _rows(order.restaurant_id, order.created_at, -1,
+                     {"order_count": -1, "cancelled_count": 1, "revenue": -float(order.total or 0.0)},
+                     items_by_order[order.id])
+        order_rows.extend(rows[0])
+        item_rows.extend(rows[1])
+    _append(db, order_rows, item_rows)
+
+
+def fold(db: Session, batch_size: int = ROLLUP_FOLD_BATCH_SIZE) -> int:
+    """Fold a batch of deltas on the selected shard into the rollups; returns deltas folded.
+
+    Deltas are claimed with ``FOR UPDATE SKIP LOCKED`` (Postgres) and deleted
+    in the transaction that adds them to the rollups, so several workers can
+    fold at once without counting one twice.
+    """
+    folded = 0
+    for rollup, delta, keys in FOLDS:
+        table = delta.__table__
+        claimed = db.execute(
+            select(table).order_by(table.c.id).limit(batch_size).with_for_update(skip_locked=True)
+        ).mappings().all()
+        if not claimed:
+            continue
+        db.execute(delete(table).where(table.c.id.in_([row["id"] for row in claimed])))
+        merged = _merge(({c: v for c, v in row.items() if c != "id"} for row in claimed), keys)
+        _add_to_rollups(db, rollup, keys, list(merged.values()))
+        folded += len(claimed)
+    db.commit()
+    metrics.inc("rollup_deltas_folded_total", folded)
+    return folded
+
+
+def fold_all() -> int:
+    """Fold the pending deltas on every order shard; returns how many."""
+    total = 0
+    with SessionLocal() as db:
+        for _ in sharding.each_shard(db):
+            while True:
+                count = fold(db)
+                total += count
+                if count < ROLLUP_FOLD_BATCH_SIZE:
+                    break
+    return total
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _loop():
+    while not _stop.wait(ROLLUP_FOLD_INTERVAL_SECONDS):
+        try:
+            fold_all()
+        except Exception:
+            metrics.inc("rollup_fold_errors_total")
+            logger.exception("Folding sales deltas failed")
+
+
+def start():
+    """Start the fold thread (unless ROLLUP_FOLD_INTERVAL_SECONDS is 0)."""
+    global _thread
+    if ROLLUP_FOLD_INTERVAL_SECONDS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="rollup-fold", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+
+
+# Dashboard reads: the folded rollups plus the deltas appended since the last fold
+def _in_window(model, restaurant_id: int, granularity: str, start: datetime, end: datetime):
+    return (
+        model.restaurant_id == restaurant_id,
+        model.granularity == granularity,
+        model.bucket_start >= start,
+        model.bucket_start < end,
+    )
+
+
+def sales(db: Session, restaurant_id: int, granularity: str, start: datetime, end: datetime):
+    sharding.use_restaurant(db, restaurant_id)
+    columns = ("order_count", "paid_count", "cancelled_count", "revenue")
+    buckets: Dict[datetime, Dict] = defaultdict(lambda: dict.fromkeys(columns, 0))
+    for model in (models.RestaurantSalesRollup, models.RestaurantSalesDelta):
+        for row in db.execute(
+            select(model.bucket_start, *(func.sum(getattr(model, c)).label(c) for c in columns))
+            .where(*_in_window(model, restaurant_id, granularity, start, end))
+            .group_by(model.bucket_start)
+        ):
+            totals = buckets[row.bucket_start]
+            for column in columns:
+                totals[column] += row._mapping[column]
+    return [
+        {
+            "bucket_start": bucket.isoformat(),
+            "order_count": int(totals["order_count"]),
+            "paid_count": int(totals["paid_count"]),
+            "cancelled_count": int(totals["cancelled_count"]),
+            "revenue": round(float(totals["revenue"]), 2),
+        }
+        for bucket, totals in sorted(buckets.items())
+    ]
+
+
+def top_items(db: Session, restaurant_id: int, granularity: str, start: datetime, end: datetime, limit: int = 10):
+    sharding.use_restaurant(db, restaurant_id)
+    items: Dict[int, Dict] = defaultdict(lambda: {"quantity": 0, "revenue": 0.0})
+    for model in (models.ItemSalesRollup, models.ItemSalesDelta):
+        for row in db.execute(
+            select(model.menu_item_id, func.sum(model.quantity).label("quantity"), func.sum(model.revenue).label("revenue"))
+            .where(*_in_window(model, restaurant_id, granularity, start, end))
+            .group_by(model.menu_item_id)
+        ):
+            items[row.menu_item_id]["quantity"] += row.quantity
+            items[row.menu_item_id]["revenue"] += row.revenue
+    top = sorted(
+        ((menu_item_id, totals) for menu_item_id, totals in items.items() if totals["quantity"] > 0),
+        key=lambda entry: entry[1]["quantity"], reverse=True,
+    )[:limit]
+    # Menu items may be on another database than the rollups (sharding.py), so no join
+    names = dict(db.execute(
+        select(models.MenuItem.id, models.MenuItem.name).where(models.MenuItem.id.in_([menu_item_id for menu_item_id, _ in top]))
+    ).all()) if top else {}
+    return [
+        {
+            "menu_item_id": menu_item_id,
+            "name": names.get(menu_item_id) or "Unknown Item",
+            "quantity": int(totals["quantity"]),
+            "revenue": round(float(totals["revenue"]), 2),
+        }
+        for menu_item_id, totals in top
+    ]
+
+
+def backfill(db: Session, since: Optional[datetime] = None, batch_size: int = 5000) -> int:
+    """Rebuild the rollups from orders (created at or after ``since``, a day start); returns orders read.
+
+    Works on the selected order shard; the backfill script runs it once per shard.
+
+    The rollup rows and pending deltas for the period are deleted first, then
+    the orders are streamed and aggregated in memory, all in one transaction.
+    On Postgres it runs at REPEATABLE READ, so a checkout committing meanwhile
+    is neither read nor has its delta deleted, and a fold committing meanwhile
+    fails the backfill with a serialization error (run it again). SQLite holds
+    the write lock from the first delete, so nothing commits in between.
+    """
+    if since is not None and since != bucket_start(since, "day"):
+        raise ValueError("since must be the start of a day")
+
+    order_bind = {"mapper": models.Order.__mapper__}
+    if db.get_bind(**order_bind).dialect.name == "postgresql":
+        db.connection(bind_arguments=order_bind, execution_options={"isolation_level": "REPEATABLE READ"})
+    for model in (models.RestaurantSalesRollup, models.ItemSalesRollup,
+                  models.RestaurantSalesDelta, models.ItemSalesDelta):
+        stmt = delete(model)
+        if since is not None:
+            stmt = stmt.where(model.bucket_start >= since)
+        db.execute(stmt)
+
+    restaurant_totals: Dict[tuple, Dict] = defaultdict(
+        lambda: {"order_count": 0, "paid_count": 0, "cancelled_count": 0, "revenue": 0.0}
+    )
+    item_totals: Dict[tuple, Dict] = defaultdict(lambda: {"quantity": 0, "revenue": 0.0})
+
+    paid_orders = select(models.Payment.order_id).where(models.Payment.status.in_(PAID_PAYMENT_STATUSES))
+    query = (
+        select(models.Order.id, models.Order.restaurant_id, models.Order.created_at,
+               models.Order.status, models.Order.total, models.Order.id.in_(paid_orders).label("paid"))
+        .where(models.Order.restaurant_id.is_not(None), models.Order.created_at.is_not(None))
+        .order_by(models.Order.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if since is not None:
+        query = query.where(models.Order.created_at >= since)
+
+    orders_read = 0
+    for order in db.execute(query):
+        orders_read += 1
+        is_cancelled = order.status == "cancelled"
+        for granularity in GRANULARITIES:
+            key = (order.restaurant_id, granularity, bucket_start(order.created_at, granularity))
+            totals = restaurant_totals[key]
+            if is_cancelled:
+                totals["cancelled_count"] += 1
+            else:
+                totals["order_count"] += 1
+                totals["revenue"] += float(order.total or 0.0)
+            if order.paid:
+                totals["paid_count"] += 1
+
+    item_query = (
+        select(models.OrderItem.menu_item_id, models.OrderItem.quantity,
+               models.OrderItem.price, models.Order.restaurant_id, models.Order.created_at)
+        .join(models.OrderItem.order)
+        .where(models.Order.restaurant_id.is_not(None), models.Order.created_at.is_not(None),
+               models.Order.status != "cancelled", models.OrderItem.menu_item_id.is_not(None))
+        .execution_options(yield_per=batch_size)
+    )
+    if since is not None:
+        item_query = item_query.where(models.Order.created_at >= since)
+    for item in db.execute(item_query):
+        for granularity in GRANULARITIES:
+            key = (item.restaurant_id, granularity, bucket_start(item.created_at, granularity), item.menu_item_id)
+            totals = item_totals[key]
+            totals["quantity"] += item.quantity
+            totals["revenue"] += float(item.price) * item.quantity
+
+    restaurant_rows = [dict(zip(RESTAURANT_KEYS, key), **totals) for key, totals in restaurant_totals.items()]
+    item_rows = [dict(zip(ITEM_KEYS, key), **totals) for key, totals in item_totals.items()]
+    for start in range(0, len(restaurant_rows), batch_size):
+        db.execute(models.RestaurantSalesRollup.__table__.insert(), restaurant_rows[start:start + batch_size])
+    for start in range(0, len(item_rows), batch_size):
+        db.execute(models.ItemSalesRollup.__table__.insert(), item_rows[start:start + batch_size])
+    db.commit()
+    return orders_read
@@ -1,7 +1,8 @@
 # BE/schemas.py
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, computed_field
+from BE import thumbnails
 
 class UserBase(BaseModel):
     username: str
@@ -30,7 +31,14 @@ class MenuItemCreate(MenuItemBase):
 class MenuItem(MenuItemBase):
     id: int
     restaurant_id: int
-    
+    image_hash: Optional[str] = Field(None, exclude=True)
+
+    @computed_field
+    @property
+    def thumbnails(self) -> Optional[Dict[str, str]]:
+        """Resized WebP (with srcset) and JPEG versions of image_url, once generated."""
+        return thumbnails.urls(self.image_hash)
+
     class Config:
         from_attributes = True
 
@@ -65,16 +73,31 @@ class OrderUpdate(BaseModel):
     status: Optional[str] = None
     delivery_address: Optional[str] = None
     special_instructions: Optional[str] = None
+    version: Optional[int] = None  # The version last read; a newer one is a conflict (409)
 
 class Order(OrderBase):
     id: int
     order_date: datetime
     status: str
     items: Optional[List[OrderItem]] = None
+    version: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+class OrderHistoryItem(BaseModel):
+    order_id: int
+    restaurant_id: Optional[int] = None
+    restaurant: str
+    status: str
+    total: float
+    item_count: int
+    created_at: datetime
+
+class OrderHistoryPage(BaseModel):
+    orders: List[OrderHistoryItem]
+    next_cursor: Optional[str] = None
+
 class RestaurantBase(BaseModel):
     name: str
     address: str
@@ -86,7 +109,14 @@ class RestaurantCreate(RestaurantBase):
 class Restaurant(RestaurantBase):
     id: int
     is_active: bool
-    
+    image_hash: Optional[str] = Field(None, exclude=True)
+
+    @computed_field
+    @property
+    def thumbnails(self) -> Optional[Dict[str, str]]:
+        """Resized WebP (with srcset) and JPEG versions of image_url, once generated."""
+        return thumbnails.urls(self.image_hash)
+
     class Config:
         from_attributes = True
 
@@ -103,6 +133,7 @@ class Payment(PaymentBase):
     id: int
     payment_date: datetime
     status: str
+    version: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -123,6 +154,20 @@ class Delivery(DeliveryBase):
     class Config:
         from_attributes = True
 
+class OrderQueueEntry(BaseModel):
+    order_id: int
+    status: str
+    active: bool  # False once the order leaves the queue (delivered, cancelled, ...)
+    total: float
+    item_count: Optional[int] = None
+    created_at: Optional[str] = None
+
+class OrderQueuePage(BaseModel):
+    cursor: str
+    reset: bool  # True: ``orders`` is the whole queue and replaces the client's copy
+    orders: List[OrderQueueEntry]
+    changes: List[OrderQueueEntry]  # orders that joined the queue since the cursor
+
 # Response Models for Chat API
 class ChatResponseBase(BaseModel):
     type: str
@@ -139,8 +184,17 @@ class MenuDisplayResponse(ChatResponseBase):
     categories: List[Dict[str, Any]]
 
 class CartUpdateResponse(ChatResponseBase):
+    item: Dict[str, Any]  # the changed item with its new quantity (0 once removed)
+    cart_total: float
+    item_count: int
+    cart_reset: bool = False  # the item replaced another restaurant's cart
+    cart_items: Optional[List[Dict[str, Any]]] = None  # the whole cart, sent when cart_reset
+
+class CartResponse(ChatResponseBase):
+    restaurant_id: Optional[int] = None
     cart_items: List[Dict[str, Any]]
     cart_total: float
+    item_count: int
 
 class OrderDetailsResponse(ChatResponseBase):
     order: Dict[str, Any]
@@ -0,0 +1 @@
+# Maintenance commands, run as modules, e.g. `python -m BE.scripts.backfill_rollups`
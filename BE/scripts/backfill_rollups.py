@@ -0,0 +1,30 @@
+# BE/scripts/backfill_rollups.py
+"""Rebuild the sales rollup tables from the orders history.
+
+    python -m BE.scripts.backfill_rollups                    # everything
+    python -m BE.scripts.backfill_rollups --since 2024-03-01 # from that day on
+"""
+import argparse
+from datetime import datetime
+
+from BE import rollups, sharding
+from BE.database import SessionLocal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="only rebuild buckets from this day (YYYY-MM-DD) on")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    count = 0
+    with SessionLocal() as db:
+        # Each shard holds the orders and rollups of its own restaurants
+        for _ in sharding.each_shard(db):
+            count += rollups.backfill(db, since=args.since, batch_size=args.batch_size)
+    print(f"Rebuilt sales rollups from {count} orders")
+
+
+if __name__ == "__main__":
+    main()
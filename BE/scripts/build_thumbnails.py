@@ -0,0 +1,28 @@
+# BE/scripts/build_thumbnails.py
+"""Generate thumbnails for restaurant and menu images that don't have any yet.
+
+    python -m BE.scripts.build_thumbnails [--workers N] [--force]
+
+Run after adding or changing images. API workers serve the new thumbnail URLs
+once they see the catalog version move (CATALOG_VERSION_CHECK_SECONDS).
+POST /admin/thumbnails starts the same build inside an API worker.
+"""
+import argparse
+
+from BE import thumbnails
+from BE.database import SessionLocal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-hash images that already have thumbnails")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        result = thumbnails.build(db, workers=args.workers, force=args.force)
+    print(f"Generated thumbnails for {result['images']} images ({result['rows']} rows), {result['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
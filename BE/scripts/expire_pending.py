@@ -0,0 +1,21 @@
+# BE/scripts/expire_pending.py
+"""Cancel abandoned pending orders and expire abandoned online payments once.
+
+    python -m BE.scripts.expire_pending
+
+The API does this every EXPIRY_INTERVAL_SECONDS; run this from cron instead
+when the scheduler is off (EXPIRY_INTERVAL_SECONDS=0).
+"""
+import argparse
+
+from BE import expiry
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    totals = expiry.run_once()
+    print(f"Expired {totals['orders']} orders and {totals['payments']} payments")
+
+
+if __name__ == "__main__":
+    main()
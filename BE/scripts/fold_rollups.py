@@ -0,0 +1,19 @@
+"""Fold the pending sales deltas into the analytics rollups once.
+
+    python -m BE.scripts.fold_rollups
+
+The API does this every ROLLUP_FOLD_INTERVAL_SECONDS; run this from cron
+instead when the scheduler is off (ROLLUP_FOLD_INTERVAL_SECONDS=0).
+"""
+import argparse
+
+from BE import rollups
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    print(f"Folded {rollups.fold_all()} sales deltas")
+
+
+if __name__ == "__main__":
+    main()
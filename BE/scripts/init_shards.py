@@ -0,0 +1,25 @@
+# BE/scripts/init_shards.py
+"""Create the order tables on every shard in ORDER_SHARD_URLS.
+
+    python -m BE.scripts.init_shards
+
+Run once per new shard, before it takes traffic (see BE/sharding.py).
+"""
+import argparse
+
+from BE import sharding
+from BE.database import shard_engines
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    if not shard_engines:
+        print("ORDER_SHARD_URLS is not set, nothing to do")
+        return
+    for shard, engine in enumerate(shard_engines):
+        sharding.init_shard(shard)
+        print(f"Shard {shard}: {engine.url.render_as_string(hide_password=True)}")
+
+
+if __name__ == "__main__":
+    main()
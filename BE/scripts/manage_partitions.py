@@ -0,0 +1,37 @@
+# BE/scripts/manage_partitions.py
+"""Maintain the monthly order partitions on Postgres.
+
+    python -m BE.scripts.manage_partitions ensure   # create upcoming months
+    python -m BE.scripts.manage_partitions retain   # archive and drop expired months
+
+Run both daily from cron; the API also runs `ensure` at startup.
+"""
+import argparse
+
+from BE import partitions
+from BE.config import ARCHIVE_DIR, PARTITION_MONTHS_AHEAD, RETENTION_MONTHS
+from BE.database import engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create missing monthly partitions")
+    ensure.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    retain = commands.add_parser("retain", help="archive and drop partitions past retention")
+    retain.add_argument("--keep-months", type=int, default=RETENTION_MONTHS)
+    retain.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        created = partitions.ensure_partitions(engine, args.months_ahead)
+        print(f"Created {len(created)} partitions")
+    else:
+        archived = partitions.archive_old_partitions(engine, args.keep_months, args.archive_dir)
+        for path in archived:
+            print(f"Archived {path}")
+        print(f"Archived {len(archived)} partitions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# BE/scripts/train_intents.py
+"""Train the chat intent classifier and report its accuracy.
+
+    python -m BE.scripts.train_intents            # train, evaluate, save
+    python -m BE.scripts.train_intents --eval     # evaluate the saved model
+
+Every 5th example of each intent in the labeled set is held out; the model is
+trained on the rest (softmax regression, full-batch gradient descent) and
+saved to INTENT_MODEL_DIR with its held-out accuracy.
+"""
+import argparse
+import os
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from BE.config import INTENT_MODEL_DIR
+from BE.intents import IntentModel, _softmax, features
+
+
+def load_examples(path):
+    train, holdout = [], []
+    seen = Counter()
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, text = line.rstrip("\n").split("\t", 1)
+            seen[label] += 1
+            (holdout if seen[label] % 5 == 0 else train).append((text, label))
+    return train, holdout
+
+
+def design_matrix(texts, n_features, ngrams):
+    x = np.zeros((len(texts), n_features + 1), dtype=np.float32)
+    for i, text in enumerate(texts):
+        rows = features(text, n_features, ngrams)
+        x[i, list(rows)] = 1.0 / np.sqrt(len(rows))
+    return x
+
+
+def train(examples, labels, n_features, ngrams, epochs, learning_rate, l2):
+    x = design_matrix([text for text, _ in examples], n_features, ngrams)
+    y = np.zeros((len(examples), len(labels)), dtype=np.float32)
+    y[np.arange(len(examples)), [labels.index(label) for _, label in examples]] = 1.0
+    weights = np.zeros((n_features + 1, len(labels)), dtype=np.float32)
+    for _ in range(epochs):
+        grad = x.T @ (_softmax(x @ weights) - y) / len(examples) + l2 * weights
+        weights -= learning_rate * grad
+    return IntentModel(weights, labels, n_features, ngrams)
+
+
+def evaluate(model, examples):
+    predicted = model.predict_batch([text for text, _ in examples])
+    errors = [(text, label, guess) for (text, label), (guess, _) in zip(examples, predicted) if guess != label]
+    per_label = defaultdict(lambda: [0, 0])
+    for (_, label), (guess, _) in zip(examples, predicted):
+        per_label[label][0] += guess == label
+        per_label[label][1] += 1
+    return 1 - len(errors) / len(examples), per_label, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(INTENT_MODEL_DIR, "labeled.tsv"))
+    parser.add_argument("--out", default=INTENT_MODEL_DIR)
+    parser.add_argument("--eval", action="store_true", help="only evaluate the saved model")
+    parser.add_argument("--features", type=int, default=2 ** 14, help="hashed feature rows")
+    parser.add_argument("--epochs", type=int, default=2000)
+    parser.add_argument("--learning-rate", type=float, default=20.0)
+    parser.add_argument("--l2", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    train_set, holdout = load_examples(args.data)
+    if args.eval:
+        model = IntentModel.load(args.out)
+    else:
+        labels = sorted({label for _, label in train_set})
+        model = train(train_set, labels, args.features, (2, 4), args.epochs, args.learning_rate, args.l2)
+
+    accuracy, per_label, errors = evaluate(model, holdout)
+    print(f"Held-out accuracy: {accuracy:.1%} on {len(holdout)} examples ({len(train_set)} for training)")
+    for label, (right, total) in sorted(per_label.items()):
+        print(f"  {label:<18} {right}/{total}")
+    for text, label, guess in errors:
+        print(f"  miss: {text!r} is {label}, predicted {guess}")
+
+    if not args.eval:
+        model.save(args.out, holdout_accuracy=round(accuracy, 4), examples=len(train_set))
+        print(f"Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# BE/serialization.py
+import json
+from typing import Any, List, Optional, Dict
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+from BE import schemas, thumbnails
+from BE.config import FAST_JSON
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+# Precompiled adapters for the hot response schemas. Building a TypeAdapter
+# compiles the pydantic-core validator/serializer once instead of per request.
+RestaurantAdapter = TypeAdapter(schemas.Restaurant)
+RestaurantListAdapter = TypeAdapter(List[schemas.Restaurant])
+MenuItemListAdapter = TypeAdapter(List[schemas.MenuItem])
+OrderAdapter = TypeAdapter(schemas.Order)
+OrderListAdapter = TypeAdapter(List[schemas.Order])
+OrderHistoryPageAdapter = TypeAdapter(schemas.OrderHistoryPage)
+
+DefaultResponse = ORJSONResponse if FAST_JSON and orjson is not None else JSONResponse
+
+
+def dumps(data: Any) -> bytes:
+    """Encode already JSON-shaped data (dicts, lists, str/int/float/None)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def render(adapter: TypeAdapter, data: Any, *, trusted: bool = False) -> bytes:
+    """Serialize ``data`` to JSON bytes, bypassing FastAPI's jsonable_encoder.
+
+    ORM objects are validated against the adapter's schema (``from_attributes``)
+    and dumped by pydantic-core. Pass ``trusted=True`` for plain dicts built
+    from our own queries to skip validation entirely.
+    """
+    if trusted:
+        return dumps(data)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def json_response(adapter: TypeAdapter, data: Any, *, trusted: bool = False,
+                  status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Wrap :func:`render` in a response."""
+    body = render(adapter, data, trusted=trusted)
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+# Listing payloads built straight from crud's column projections
+# (crud.RESTAURANT_LIST_COLUMNS / MENU_ITEM_LIST_COLUMNS). They match what the
+# adapters above produce for schemas.Restaurant / schemas.MenuItem, so they can
+# be rendered with ``trusted=True`` and skip pydantic validation per row.
+def restaurants_payload(rows) -> List[Dict[str, Any]]:
+    urls = thumbnails.urls
+    return [
+        {"name": name, "address": address, "image_url": image_url, "id": id_,
+         "is_active": is_active, "thumbnails": urls(image_hash)}
+        for id_, name, address, _cuisine, image_url, image_hash, is_active in rows
+    ]
+
+
+def menu_items_payload(rows) -> List[Dict[str, Any]]:
+    urls = thumbnails.urls
+    return [
+        {"name": name, "description": description, "price": price, "category": category,
+         "image_url": image_url, "id": id_, "restaurant_id": restaurant_id, "thumbnails": urls(image_hash)}
+        for id_, restaurant_id, name, description, price, category, image_url, image_hash in rows
+    ]
@@ -0,0 +1,157 @@
+# BE/sharding.py
+"""Optional sharding of the order tables by restaurant.
+
+With ORDER_SHARD_URLS set, a restaurant's orders, order items, payments,
+deliveries and sales rollups live in that restaurant's shard database, while
+users, restaurants and menus stay on the primary. A restaurant's shard is
+pinned in ORDER_SHARD_MAP or else stored in ``restaurants.order_shard``, which
+is set to ``restaurant_id % shard count`` the first time the restaurant's
+orders are touched. Adding a shard to ORDER_SHARD_URLS therefore only spreads
+new restaurants over it; existing ones stay where their orders are.
+
+Order and payment IDs encode their shard as ``id % MAX_SHARDS``, so a lookup
+by ID reads exactly one shard. On Postgres shards the ID sequences step by
+MAX_SHARDS; other databases (SQLite, for local testing) draw IDs from a
+counter row in ``shard_id_counters``. ``init_shard`` sets either up.
+
+crud selects the shard on the session (``use_restaurant``, ``use_id``) before
+touching those tables and database.RoutingSession sends their statements
+there. Without ORDER_SHARD_URLS all of this is a no-op.
+"""
+import threading
+from typing import Dict, Iterator, Optional
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, inspect, insert, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+from BE.base import Base
+from BE.config import ORDER_SHARD_MAP
+from BE.database import SHARDED_TABLES, engine as primary_engine, shard_engines
+
+# IDs are ``n * MAX_SHARDS + shard``, so shards can be added up to MAX_SHARDS
+# without renumbering existing orders
+MAX_SHARDS = 64
+# Tables whose IDs are looked up directly and so encode the shard
+ID_TABLES = ("orders", "payments")
+
+counters = Table(
+    "shard_id_counters", MetaData(),
+    Column("name", String, primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+if len(shard_engines) > MAX_SHARDS:
+    raise ValueError(f"At most {MAX_SHARDS} order shards are supported")
+if shard_engines and any(not 0 <= shard < len(shard_engines) for shard in ORDER_SHARD_MAP.values()):
+    raise ValueError("ORDER_SHARD_MAP refers to a shard not in ORDER_SHARD_URLS")
+
+# restaurants.order_shard, cached per process: a restaurant's shard never changes
+_stored_shards: Dict[int, int] = {}
+_stored_shards_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(shard_engines)
+
+
+def shard_for_restaurant(restaurant_id: Optional[int]) -> int:
+    if restaurant_id is None:
+        return 0
+    shard = ORDER_SHARD_MAP.get(restaurant_id)
+    if shard is not None:
+        return shard
+    shard = _stored_shards.get(restaurant_id)
+    if shard is None:
+        with _stored_shards_lock:
+            shard = _stored_shards.get(restaurant_id)
+            if shard is None:
+                shard = _stored_shard(restaurant_id)
+    return shard
+
+
+def _stored_shard(restaurant_id: int) -> int:
+    """The restaurant's ``order_shard``, storing ``restaurant_id % shard count`` on first use."""
+    restaurants = Base.metadata.tables["restaurants"]
+    # Its own transaction on the primary: the caller's session may be mid-way through one
+    with primary_engine.begin() as conn:
+        conn.execute(
+            update(restaurants)
+            .where(restaurants.c.id == restaurant_id, restaurants.c.order_shard.is_(None))
+            .values(order_shard=restaurant_id % len(shard_engines))
+        )
+        shard = conn.scalar(select(restaurants.c.order_shard).where(restaurants.c.id == restaurant_id))
+    if shard is None:
+        # No such restaurant, so no orders to find; not cached in case it's created later
+        return restaurant_id % len(shard_engines)
+    if not 0 <= shard < len(shard_engines):
+        raise ValueError(f"Restaurant {restaurant_id} is on order shard {shard}, which is not in ORDER_SHARD_URLS")
+    _stored_shards[restaurant_id] = shard
+    return shard
+
+
+def shard_for_id(record_id: int) -> int:
+    shard = record_id % MAX_SHARDS
+    # No such shard, so no such row: look on shard 0, which won't have it either
+    return shard if shard < len(shard_engines) else 0
+
+
+def use_restaurant(db: Session, restaurant_id: Optional[int]):
+    """Send this session's order-table statements to the restaurant's shard."""
+    if shard_engines:
+        db.info["shard"] = shard_for_restaurant(restaurant_id)
+
+
+def use_id(db: Session, record_id: int):
+    """Send this session's order-table statements to the shard of an order or payment ID."""
+    if shard_engines:
+        db.info["shard"] = shard_for_id(record_id)
+
+
+def each_shard(db: Session) -> Iterator[int]:
+    """Select every shard in turn, for reads that span restaurants (just once without shards)."""
+    if not shard_engines:
+        yield 0
+        return
+    for shard in range(len(shard_engines)):
+        db.info["shard"] = shard
+        yield shard
+
+
+def next_id(db: Session, table: str) -> Optional[int]:
+    """ID for a new row of ``table`` on the selected shard, or None to let the database assign it."""
+    if not shard_engines or shard_engines[db.info["shard"]].dialect.name == "postgresql":
+        return None
+    # The UPDATE holds the counter row until commit; SQLite serializes writers anyway
+    return db.execute(
+        update(counters)
+        .where(counters.c.name == table)
+        .values(value=counters.c.value + MAX_SHARDS)
+        .returning(counters.c.value)
+    ).scalar_one()
+
+
+def init_shard(shard: int):
+    """Create the order tables on a shard and make its new IDs encode the shard.
+
+    Safe to run again, but before the shard takes traffic: the Postgres
+    sequences restart just above the highest existing ID.
+    """
+    engine = shard_engines[shard]
+    tables = [table for name, table in Base.metadata.tables.items() if name in SHARDED_TABLES]
+    with engine.begin() as conn:
+        existing = set(inspect(conn).get_table_names())
+        for table in tables + [counters]:
+            if table.name in existing:
+                continue
+            # Users, restaurants and menu items are on the primary: no foreign keys to them
+            local_fks = [fk for fk in table.foreign_key_constraints if fk.referred_table.name in SHARDED_TABLES]
+            conn.execute(CreateTable(table, include_foreign_key_constraints=local_fks))
+            for index in table.indexes:
+                conn.execute(CreateIndex(index))
+
+        for name in ID_TABLES:
+            highest = conn.scalar(select(func.max(Base.metadata.tables[name].c.id))) or 0
+            start = (highest // MAX_SHARDS + 1) * MAX_SHARDS + shard
+            if engine.dialect.name == "postgresql":
+                conn.execute(text(f"ALTER SEQUENCE {name}_id_seq INCREMENT BY {MAX_SHARDS} RESTART WITH {start}"))
+            elif conn.scalar(select(counters.c.value).where(counters.c.name == name)) is None:
+                conn.execute(insert(counters).values(name=name, value=start - MAX_SHARDS))
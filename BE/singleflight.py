@@ -0,0 +1,104 @@
+# BE/singleflight.py
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from BE import database, metrics
+
+metrics.describe("singleflight_queries_total", "Coalesced reads that ran their own query")
+metrics.describe("singleflight_shared_total", "Coalesced reads served from another request's in-flight query")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("singleflight_shared_total", kind=key[0] if isinstance(key, tuple) else key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+flights = SingleFlight()
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def coalesced_query(db: Session, key: Hashable, query: Callable[[Session], Any], merge: bool = True) -> Any:
+    """Run ``query`` once for all concurrent callers with the same ``key``.
+
+    The query runs in a short-lived session of its own and its detached rows
+    are merged into each caller's session without further SQL, so callers get
+    ordinary ORM objects (``None``, one entity or a list, like ``query``).
+    Pass ``merge=False`` for column projections: their rows are immutable
+    tuples and every caller gets the same list.
+
+    Only sync handlers (FastAPI's threadpool) whose session holds no
+    connection yet join a flight. On the event loop a waiter would block
+    every other request. A caller already holding a pooled connection could
+    starve the pool the leader needs. Those callers, and sessions that must
+    read from the primary (see database.needs_primary), query directly.
+    """
+    if database.needs_primary(db) or db.in_transaction() or _on_event_loop():
+        return query(db)
+
+    def load():
+        metrics.inc("singleflight_queries_total", kind=key[0] if isinstance(key, tuple) else key)
+        with database.SessionLocal() as shared:
+            shared.info["replica_depth"] = 1
+            if "shard" in db.info:
+                # Same key, same shard (see sharding.py)
+                shared.info["shard"] = db.info["shard"]
+            result = query(shared)
+            shared.expunge_all()
+        return result
+
+    shared_result = flights.do(key, load)
+    if shared_result is None or not merge:
+        return shared_result
+    rows = shared_result if isinstance(shared_result, list) else [shared_result]
+    if any(identity_key(instance=row) in db.identity_map for row in rows):
+        # Merging would overwrite the caller's own copies, changes and all; a
+        # query leaves them as they are, like any query in that session
+        return query(db)
+    merged = [db.merge(row, load=False) for row in rows]
+    return merged if isinstance(shared_result, list) else merged[0]
@@ -0,0 +1,175 @@
+# BE/slowlog.py
+"""Slow-query log fed by SQLAlchemy engine events.
+
+Every statement slower than SLOW_QUERY_MS is logged and kept in a ring buffer
+with its duration, the shape (not the values) of its parameters and where it
+came from: the HTTP route and, for /chat, the conversation state. A sample of
+slow SELECTs is re-run under ``EXPLAIN (ANALYZE, BUFFERS)`` on a background
+thread (Postgres only) and the plan is attached to the entry. The buffer is
+served at /admin/slow-queries.
+"""
+import contextvars
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from BE import metrics
+from BE.config import SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+metrics.describe("slow_queries_total", "Statements slower than SLOW_QUERY_MS")
+metrics.describe("slow_query_explains_total", "Slow statements re-run under EXPLAIN ANALYZE")
+
+MAX_STATEMENT_LENGTH = 4000
+_SELECT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+# Re-running these would take row locks again
+_LOCKING = re.compile(r"\bFOR\s+(UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+
+# Where the current statement comes from; set per request by SlowQueryContextMiddleware
+_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("slow_query_context", default=None)
+
+_entries: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+_explain_queue: "queue.Queue" = queue.Queue(maxsize=16)
+_explain_worker: Optional[threading.Thread] = None
+
+
+def annotate(**info):
+    """Attach details (e.g. ``chat_state``) to slow queries of the current request."""
+    context = _context.get()
+    if context is not None:
+        context.update(info)
+
+
+def _origin() -> Dict[str, Any]:
+    context = _context.get()
+    if context is None:
+        return {}
+    origin = {k: v for k, v in context.items() if k != "scope"}
+    # The router fills in the endpoint on the same scope once the route is matched
+    endpoint = context["scope"].get("endpoint")
+    if endpoint is not None:
+        origin["endpoint"] = getattr(endpoint, "__name__", str(endpoint))
+    return origin
+
+
+def _shape(parameters) -> Any:
+    """Parameter types without their values, which may be personal data."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one shape plus the batch size
+            return {"rows": len(parameters), "row": _shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slowlog_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _check_duration(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["slowlog_started"].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms < SLOW_QUERY_MS or conn.info.get("slowlog_explaining"):
+        return
+
+    entry = {
+        "at": datetime.utcnow().isoformat(),
+        "duration_ms": round(elapsed_ms, 2),
+        "statement": statement[:MAX_STATEMENT_LENGTH],
+        "parameters": _shape(parameters),
+        "executemany": executemany,
+        "database": conn.engine.url.render_as_string(hide_password=True),
+        "origin": _origin(),
+        "plan": None,
+    }
+    with _lock:
+        _entries.append(entry)
+    metrics.inc("slow_queries_total")
+    logger.warning("Slow query (%.1f ms) from %s: %s", elapsed_ms, entry["origin"] or "-", entry["statement"][:200])
+
+    if (
+        conn.dialect.name == "postgresql"
+        and not executemany
+        and _SELECT.match(statement)
+        and not _LOCKING.search(statement)
+        and random.random() < SLOW_QUERY_EXPLAIN_RATE
+    ):
+        _schedule_explain(conn.engine, statement, parameters, entry)
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_timer(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("slowlog_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def _schedule_explain(engine: Engine, statement: str, parameters, entry: Dict[str, Any]):
+    global _explain_worker
+    try:
+        # Plans are best effort: when the worker is behind, skip rather than queue up
+        _explain_queue.put_nowait((engine, statement, parameters, entry))
+    except queue.Full:
+        return
+    with _lock:
+        if _explain_worker is None or not _explain_worker.is_alive():
+            _explain_worker = threading.Thread(target=_explain_loop, name="slowlog-explain", daemon=True)
+            _explain_worker.start()
+
+
+def _explain_loop():
+    while True:
+        engine, statement, parameters, entry = _explain_queue.get()
+        try:
+            # Off the request path, on its own connection, and only ever for SELECTs:
+            # ANALYZE runs the statement again
+            with engine.connect() as conn:
+                conn.info["slowlog_explaining"] = True
+                try:
+                    rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).all()
+                finally:
+                    conn.info.pop("slowlog_explaining", None)
+                    conn.rollback()
+            entry["plan"] = "\n".join(row[0] for row in rows)
+            metrics.inc("slow_query_explains_total")
+        except Exception as e:
+            entry["plan"] = f"EXPLAIN failed: {e}"
+            logger.exception("EXPLAIN of slow query failed")
+
+
+def recent(limit: int = 50) -> List[Dict[str, Any]]:
+    """The latest slow queries, newest first."""
+    with _lock:
+        entries = list(_entries)
+    return entries[::-1][:limit]
+
+
+class SlowQueryContextMiddleware:
+    """Record which request is running so slow queries can name their origin."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _context.set({"scope": scope, "method": scope["method"], "path": scope["path"]})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _context.reset(token)
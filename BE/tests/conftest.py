@@ -0,0 +1,53 @@
+# BE/tests/conftest.py
+"""The tests run the API in embedded mode, on a throwaway SQLite file."""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="chatnchow-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["EXPIRY_INTERVAL_SECONDS"] = "0"
+os.environ["ROLLUP_FOLD_INTERVAL_SECONDS"] = "0"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["THUMBNAIL_DIR"] = os.path.join(_tmp, "thumbnails")
+
+import pytest
+from BE import crud, database, models, schemas
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables with one user, one restaurant and five menu items."""
+    models.Base.metadata.drop_all(database.engine)
+    models.Base.metadata.create_all(database.engine)
+    session = database.SessionLocal()
+    session.add(models.User(id=1, username="alice", email="alice@example.com"))
+    session.add(models.Restaurant(id=1, name="Thai Corner", address="1 Main St", cuisine="Thai"))
+    for i in range(1, 6):
+        session.add(models.MenuItem(id=i, name=f"Dish {i}", description="", price=i * 1.5, category="Main", restaurant_id=1))
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_order(db):
+    """Places an order for user 1: ``make_order(2, 1)`` is two of menu item 1 and one of item 2.
+
+    ``menu_item_id`` is the first item (each priced at id * 1.5, as on the menu);
+    other keywords, e.g. ``delivery_address``, go into the OrderCreate.
+    """
+    def make(*quantities, restaurant_id=1, menu_item_id=1, **fields):
+        return crud.create_order(db, schemas.OrderCreate(
+            user_id=1, restaurant_id=restaurant_id, total_amount=0,
+            items=[schemas.OrderItemCreate(menu_item_id=menu_item_id + i, quantity=quantity, price=(menu_item_id + i) * 1.5)
+                   for i, quantity in enumerate(quantities or (1,))],
+            **fields,
+        ))
+    return make
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from BE.main import app
+    return TestClient(app)
@@ -0,0 +1,14 @@
+from BE import main
+
+
+def test_admin_endpoints_are_closed_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.get("/admin/slow-queries").status_code == 403
+    assert client.get("/admin/slow-queries", headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_admin_endpoints_need_the_matching_token(client, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/admin/slow-queries").status_code == 403
+    assert client.get("/admin/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/slow-queries", headers={"X-Admin-Token": "s3cret"}).status_code == 200
@@ -0,0 +1,39 @@
+from sqlalchemy import update
+from BE import catalog, database, models
+
+
+def test_etag_survives_a_restart(client):
+    first = client.get("/restaurants/")
+    assert first.status_code == 200
+    # A new worker process starts with no cached version
+    catalog._tag = ""
+    catalog._version = None
+    catalog._checked_at = float("-inf")
+    again = client.get("/restaurants/", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_write_through_this_worker_changes_the_etag(client, db):
+    before = client.get("/restaurants/1").headers["etag"]
+    db.get(models.Restaurant, 1).name = "Thai Corner II"
+    db.commit()
+    after = client.get("/restaurants/1", headers={"If-None-Match": before})
+    assert after.status_code == 200
+    assert after.json()["name"] == "Thai Corner II"
+
+
+def test_write_by_another_worker_is_seen(client):
+    before = client.get("/restaurants/").headers["etag"]
+    # Another worker commits a catalog write: only the shared row changes here
+    with database.engine.begin() as conn:
+        conn.execute(update(models.Restaurant.__table__).values(name="Renamed"))
+        conn.execute(update(models.CatalogVersion.__table__).values(version=models.CatalogVersion.version + 1))
+    catalog.refresh(force=True)
+    after = client.get("/restaurants/", headers={"If-None-Match": before})
+    assert after.status_code == 200
+    assert after.json()[0]["name"] == "Renamed"
+
+
+def test_no_304_for_a_missing_restaurant(client):
+    tag = client.get("/restaurants/1").headers["etag"]
+    assert client.get("/restaurants/99", headers={"If-None-Match": tag}).status_code == 404
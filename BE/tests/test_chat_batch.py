@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from BE import crud, database, main
+
+
+def _prefetched(monkeypatch):
+    calls = []
+    real = crud.prefetch
+    monkeypatch.setattr(crud, "prefetch", lambda db, **ids: calls.append(ids) or real(db, **ids))
+    return calls
+
+
+def _session(state="default", last_response=""):
+    return {"state": state, "current_order_id": None, "last_restaurant_id": None,
+            "last_menu_item_id": None, "last_response": last_response}
+
+
+def test_numeric_replies_are_prefetched_as_what_they_refer_to(client, monkeypatch):
+    calls = _prefetched(monkeypatch)
+    monkeypatch.setitem(main.user_sessions, "menu", _session(last_response="Menu for Thai Corner"))
+    monkeypatch.setitem(main.user_sessions, "cancel", _session("cancellation_flow"))
+    monkeypatch.setitem(main.user_sessions, "paying", _session("awaiting_payment"))
+
+    response = client.post("/chat/batch", json={"messages": [
+        {"user_id": "menu", "message": "3"},
+        {"user_id": "cancel", "message": "42"},
+        {"user_id": "paying", "message": "2"},
+    ]})
+
+    assert response.status_code == 200
+    assert calls == [{"order_ids": {42}, "restaurant_ids": set(), "menu_item_ids": {3}}]
+    assert [r["user_id"] for r in response.json()["responses"]] == ["menu", "cancel", "paying"]
+
+
+def test_rows_are_loaded_again_in_one_go_after_a_write(client, db, monkeypatch, make_order):
+    orders = [make_order(menu_item_id=i).id for i in range(1, 5)]
+    monkeypatch.setitem(main.user_sessions, "paying", {**_session("payment_initiated"), "current_order_id": orders[0]})
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(database.engine, "before_cursor_execute", listener)
+    try:
+        response = client.post("/chat/batch", json={"messages": [
+            {"user_id": "paying", "message": "1"},
+            *({"user_id": f"tracking{i}", "message": "track my order", "order_id": order_id} for i, order_id in enumerate(orders[1:])),
+        ]})
+    finally:
+        event.remove(database.engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    cancelled, *tracked = response.json()["responses"]
+    assert cancelled["state"] == "default" and all("Status: pending" in r["response"] for r in tracked)
+    after_cancel = statements[next(i for i, s in enumerate(statements) if s.startswith("UPDATE orders")):]
+    # One prefetch for the three tracked orders, rather than reloading each expired row on use
+    assert sum(s.startswith("SELECT orders.") for s in after_cancel) == 1
+    assert sum(s.startswith("SELECT") and "FROM users" not in s for s in after_cancel) == 7
@@ -0,0 +1,39 @@
+from collections import Counter
+from BE import models
+from BE.main import app
+
+
+def test_chat_router_is_mounted_without_clashing_routes():
+    paths = {route.path for route in app.routes}
+    assert {"/chat", "/chat/batch", "/chat/select-menu-item", "/chat/cart/{user_id}", "/chat/checkout"} <= paths
+    routes = Counter((method, route.path) for route in app.routes for method in getattr(route, "methods", None) or ())
+    assert [route for route, count in routes.items() if count > 1] == []
+
+
+def test_removing_another_restaurants_item_keeps_the_cart(client, db):
+    db.add(models.Restaurant(id=2, name="Pizza Place", address="2 Main St", cuisine="Italian"))
+    db.add(models.MenuItem(id=6, name="Margherita", description="", price=9.0, category="Main", restaurant_id=2))
+    db.commit()
+
+    client.post("/chat/select-menu-item", json={"user_id": 7, "item_id": 1, "quantity": 2})
+    removed = client.post("/chat/select-menu-item", json={"user_id": 7, "item_id": 6, "quantity": -1}).json()
+
+    assert removed["type"] == "error"
+    cart = client.get("/chat/cart/7").json()
+    assert cart["restaurant_id"] == 1
+    assert cart["cart_items"] == [{"menu_item_id": 1, "name": "Dish 1", "price": 1.5, "quantity": 2}]
+
+
+def test_adding_another_restaurants_item_replaces_the_cart(client, db):
+    db.add(models.Restaurant(id=2, name="Pizza Place", address="2 Main St", cuisine="Italian"))
+    db.add(models.MenuItem(id=6, name="Margherita", description="", price=9.0, category="Main", restaurant_id=2))
+    db.commit()
+
+    first = client.post("/chat/select-menu-item", json={"user_id": 8, "item_id": 1, "quantity": 2}).json()
+    assert first["cart_reset"] is False and "cart_items" not in first
+    switched = client.post("/chat/select-menu-item", json={"user_id": 8, "item_id": 6, "quantity": 1}).json()
+
+    assert switched["cart_reset"] is True
+    assert switched["cart_items"] == [{"menu_item_id": 6, "name": "Margherita", "price": 9.0, "quantity": 1}]
+    assert (switched["cart_total"], switched["item_count"]) == (9.0, 1)
+    assert client.get("/chat/cart/8").json()["cart_items"] == switched["cart_items"]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from BE import crud, expiry, models, order_queue, rollups, schemas
+
+
+def _pay(db, order, method):
+    return crud.create_payment(db, schemas.PaymentCreate(order_id=order.id, amount=1.5, method=method))
+
+
+def _age(db, model, column, ids, minutes):
+    db.execute(update(model).where(model.id.in_(ids)).values({column: datetime.utcnow() - timedelta(minutes=minutes)}))
+    db.commit()
+
+
+def _statuses(db, model, ids):
+    db.expire_all()
+    return [db.get(model, record_id).status for record_id in ids]
+
+
+def test_stale_orders_and_online_payments_expire_but_cod_waits(db, make_order):
+    stale, fresh, paying, cod = (make_order().id for _ in range(4))
+    _age(db, models.Order, "created_at", [stale, paying, cod], expiry.PENDING_ORDER_TTL_MINUTES + 1)
+    online_payment = _pay(db, db.get(models.Order, paying), "online").id
+    cod_payment = _pay(db, db.get(models.Order, cod), "cod").id
+    _age(db, models.Payment, "payment_date", [online_payment, cod_payment], expiry.PENDING_PAYMENT_TTL_MINUTES + 1)
+    seq = order_queue.hub.seq(1)
+
+    assert expiry.run_once() == {"orders": 1, "payments": 1}
+
+    assert _statuses(db, models.Order, [stale, fresh, paying, cod]) == ["cancelled", "pending", "cancelled", "confirmed"]
+    assert _statuses(db, models.Payment, [online_payment, cod_payment]) == ["expired", "pending"]
+    # Both cancellations reach the dashboard and wake the kitchen queue's pollers
+    now = datetime.utcnow()
+    sales = rollups.sales(db, 1, "day", now - timedelta(days=1), now + timedelta(days=1))
+    assert [(b["order_count"], b["cancelled_count"]) for b in sales] == [(2, 2)]
+    assert order_queue.hub.seq(1) == seq + 2
+    assert expiry.run_once() == {"orders": 0, "payments": 0}
+
+
+def test_each_run_is_bounded(db, monkeypatch, make_order):
+    ids = [make_order().id for _ in range(5)]
+    _age(db, models.Order, "created_at", ids, 1)
+    monkeypatch.setattr(expiry, "EXPIRY_BATCH_SIZE", 2)
+    monkeypatch.setattr(expiry, "EXPIRY_MAX_BATCHES", 2)
+
+    assert expiry._drain(db, expiry.expire_orders, datetime.utcnow()) == 4
+    assert _statuses(db, models.Order, ids).count("pending") == 1
+    assert expiry._drain(db, expiry.expire_orders, datetime.utcnow()) == 1
+    assert expiry._drain(db, expiry.expire_orders, datetime.utcnow()) == 0
@@ -0,0 +1,64 @@
+import os
+import pytest
+from BE import crud, intents, main
+from BE.config import INTENT_MODEL_DIR
+from BE.scripts import train_intents
+
+
+def test_messages_get_their_intent_and_bare_numbers_none():
+    assert [intents.classify(text) for text in ("new order", "track my order", "cancel it", "pay by cash", "talk to a human")] == [
+        "new_order", "track_order", "cancel_order", "cash_on_delivery", "talk_to_agent",
+    ]
+    # Menu choices and IDs, whatever the model makes of them
+    assert intents.classify("1") is None and intents.classify(" 42 ") is None
+
+
+def test_batch_predictions_match_single_ones():
+    texts = ["new order", "where is my food", "cancel it", "1", "", "upi"]
+    model = intents.model()
+    batch = model.predict_batch(texts)
+
+    assert [label for label, _ in batch] == [model.predict(text)[0] for text in texts]
+    assert [confidence for _, confidence in batch] == pytest.approx([model.predict(text)[1] for text in texts], abs=1e-5)
+    assert intents.classify_batch(texts) == [intents.classify(text) for text in texts]
+    assert model.predict_batch([]) == []
+
+
+def test_saved_model_keeps_its_accuracy_on_the_labeled_set():
+    train, holdout = train_intents.load_examples(os.path.join(INTENT_MODEL_DIR, "labeled.tsv"))
+
+    assert train_intents.evaluate(intents.model(), train)[0] >= 0.95
+    assert train_intents.evaluate(intents.model(), holdout)[0] >= 0.8
+
+
+def _paying(make_order, monkeypatch):
+    order = make_order()
+    monkeypatch.setitem(main.user_sessions, "u", {
+        "state": "payment_initiated", "current_order_id": order.id, "last_restaurant_id": None,
+        "last_menu_item_id": None, "last_response": "",
+    })
+    return order.id
+
+
+def _chat(client, text):
+    return client.post("/chat", json={"user_id": "u", "messages": [{"role": "user", "content": text}]}).json()
+
+
+def test_a_classified_cancel_asks_for_confirmation(client, db, monkeypatch, make_order):
+    order_id = _paying(make_order, monkeypatch)
+
+    assert _chat(client, "please cancel my order")["state"] == "cancellation_flow"
+    db.expire_all()
+    assert crud.get_order(db, order_id).status == "pending"
+
+    assert _chat(client, str(order_id))["state"] == "post_cancellation"
+    db.expire_all()
+    assert crud.get_order(db, order_id).status == "cancelled"
+
+
+def test_the_cancel_option_cancels_at_once(client, db, monkeypatch, make_order):
+    order_id = _paying(make_order, monkeypatch)
+
+    assert _chat(client, "1")["state"] == "default"
+    db.expire_all()
+    assert crud.get_order(db, order_id).status == "cancelled"
@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import update
+from BE import models
+
+
+def test_pages_walk_legacy_orders_with_the_backfilled_date(client, db, make_order):
+    ids = [make_order().id for _ in range(3)]
+    # Rows from before created_at was required carry the migrations' sentinel
+    db.execute(update(models.Order).where(models.Order.id.in_(ids[:2])).values(created_at=datetime(1970, 1, 1)))
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = client.get("/users/1/orders", params={"limit": 1, **({"cursor": cursor} if cursor else {})}).json()
+        seen += [order["order_id"] for order in page["orders"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [ids[2], ids[1], ids[0]]
@@ -0,0 +1,93 @@
+import threading
+import time
+from sqlalchemy import update
+from BE import crud, database, models, order_queue, schemas
+
+
+def _queue(client, **params):
+    response = client.get("/restaurants/1/queue", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def _ids(page):
+    return [o["order_id"] for o in page["orders"]]
+
+
+def test_new_orders_come_as_changes_and_others_as_a_reset(client, db, make_order):
+    first = make_order()
+    page = _queue(client)
+    assert page["reset"] and _ids(page) == [first.id]
+
+    second = make_order()
+    changes = _queue(client, cursor=page["cursor"], wait=0)
+    assert not changes["reset"]
+    assert [(c["order_id"], c["status"], c["active"]) for c in changes["changes"]] == [(second.id, "pending", True)]
+    assert _queue(client, cursor=changes["cursor"], wait=0)["changes"] == []
+
+    crud.update_order(db, first.id, schemas.OrderUpdate(status="preparing"))
+    page = _queue(client, cursor=changes["cursor"], wait=0)
+    assert page["reset"] and [(o["order_id"], o["status"]) for o in page["orders"]] == [(first.id, "preparing"), (second.id, "pending")]
+
+
+def test_cursor_stays_short_for_a_long_queue(client, db, make_order):
+    for _ in range(50):
+        make_order()
+    assert len(_queue(client)["cursor"]) < 40
+
+
+def test_cursor_from_one_worker_works_on_another(client, db, monkeypatch, make_order):
+    first, second = make_order(), make_order()
+    page = _queue(client)
+    assert page["reset"] and _ids(page) == [first.id, second.id]
+
+    # Another worker: its own hub, which never saw these orders
+    monkeypatch.setattr(order_queue, "hub", order_queue.QueueHub())
+    crud.update_order(db, second.id, schemas.OrderUpdate(status="delivered"))
+
+    page = _queue(client, cursor=page["cursor"], wait=0)
+    assert page["reset"] and _ids(page) == [first.id]
+    unchanged = _queue(client, cursor=page["cursor"], wait=0)
+    assert not unchanged["reset"] and unchanged["changes"] == []
+
+
+def test_waiting_poll_sees_a_change_committed_by_another_process(client, db, monkeypatch, make_order):
+    monkeypatch.setattr(order_queue, "ORDER_QUEUE_RECHECK_SECONDS", 0.1)
+    order = make_order()
+    cursor = _queue(client)["cursor"]
+
+    def other_process():
+        # Straight to the database: nothing in this process is told
+        time.sleep(0.3)
+        with database.engine.begin() as conn:
+            conn.execute(update(models.Order).where(models.Order.id == order.id)
+                         .values(status="preparing", version=models.Order.version + 1))
+
+    writer = threading.Thread(target=other_process)
+    writer.start()
+    started = time.monotonic()
+    page = _queue(client, cursor=cursor, wait=10)
+    writer.join()
+
+    assert time.monotonic() - started < 5
+    assert page["reset"] and [(o["order_id"], o["status"]) for o in page["orders"]] == [(order.id, "preparing")]
+
+
+def test_waiting_poll_is_woken_by_a_commit_on_this_worker(client, db, monkeypatch, make_order):
+    monkeypatch.setattr(order_queue, "ORDER_QUEUE_RECHECK_SECONDS", 30)
+    order = make_order()
+    cursor = _queue(client)["cursor"]
+
+    def cancel():
+        time.sleep(0.3)
+        with database.SessionLocal() as other:
+            crud.update_order(other, order.id, schemas.OrderUpdate(status="cancelled"))
+
+    writer = threading.Thread(target=cancel)
+    writer.start()
+    started = time.monotonic()
+    page = _queue(client, cursor=cursor, wait=10)
+    writer.join()
+
+    assert time.monotonic() - started < 5
+    assert page["reset"] and page["orders"] == []
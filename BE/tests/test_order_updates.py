@@ -0,0 +1,74 @@
+import sqlite3
+from contextlib import contextmanager
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from BE import crud, database, hello, main, models, schemas
+
+
+def test_address_and_instructions_are_written_with_a_version_check(db, make_order):
+    order = make_order(delivery_address="1 Main St")
+    assert (order.delivery_address, order.version) == ("1 Main St", 1)
+
+    crud.update_order(db, order.id, schemas.OrderUpdate(delivery_address="2 Side St", version=1))
+    crud.update_order(db, order.id, schemas.OrderUpdate(special_instructions="No peanuts"))
+    db.expire_all()
+    order = crud.get_order(db, order.id)
+    assert (order.delivery_address, order.special_instructions, order.status, order.version) == ("2 Side St", "No peanuts", "pending", 3)
+
+    # Written against a version someone else has since moved on from
+    with pytest.raises(crud.ConcurrentUpdateError):
+        crud.update_order(db, order.id, schemas.OrderUpdate(delivery_address="3 Back St", version=2))
+    db.expire_all()
+    assert crud.get_order(db, order.id).delivery_address == "2 Side St"
+
+
+def test_stale_version_gets_409(db, make_order):
+    order = make_order()
+    crud.update_order(db, order.id, schemas.OrderUpdate(status="confirmed"))
+
+    response = TestClient(hello.app).put(f"/orders/{order.id}/update", json={"special_instructions": "Ring twice", "version": 1})
+
+    assert response.status_code == 409
+    db.expire_all()
+    assert crud.get_order(db, order.id).special_instructions is None
+
+
+
+@contextmanager
+def _write_locked():
+    """Another connection holds SQLite's write lock; the app's connections give up on it at once."""
+    def no_wait(dbapi_connection, connection_record, connection_proxy):
+        dbapi_connection.execute("PRAGMA busy_timeout=0")
+
+    event.listen(database.engine, "checkout", no_wait)
+    other = sqlite3.connect(database.engine.url.database)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    finally:
+        other.rollback()
+        other.close()
+        event.remove(database.engine, "checkout", no_wait)
+        database.engine.dispose()
+
+
+def test_write_lock_timeout_gets_409(db, make_order):
+    order_id = make_order().id
+    db.close()
+
+    with _write_locked():
+        assert TestClient(main.app).post(f"/cancel_order/{order_id}").status_code == 409
+        assert TestClient(hello.app).put(f"/orders/{order_id}/update", json={"status": "confirmed"}).status_code == 409
+
+
+def test_cancelled_order_takes_no_payment(db, make_order):
+    order = make_order()
+    crud.cancel_order(db, order.id)
+
+    with pytest.raises(crud.OrderNotPayableError):
+        crud.create_payment(db, schemas.PaymentCreate(order_id=order.id, amount=1.5, method="online"))
+
+    db.expire_all()
+    assert crud.get_order(db, order.id).status == "cancelled"
+    assert db.query(models.Payment).count() == 0
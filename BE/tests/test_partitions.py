@@ -0,0 +1,72 @@
+"""Order partitioning is Postgres only: set TEST_POSTGRES_URL to run the partition tests."""
+import os
+import subprocess
+import sys
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from BE import partitions
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+SCHEMA = "partitions_test"
+
+
+@pytest.fixture
+def pg():
+    """A schema with bare partitioned order tables that only have default partitions."""
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(POSTGRES_URL, connect_args={"options": f"-csearch_path={SCHEMA}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(
+            "CREATE TABLE orders (id serial, created_at timestamp NOT NULL, PRIMARY KEY (id, created_at)) "
+            "PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("CREATE TABLE orders_default PARTITION OF orders DEFAULT"))
+        for table in ("order_items", "payments", "deliveries"):
+            conn.execute(text(
+                f"CREATE TABLE {table} (id serial, order_id integer NOT NULL, order_created_at timestamp NOT NULL, "
+                f"PRIMARY KEY (id, order_created_at), FOREIGN KEY (order_id, order_created_at) "
+                f"REFERENCES orders (id, created_at) ON DELETE CASCADE) PARTITION BY RANGE (order_created_at)"
+            ))
+            conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    yield engine
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def test_ensure_partitions_moves_rows_out_of_the_default_partition(pg):
+    now = datetime.utcnow()
+    with pg.begin() as conn:
+        conn.execute(text("INSERT INTO orders (id, created_at) VALUES (1, :now)"), {"now": now})
+        for table in ("order_items", "payments", "deliveries"):
+            conn.execute(text(f"INSERT INTO {table} (order_id, order_created_at) VALUES (1, :now)"), {"now": now})
+
+    created = partitions.ensure_partitions(pg, months_ahead=1)
+
+    assert f"orders_p{now:%Y%m}" in created
+    with pg.begin() as conn:
+        for table in partitions.PARTITIONED_TABLES:
+            assert conn.scalar(text(f"SELECT count(*) FROM {table}_p{now:%Y%m}")) == 1
+            assert conn.scalar(text(f"SELECT count(*) FROM {table}_default")) == 0
+        # The foreign keys are back: deleting the order still removes its rows
+        conn.execute(text("DELETE FROM orders WHERE id = 1"))
+        for table in ("order_items", "payments", "deliveries"):
+            assert conn.scalar(text(f"SELECT count(*) FROM {table}")) == 0
+
+
+def test_models_key_order_tables_by_partition_key_on_postgres():
+    ddl = subprocess.run(
+        [sys.executable, "-c",
+         "from sqlalchemy.dialects import postgresql; from sqlalchemy.schema import CreateTable; from BE import models; "
+         "print(CreateTable(models.Order.__table__).compile(dialect=postgresql.dialect())); "
+         "print(CreateTable(models.Payment.__table__).compile(dialect=postgresql.dialect()))"],
+        env={**os.environ, "DATABASE_URL": "postgresql://localhost/unused"},
+        capture_output=True, text=True, check=True,
+    ).stdout
+    assert "PRIMARY KEY (id, created_at)" in ddl
+    assert "PRIMARY KEY (id, order_created_at)" in ddl
+    assert "FOREIGN KEY(order_id, order_created_at) REFERENCES orders (id, created_at) ON DELETE CASCADE" in ddl
@@ -0,0 +1,19 @@
+from BE import qrtoken
+
+
+def test_tokens_round_trip_for_their_own_order():
+    token = qrtoken.issue(42, 12.5, "Thai Corner")
+    assert qrtoken.verify(token, 42) == {"order_id": 42, "amount": 12.5, "restaurant": "Thai Corner"}
+    assert qrtoken.verify(token, 43) is None
+
+
+def test_malformed_tokens_are_rejected_not_errors():
+    token = qrtoken.issue(42, 12.5, "Thai Corner")
+    payload, _, signature = token.partition(".")
+    for bad in (f"{payload}.{signature[:-1]}é", "é.é", "…", f"{payload}.", "abc"):
+        assert qrtoken.verify(bad, 42) is None
+
+
+def test_non_ascii_query_tokens_get_the_database_path(client, db):
+    # Order 999 doesn't exist: a rejected token falls back to the database and 404s
+    assert client.get("/get_qr_code/999", params={"token": "x.é"}).status_code == 404
@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from BE import ratelimit
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "backend", ratelimit.MemoryBackend())
+    app = FastAPI()
+
+    @app.post("/write", dependencies=[Depends(ratelimit.rate_limit("write", rate=0.001, burst=2, ip_rate=0.001, ip_burst=5))])
+    def write(body: dict):
+        return {}
+
+    return TestClient(app)
+
+
+def test_user_bucket(limited):
+    codes = [limited.post("/write", json={"user_id": 1}).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    # Another user behind the same IP still has its own budget
+    assert limited.post("/write", json={"user_id": 2}).status_code == 200
+
+
+def test_changing_user_id_does_not_escape_the_ip_bucket(limited):
+    codes = [limited.post("/write", json={"user_id": n}).status_code for n in range(7)]
+    assert codes == [200] * 5 + [429] * 2
+
+
+def test_throttled_request_takes_no_tokens():
+    backend = ratelimit.MemoryBackend()
+    ip, user = ("ip", 1.0, 2.0, 1.0), ("user", 1.0, 1.0, 1.0)
+    assert asyncio.run(backend.take([ip, user], 0.0)) == (True, 0.0)
+    allowed, wait = asyncio.run(backend.take([ip, user], 0.0))
+    assert not allowed and wait == pytest.approx(1.0)
+    # The IP bucket kept its token for a request from someone else
+    assert asyncio.run(backend.take([ip], 0.0))[0]
+
+
+@pytest.fixture
+def batched(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "backend", ratelimit.MemoryBackend())
+    app = FastAPI()
+    costs = lambda body: Counter(str(m["user_id"]) for m in body["messages"])  # noqa: E731
+
+    @app.post("/batch", dependencies=[Depends(ratelimit.rate_limit("batch", rate=0.001, burst=2, ip_rate=0.001, ip_burst=5, costs=costs))])
+    def batch(body: dict):
+        return {}
+
+    return TestClient(app)
+
+
+def test_batches_are_charged_per_message(batched):
+    messages = lambda *users: {"messages": [{"user_id": u} for u in users]}  # noqa: E731
+    assert batched.post("/batch", json=messages(1, 2, 3)).status_code == 200
+    # Three tokens left the IP bucket, so a batch of three no longer fits
+    assert batched.post("/batch", json=messages(4, 5, 6)).status_code == 429
+    assert batched.post("/batch", json=messages(4, 5)).status_code == 200
+
+
+def test_batch_larger_than_the_bucket_is_rejected(batched):
+    response = batched.post("/batch", json={"messages": [{"user_id": n} for n in range(6)]})
+    assert response.status_code == 413
+    # Three messages from one user is more than their bucket holds
+    response = batched.post("/batch", json={"messages": [{"user_id": 1}] * 3})
+    assert response.status_code == 413
@@ -0,0 +1,43 @@
+import pytest
+from BE import database, models
+
+
+@pytest.fixture
+def lagging_replica(monkeypatch, tmp_path):
+    """A replica that hasn't caught up: same schema, no rows."""
+    replica = database._create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    models.Base.metadata.create_all(replica)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    database._sticky_until.clear()
+    yield replica
+    database._sticky_until.clear()
+
+
+def test_reads_go_to_the_replica_without_a_recent_write(client, db, lagging_replica, make_order):
+    make_order(2)
+    assert client.get("/users/1/orders").json()["orders"] == []
+
+
+def test_write_then_read_stays_on_the_primary(client, db, lagging_replica, make_order):
+    order_id = make_order(2).id
+    response = client.post(f"/cancel_order/{order_id}")
+    assert response.status_code == 200
+    assert database.STICKY_COOKIE in response.cookies
+    orders = client.get("/users/1/orders").json()["orders"]
+    assert [o["status"] for o in orders] == ["cancelled"]
+
+
+def test_cookie_keeps_reads_on_the_primary_on_another_worker(client, db, lagging_replica, make_order):
+    order_id = make_order(2).id
+    client.post(f"/cancel_order/{order_id}")
+    # Another worker has no record of this client's write, only the cookie
+    database._sticky_until.clear()
+    assert len(client.get("/users/1/orders").json()["orders"]) == 1
+    client.cookies.clear()
+    assert client.get("/users/1/orders").json()["orders"] == []
+
+
+def test_forged_cookie_far_in_the_future_is_ignored(client, db, lagging_replica, make_order):
+    make_order(2)
+    client.cookies.set(database.STICKY_COOKIE, "99999999999")
+    assert client.get("/users/1/orders").json()["orders"] == []
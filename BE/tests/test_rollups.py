@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from BE import crud, models, rollups, schemas
+
+
+def _window():
+    now = datetime.utcnow()
+    return now - timedelta(days=1), now + timedelta(days=1)
+
+
+def _dashboard(db):
+    return (rollups.sales(db, 1, "day", *_window()), rollups.top_items(db, 1, "day", *_window()))
+
+
+def _pending(db):
+    return sum(db.scalar(select(func.count()).select_from(model)) for model in (models.RestaurantSalesDelta, models.ItemSalesDelta))
+
+
+def test_checkouts_append_deltas_that_dashboards_see_before_and_after_the_fold(db, make_order):
+    make_order(2, 1)
+    cancelled = make_order(1)
+    crud.update_order(db, cancelled.id, schemas.OrderUpdate(status="cancelled"))
+
+    assert db.scalar(select(func.count()).select_from(models.RestaurantSalesRollup)) == 0
+    sales, items = _dashboard(db)
+    assert [(b["order_count"], b["cancelled_count"], b["revenue"]) for b in sales] == [(1, 1, 6.0)]
+    assert [(i["name"], i["quantity"], i["revenue"]) for i in items] == [("Dish 1", 2, 3.0), ("Dish 2", 1, 3.0)]
+
+    pending = _pending(db)
+    assert pending == 14  # hour and day rows for three events, items included
+    assert rollups.fold(db) == pending
+    assert _pending(db) == 0
+    assert _dashboard(db) == (sales, items)
+
+
+def test_fold_adds_onto_existing_rollups_without_an_upsert(db, monkeypatch, make_order):
+    make_order(1)
+    rollups.fold(db)
+    monkeypatch.setattr(rollups, "_upsert_for", lambda dialect: None)
+    make_order(3)
+    rollups.fold(db)
+
+    sales, items = _dashboard(db)
+    assert [(b["order_count"], b["revenue"]) for b in sales] == [(2, 6.0)]
+    assert [(i["quantity"], i["revenue"]) for i in items] == [(4, 6.0)]
+
+
+def _pay(db, order, status="completed"):
+    payment = crud.create_payment(db, schemas.PaymentCreate(order_id=order.id, amount=1.5, method="online"))
+    return crud.update_payment_status(db, payment.id, status)
+
+
+def test_backfill_counts_paid_orders_like_checkouts_do(db, make_order):
+    paid_twice, late = make_order(1), make_order(2)
+    _pay(db, paid_twice)
+    crud.update_payment_status(db, crud.create_payment(
+        db, schemas.PaymentCreate(order_id=make_order(1).id, amount=1.5, method="online")).id, "failed")
+    # A second payment for an order that is already paid (and now preparing)
+    second = models.Payment(order_id=paid_twice.id, order_created_at=paid_twice.created_at, amount=1.5, status="pending")
+    db.add(second)
+    db.commit()
+    crud.update_payment_status(db, second.id, "completed")
+    # Paid after the order was cancelled: it doesn't move the order, it is still money taken
+    payment = crud.create_payment(db, schemas.PaymentCreate(order_id=late.id, amount=3.0, method="online"))
+    crud.cancel_order(db, late.id)
+    crud.update_payment_status(db, payment.id, "completed")
+
+    incremental = _dashboard(db)
+    assert [(b["order_count"], b["paid_count"], b["cancelled_count"]) for b in incremental[0]] == [(2, 2, 1)]
+    rollups.backfill(db)
+    assert _dashboard(db) == incremental
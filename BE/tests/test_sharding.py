@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import select
+from BE import crud, database, models, schemas, sharding
+
+
+@pytest.fixture
+def shards(db, tmp_path):
+    """Two SQLite order shards, and a second restaurant with one menu item."""
+    db.add(models.Restaurant(id=2, name="Pizza Place", address="2 Main St", cuisine="Italian"))
+    db.add(models.MenuItem(id=6, name="Margherita", description="", price=9.0, category="Main", restaurant_id=2))
+    db.commit()
+    engines = [database._create_engine(f"sqlite:///{tmp_path / f'shard{i}.db'}") for i in range(2)]
+    database.shard_engines.extend(engines)
+    for shard in range(len(engines)):
+        sharding.init_shard(shard)
+    yield engines
+    database.shard_engines.clear()
+    sharding._stored_shards.clear()
+    db.info.pop("shard", None)
+    for shard_engine in engines:
+        shard_engine.dispose()
+
+
+def _order_ids(shard_engine):
+    with shard_engine.connect() as conn:
+        return set(conn.scalars(select(models.Order.id)))
+
+
+def test_orders_live_on_their_restaurants_shard(db, shards, make_order):
+    first, second = make_order().id, make_order(restaurant_id=2, menu_item_id=6).id
+
+    # restaurant_id % 2, stored on the restaurant
+    assert (first % sharding.MAX_SHARDS, second % sharding.MAX_SHARDS) == (1, 0)
+    assert _order_ids(shards[1]) == {first}
+    assert _order_ids(shards[0]) == {second}
+    assert db.scalars(select(models.Restaurant.order_shard).order_by(models.Restaurant.id)).all() == [1, 0]
+
+    db.expire_all()
+    assert crud.get_order(db, first).restaurant_id == 1
+    assert crud.get_order(db, second).restaurant_id == 2
+
+
+def test_payment_ids_find_their_shard(db, shards, make_order):
+    order = make_order()
+    payment = crud.create_payment(db, schemas.PaymentCreate(order_id=order.id, amount=1.5, method="card"))
+    assert payment.id % sharding.MAX_SHARDS == 1
+
+    # A fresh session, so the payment ID alone has to pick the shard
+    other = database.SessionLocal()
+    try:
+        crud.update_payment_status(other, payment.id, "completed")
+    finally:
+        other.close()
+
+    with shards[1].connect() as conn:
+        assert conn.scalar(select(models.Payment.status).where(models.Payment.id == payment.id)) == "completed"
+        assert conn.scalar(select(models.Order.status).where(models.Order.id == order.id)) == "preparing"
+
+
+def test_user_orders_are_merged_across_shards(db, shards, make_order):
+    ids = [make_order(restaurant_id=restaurant_id, menu_item_id=item).id for restaurant_id, item in ((1, 1), (2, 6), (1, 2))]
+
+    orders, cursor = crud.get_user_orders(db, 1, limit=2)
+    rest, last = crud.get_user_orders(db, 1, limit=2, cursor=cursor)
+
+    assert [o["order_id"] for o in orders + rest] == ids[::-1]
+    assert [o["restaurant"] for o in orders] == ["Thai Corner", "Pizza Place"]
+    assert last is None
+
+
+def test_restaurants_keep_their_shard_when_one_is_added(db, shards, tmp_path, make_order):
+    make_order(restaurant_id=2, menu_item_id=6)
+    database.shard_engines.append(database._create_engine(f"sqlite:///{tmp_path / 'shard2.db'}"))
+    sharding.init_shard(2)
+    sharding._stored_shards.clear()
+
+    # 2 % 3 would be shard 2, but its orders are on shard 0
+    assert make_order(restaurant_id=2, menu_item_id=6).id % sharding.MAX_SHARDS == 0
+    database.shard_engines[2].dispose()
+
+
+def test_order_tables_need_a_shard(shards):
+    session = database.SessionLocal()
+    try:
+        with pytest.raises(database.ShardNotSelectedError):
+            session.query(models.Order).all()
+        # Users and restaurants stay on the primary
+        assert session.query(models.Restaurant).count() == 2
+    finally:
+        session.close()
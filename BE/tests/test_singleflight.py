@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+from BE import database, metrics, models
+from BE.singleflight import coalesced_query
+
+
+def slow_menu(calls):
+    def query(session):
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return session.query(models.MenuItem).filter(models.MenuItem.restaurant_id == 1).all()
+    return query
+
+
+def test_concurrent_sync_callers_share_one_query(db):
+    calls, results = [], []
+
+    def caller():
+        with database.SessionLocal() as session:
+            items = coalesced_query(session, ("menu", 1), slow_menu(calls))
+            results.append((len(items), all(item in session for item in items)))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [(5, True)] * 4
+
+
+def flights_run():
+    return metrics.value("singleflight_queries_total", kind="menu")
+
+
+def test_event_loop_callers_query_directly(db):
+    calls, before = [], flights_run()
+
+    async def handler():
+        with database.SessionLocal() as session:
+            return len(coalesced_query(session, ("menu", 1), slow_menu(calls)))
+
+    assert asyncio.run(handler()) == 5
+    assert len(calls) == 1 and flights_run() == before
+
+
+def test_caller_holding_a_connection_queries_directly(db):
+    calls = []
+    with database.SessionLocal() as session:
+        session.get(models.Restaurant, 1)
+        assert session.in_transaction()
+        before = flights_run()
+        coalesced_query(session, ("menu", 1), slow_menu(calls))
+    assert len(calls) == 1 and flights_run() == before
+
+
+def test_callers_own_copies_are_left_as_a_query_would(db):
+    with database.SessionLocal(expire_on_commit=False) as session:
+        item = session.get(models.MenuItem, 1)
+        session.commit()
+        db.get(models.MenuItem, 1).name = "Renamed elsewhere"
+        db.commit()
+        assert not session.in_transaction()
+        items = coalesced_query(session, ("menu", 1), lambda s: s.query(models.MenuItem).filter(models.MenuItem.restaurant_id == 1).all())
+        assert items[0] is item
+        assert item.name == "Dish 1"
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from BE import main, thumbnails
+
+
+def test_admin_build_runs_in_the_background(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(thumbnails, "build", lambda db, force=False: calls.append(force) or {"images": 0, "failed": 0, "rows": 0})
+    assert client.post("/admin/thumbnails").status_code == 403
+    response = client.post("/admin/thumbnails?force=true", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 202
+    assert response.json() == {"status": "started"}
+    assert calls == [True]
+
+
+def test_fetch_only_reads_local_files_under_the_source_dir(tmp_path, monkeypatch):
+    (tmp_path / "dish.jpg").write_bytes(b"image")
+    secret = tmp_path.parent / "secret.txt"
+    secret.write_bytes(b"secret")
+
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_SOURCE_DIR", None)
+    with pytest.raises(ValueError):
+        thumbnails._fetch(str(tmp_path / "dish.jpg"))
+
+    monkeypatch.setattr(thumbnails, "THUMBNAIL_SOURCE_DIR", str(tmp_path))
+    assert thumbnails._fetch("dish.jpg") == b"image"
+    assert thumbnails._fetch(f"file://{tmp_path / 'dish.jpg'}") == b"image"
+    for url in ("../secret.txt", str(secret), f"file://{secret}", "ftp://example.com/dish.jpg"):
+        with pytest.raises(ValueError):
+            thumbnails._fetch(url)
+
+
+def test_empty_thumbnail_widths_are_rejected_at_startup():
+    env = dict(os.environ, THUMBNAIL_WIDTHS=" , ")
+    result = subprocess.run([sys.executable, "-c", "import BE.config"], env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "THUMBNAIL_WIDTHS" in result.stderr
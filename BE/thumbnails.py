@@ -0,0 +1,179 @@
+# BE/thumbnails.py
+"""Resized WebP/JPEG variants of restaurant and menu images.
+
+``build`` fetches every ``image_url`` that has no thumbnails yet, renders one
+variant per width and format in a process pool, and stores them in
+THUMBNAIL_DIR named after the hash of the source image. The hash is saved in
+``image_hash`` and the catalog schemas turn it into thumbnail URLs. Because a
+file name only ever refers to one image, /thumbnails/ is served with
+immutable cache headers.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from BE import models
+from BE.database import SessionLocal
+from BE.config import THUMBNAIL_DIR, THUMBNAIL_QUALITY, THUMBNAIL_SOURCE_DIR, THUMBNAIL_WIDTHS
+
+logger = logging.getLogger(__name__)
+
+# File extension -> (Pillow format, content type)
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpg": ("JPEG", "image/jpeg")}
+NAME_PATTERN = re.compile(r"^[0-9a-f]{32}-\d+\.(webp|jpg)$")
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+URL_PREFIX = "/thumbnails/"
+
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+
+def variant_name(digest: str, width: int, ext: str) -> str:
+    return f"{digest}-{width}.{ext}"
+
+
+def urls(digest: Optional[str]) -> Optional[Dict[str, str]]:
+    """Thumbnail URLs for the catalog payloads, or None while there are none."""
+    if not digest:
+        return None
+    smallest = min(THUMBNAIL_WIDTHS)
+    return {
+        "thumbnail_url": URL_PREFIX + variant_name(digest, smallest, "webp"),
+        "thumbnail_jpeg_url": URL_PREFIX + variant_name(digest, smallest, "jpg"),
+        "thumbnail_srcset": ", ".join(
+            f"{URL_PREFIX}{variant_name(digest, width, 'webp')} {width}w" for width in THUMBNAIL_WIDTHS
+        ),
+    }
+
+
+def path_for(name: str) -> Optional[str]:
+    """Disk path of a variant, or None for names that aren't ours (no path traversal)."""
+    if not NAME_PATTERN.match(name):
+        return None
+    return os.path.join(THUMBNAIL_DIR, name)
+
+
+def _fetch(image_url: str) -> bytes:
+    """Source image bytes from an http(s) URL, or a file under THUMBNAIL_SOURCE_DIR."""
+    if image_url.startswith(("http://", "https://")):
+        with urllib.request.urlopen(image_url, timeout=30) as response:
+            return response.read(MAX_SOURCE_BYTES)
+    if "://" in image_url and not image_url.startswith("file://"):
+        raise ValueError(f"Unsupported image URL scheme: {image_url}")
+    if not THUMBNAIL_SOURCE_DIR:
+        raise ValueError("Local image paths need THUMBNAIL_SOURCE_DIR")
+    root = os.path.realpath(THUMBNAIL_SOURCE_DIR)
+    path = os.path.realpath(os.path.join(root, image_url.removeprefix("file://")))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Image path outside THUMBNAIL_SOURCE_DIR: {image_url}")
+    with open(path, "rb") as f:
+        return f.read(MAX_SOURCE_BYTES)
+
+
+def render(image_url: str, out_dir: str = THUMBNAIL_DIR) -> str:
+    """Fetch one source image and write all its variants; returns the content hash.
+
+    Runs in a worker process. Variants that already exist are left alone, so
+    images shared by several menu items are only resized once.
+    """
+    from PIL import Image, ImageOps
+
+    source = _fetch(image_url)
+    digest = hashlib.sha256(source).hexdigest()[:32]
+    os.makedirs(out_dir, exist_ok=True)
+    wanted = [
+        (width, ext) for width in THUMBNAIL_WIDTHS for ext in FORMATS
+        if not os.path.exists(os.path.join(out_dir, variant_name(digest, width, ext)))
+    ]
+    if not wanted:
+        return digest
+
+    with Image.open(BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        for width, ext in wanted:
+            variant = image.copy()
+            variant.thumbnail((width, width * 4))  # bound by width, never upscale
+            pil_format = FORMATS[ext][0]
+            if pil_format == "JPEG" and variant.mode != "RGB":
+                # JPEG has no alpha: flatten transparent areas onto white
+                rgba = variant.convert("RGBA")
+                variant = Image.new("RGB", rgba.size, "white")
+                variant.paste(rgba, mask=rgba.getchannel("A"))
+            elif variant.mode not in ("RGB", "RGBA"):
+                variant = variant.convert("RGBA")
+            target = os.path.join(out_dir, variant_name(digest, width, ext))
+            # Write then rename, so a half-written file is never served
+            tmp = f"{target}.{os.getpid()}.tmp"
+            variant.save(tmp, pil_format, quality=THUMBNAIL_QUALITY, optimize=True)
+            os.replace(tmp, target)
+    return digest
+
+
+def build(db: Session, workers: Optional[int] = None, force: bool = False) -> Dict[str, int]:
+    """Generate missing thumbnails for all restaurants and menu items."""
+    rows = []
+    for model in (models.Restaurant, models.MenuItem):
+        query = db.query(model).filter(model.image_url.isnot(None), model.image_url != "")
+        if not force:
+            query = query.filter(model.image_hash.is_(None))
+        rows.extend(query.all())
+
+    by_url: Dict[str, list] = {}
+    for row in rows:
+        by_url.setdefault(row.image_url, []).append(row)
+
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {url: pool.submit(render, url) for url in by_url}
+        for url, future in futures.items():
+            try:
+                digest = future.result()
+            except Exception as e:
+                failed += 1
+                logger.warning("Thumbnail for %s failed: %s", url, e)
+                continue
+            for row in by_url[url]:
+                row.image_hash = digest
+            done += 1
+    # One commit, so the catalog version (and its ETags) moves once
+    db.commit()
+    return {"images": done, "failed": failed, "rows": sum(len(by_url[url]) for url in by_url)}
+
+
+_building = threading.Lock()
+
+
+def build_in_background(force: bool = False) -> bool:
+    """``build`` in its own session, for POST /admin/thumbnails; False if a build is already running here."""
+    if not _building.acquire(blocking=False):
+        return False
+    try:
+        with SessionLocal() as db:
+            result = build(db, force=force)
+        logger.info("Generated thumbnails for %d images (%d rows), %d failed",
+                    result["images"], result["rows"], result["failed"])
+    except Exception:
+        logger.exception("Thumbnail build failed")
+    finally:
+        _building.release()
+    return True
+
+
+def building() -> bool:
+    return _building.locked()
+
+
+def _reset_hash(target, value, oldvalue, initiator):
+    # A new image needs new thumbnails; until then the payload has none
+    if value != oldvalue:
+        target.image_hash = None
+
+
+for _model in (models.Restaurant, models.MenuItem):
+    event.listen(_model.image_url, "set", _reset_hash)